@@ -11,6 +11,7 @@ import time
 from datetime import datetime, timedelta
 import json
 from main import InstagramAIAgent
+from publisher import PublishLag
 from config import *
 
 # Setup cloud-specific logging
@@ -34,18 +35,73 @@ def setup_cloud_logging():
 class CloudAutomation:
     def __init__(self):
         self.agent = InstagramAIAgent()
+        self.prepared = {}  # Slot time -> post prepared ahead of it
+        self.publish_lag = PublishLag()
         self.setup_scheduler()
     
     def setup_scheduler(self):
         """Setup the scheduler with optimal posting times."""
         # Schedule for each optimal posting time
         for time_str in OPTIMAL_POSTING_TIMES:
+            self.schedule_slot(time_str)
+        
+        # Also schedule a backup time in case optimal times are missed
+        self.schedule_slot("21:00")
+        
+        if DRIVE_CLEANUP_ENABLED:
+            schedule.every().day.at(DRIVE_CLEANUP_TIME).do(self.cleanup_drive)
+            logging.info(f"Scheduled Drive cleanup for {DRIVE_CLEANUP_TIME}")
+        
+        if INSIGHTS_ENABLED:
+            schedule.every().day.at(INSIGHTS_COLLECT_TIME).do(self.collect_insights)
+            logging.info(f"Scheduled insights collection for {INSIGHTS_COLLECT_TIME}")
+    
+    def schedule_slot(self, time_str):
+        """Post at `time_str`, preparing everything up to media_publish PREPARE_LEAD_MINUTES earlier."""
+        if not PREPARE_AHEAD_OF_SLOT:
             schedule.every().day.at(time_str).do(self.create_and_upload_video)
             logging.info(f"Scheduled video creation for {time_str}")
+            return
+        prepare_at = (datetime.strptime(time_str, "%H:%M") - timedelta(minutes=PREPARE_LEAD_MINUTES)).strftime("%H:%M")
+        schedule.every().day.at(prepare_at).do(self.prepare_slot, time_str)
+        schedule.every().day.at(time_str).do(self.publish_slot, time_str)
+        logging.info(f"Scheduled post for {time_str} (prepared at {prepare_at})")
+    
+    def prepare_slot(self, time_str):
+        """Render, upload and create the containers for the slot at `time_str`."""
+        try:
+            logging.info(f"🎬 Preparing the {time_str} post at {datetime.now()}")
+            prepared = self.agent.prepare_post(create_containers=True)
+            if prepared:
+                self.prepared[time_str] = prepared
+                ready = "containers ready" if prepared['publisher'] else "containers not ready, will create at the slot"
+                logging.info(f"✅ {time_str} post prepared ({ready})")
+            else:
+                logging.error(f"❌ Preparing the {time_str} post failed, the full pipeline will run at the slot")
+        except Exception as e:
+            logging.error(f"❌ Error preparing the {time_str} post: {e}")
+    
+    def publish_slot(self, time_str):
+        """Publish the prepared post, or run the full pipeline if preparing failed, and record the lag."""
+        slot = datetime.combine(datetime.now().date(), datetime.strptime(time_str, "%H:%M").time()).timestamp()
+        prepared = self.prepared.pop(time_str, None)
+        try:
+            if prepared:
+                success = self.agent.publish_prepared_post(prepared)
+            else:
+                prepared = self.agent.prepare_post()
+                success = bool(prepared) and self.agent.publish_prepared_post(prepared)
+        except Exception as e:
+            logging.error(f"❌ Error publishing the {time_str} post: {e}")
+            return False
         
-        # Also schedule a backup time in case optimal times are missed
-        schedule.every().day.at("21:00").do(self.create_and_upload_video)
-        logging.info("Scheduled backup video creation for 21:00")
+        if not success:
+            logging.error(f"❌ The {time_str} post failed!")
+            return False
+        if self.agent.last_published_at:
+            self.publish_lag.record(slot, self.agent.last_published_at, prepared=bool(prepared['publisher']))
+        self.cleanup_old_files()
+        return True
     
     def create_and_upload_video(self):
         """Create a video and upload it to Google Drive."""
@@ -84,15 +140,35 @@ class CloudAutomation:
         except Exception as e:
             logging.warning(f"Could not cleanup old files: {e}")
     
+    def cleanup_drive(self):
+        """Delete stale videos from Google Drive (batched)."""
+        try:
+            deleted = self.agent.cleanup_drive_videos()
+            logging.info(f"🧹 Drive cleanup removed {deleted} video(s)")
+        except Exception as e:
+            logging.warning(f"Drive cleanup failed: {e}")
+    
+    def collect_insights(self):
+        """Fetch insights for new and recent posts (batched, incremental)."""
+        try:
+            results = self.agent.collect_insights()
+            logging.info(f"📊 Insights collected: {results}")
+        except Exception as e:
+            logging.warning(f"Insights collection failed: {e}")
+    
     def run_continuous(self):
         """Run the scheduler continuously."""
         logging.info("🚀 Starting cloud automation scheduler...")
+        if PREFETCH_NEXT_RUN:
+            self.agent.enable_prefetch()
         logging.info(f"📅 Scheduled times: {', '.join(OPTIMAL_POSTING_TIMES)}")
         
         while True:
             try:
                 schedule.run_pending()
-                time.sleep(60)  # Check every minute
+                # Wake up right when the next job is due, so a slot is published on time
+                idle = schedule.idle_seconds()
+                time.sleep(60 if idle is None else min(60, max(1, idle)))
             except KeyboardInterrupt:
                 logging.info("🛑 Cloud automation stopped by user")
                 break
@@ -110,7 +186,9 @@ class CloudAutomation:
         status = {
             'current_time': datetime.now().isoformat(),
             'next_runs': [],
-            'progress': self.agent.progress_data
+            'progress': self.agent.progress_data,
+            'prepared_slots': sorted(self.prepared),
+            'publish_lag': self.publish_lag.summary()
         }
         
         # Get next scheduled runs
@@ -147,6 +225,11 @@ def main():
             status = automation.get_status()
             print(json.dumps(status, indent=2))
             
+        elif command == "insights":
+            # Collect insights now
+            automation = CloudAutomation()
+            automation.collect_insights()
+            
         elif command == "test":
             # Test the setup
             print("🧪 Testing cloud automation setup...")
@@ -157,7 +240,7 @@ def main():
                 print(f"   - {job.next_run}")
                 
         else:
-            print("❌ Unknown command. Use: run, start, status, or test")
+            print("❌ Unknown command. Use: run, start, status, insights, or test")
             sys.exit(1)
     else:
         # Default: run once
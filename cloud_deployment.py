@@ -26,7 +26,6 @@ class CloudDeployment:
             'google-api-python-client==2.108.0',
             'google-auth-httplib2==0.1.1',
             'google-auth-oauthlib==1.1.0',
-            'pandas==2.1.4',
             'gspread==5.12.0',
             'Pillow==10.1.0',
             'numpy==1.24.3',
@@ -16,6 +16,17 @@ GOOGLE_CREDENTIALS_PATH = 'credentials.json'
 SHEET_NAME = 'Instagram quotes'  # The name of your Google Sheet
 SHEET_WORKSHEET_INDEX = 0       # 0 for the first sheet
 
+# --- QUOTE SOURCE ---
+QUOTE_SOURCE = 'google_sheets'  # 'google_sheets' or 'file' (offline CSV / Parquet / Arrow catalog)
+QUOTE_FILE_PATH = 'sample_quotes.csv'  # Used when QUOTE_SOURCE = 'file'
+
+# --- DUPLICATE QUOTE DETECTION ---
+DEDUP_QUOTES = True  # Skip quotes that are near-duplicates of an earlier quote in the catalog
+DEDUP_SIMILARITY_THRESHOLD = 0.8  # Estimated Jaccard similarity of normalised text shingles
+DEDUP_NUM_PERMUTATIONS = 64  # MinHash signature length
+DEDUP_LSH_BANDS = 16  # LSH bands (must divide DEDUP_NUM_PERMUTATIONS)
+DEDUP_INDEX_FILE = 'quote_dedup_index.npz'  # Index for Google Sheets quotes (file catalogs store it next to the file)
+
 # --- SEQUENTIAL PROCESSING ---
 SEQUENTIAL_MODE = True  # Process quotes and music in order, not randomly
 PROGRESS_FILE = 'progress.json'  # Track which quote/music pair to use next
@@ -28,11 +39,81 @@ UPLOAD_TO_DRIVE = True  # Upload generated videos to Google Drive
 DRIVE_MUSIC_FOLDER_ID = "1JWU8VSgShjnuER9Yq9-A_7KqRA0bDPPQ"
 DRIVE_FOLDER_ID="0ALWlt6PDMm9zUk9PVA"
 
+MUSIC_CATALOG_FILE = 'music_catalog.json'  # Local copy of the Drive music folder listing
+
+# OAuth2 (real user) Drive access used for video uploads
+OAUTH_TOKEN_FILE = 'token.pickle'
+OAUTH_CLIENT_SECRET_FILE = 'client_secret_260892241319-4m6pavuqufep653d9ucvmnt2e6gm95ad.apps.googleusercontent.com.json'
+DRIVE_DISCOVERY_CACHE_FILE = 'drive_v3_discovery.json'  # Drive API description, so build() skips the network
+DRIVE_STATE_FILE = 'drive_state.json'  # Resolved Drive folder ids
+
+# Resumable video uploads
+UPLOAD_STATE_FILE = 'upload_state.json'  # Session URI and byte offset of unfinished uploads
+UPLOAD_INDEX_FILE = 'upload_index.json'  # Uploaded videos by MD5, so identical re-renders are not re-uploaded
+DRIVE_UPLOAD_CHUNK_MB = 32  # Rounded down to a multiple of 256 KiB; larger chunks mean fewer round trips
+DRIVE_UPLOAD_MAX_RETRIES = 8  # Retries per chunk on 429 / 5xx / connection errors
+DRIVE_UPLOAD_BACKOFF_SECONDS = 1  # First retry delay, doubled on each retry (with jitter)
+DRIVE_UPLOAD_MAX_BACKOFF_SECONDS = 60
+# Upload the video while it is being encoded (writes a fragmented MP4; check that your
+# Instagram account accepts fragmented files before enabling)
+STREAM_UPLOAD_WHILE_ENCODING = False
+STREAM_UPLOAD_POLL_SECONDS = 0.5  # How often the uploader checks for newly encoded bytes
+
+# Nightly cleanup of uploaded videos (continuous scheduler only)
+DRIVE_CLEANUP_ENABLED = True
+DRIVE_CLEANUP_TIME = "03:00"
+DRIVE_CLEANUP_AGE_DAYS = 2  # Videos older than this are deleted from the Drive folder
+
+# --- MUSIC CACHE ---
+MUSIC_CACHE_ENABLED = True  # Keep downloaded Drive tracks on disk between runs
+MUSIC_CACHE_DIR = 'music_cache'
+MUSIC_CACHE_MAX_MB = 500  # Least-recently-used tracks are evicted above this size
+
 # --- INSTAGRAM API CONFIGURATION ---
 # Meta Graph API credentials for Instagram posting
 INSTAGRAM_ACCESS_TOKEN = os.environ.get("INSTAGRAM_ACCESS_TOKEN")  # Set this in your environment or GitHub Secrets
 INSTAGRAM_USER_ID = os.environ.get("INSTAGRAM_USER_ID")           # Set this in your environment or GitHub Secrets
 
+# Graph API client (one pooled keep-alive session shared by all Instagram calls)
+GRAPH_API_BASE_URL = os.environ.get("GRAPH_API_BASE_URL", "https://graph.facebook.com")
+GRAPH_API_VERSION = "v19.0"
+GRAPH_API_TIMEOUT = (5, 30)  # (connect, read) seconds for every Graph call
+GRAPH_API_POOL_SIZE = 10  # Kept-alive connections
+
+# Upload the local video straight to Instagram (resumable upload) instead of publishing a Drive URL
+INSTAGRAM_DIRECT_UPLOAD = False
+INSTAGRAM_UPLOAD_BASE_URL = os.environ.get("INSTAGRAM_UPLOAD_BASE_URL", "https://rupload.facebook.com/ig-api-upload")
+INSTAGRAM_UPLOAD_CHUNK_MB = 8
+INSTAGRAM_UPLOAD_MAX_RETRIES = 5  # Per chunk, resuming from the offset Instagram reports
+
+# Long-lived token refresh (fb_exchange_token needs the Meta app id and secret)
+META_APP_ID = os.environ.get("META_APP_ID")
+META_APP_SECRET = os.environ.get("META_APP_SECRET")
+TOKEN_STATE_FILE = 'token_state.json'  # Current tokens and their expiry; a new INSTAGRAM_ACCESS_TOKEN replaces them
+TOKEN_REFRESH_DAYS_BEFORE_EXPIRY = 10
+
+# Successful credential checks are cached so startup does not wait on the Graph API
+CREDENTIAL_CACHE_FILE = 'credential_cache.json'
+CREDENTIAL_CACHE_TTL_HOURS = 12
+
+# Extra accounts that get every post too: "user_id:access_token" pairs separated by commas
+INSTAGRAM_EXTRA_ACCOUNTS = [tuple(pair.strip().split(':', 1))
+                            for pair in os.environ.get("INSTAGRAM_EXTRA_ACCOUNTS", "").split(',') if ':' in pair]
+MULTI_PUBLISH_WORKERS = 8  # Containers created / published at the same time
+MULTI_STATUS_BATCH_SIZE = 50  # Container ids per multi-id status request (Graph allows 50)
+
+# Rate-limit budget from the X-App-Usage / X-Business-Use-Case-Usage headers: above the throttle
+# level, background calls (status polls, insights, validation) are delayed so publishing keeps headroom
+GRAPH_USAGE_THROTTLE_PERCENT = 75
+GRAPH_USAGE_STALE_SECONDS = 300  # Usage readings older than this are ignored
+GRAPH_BACKGROUND_MAX_DELAY_SECONDS = 60
+
+# Media container status polling: starts fast, doubles (with jitter) up to the max interval
+CONTAINER_POLL_INITIAL_SECONDS = 2
+CONTAINER_POLL_MAX_INTERVAL_SECONDS = 30
+CONTAINER_POLL_DEADLINE_SECONDS = 600  # Give up on a container that is still processing after this
+CONTAINER_STATS_FILE = 'container_stats.json'  # Processing times by video size, used to time the first poll
+
 # Instagram posting settings
 ENABLE_INSTAGRAM_POSTING = True  # Set to True to enable auto-posting
 POST_TO_INSTAGRAM = True  # Whether to post videos to Instagram after creation
@@ -64,6 +145,24 @@ AUTHOR_COLOR = 'white'  # Changed from gold to white for better visibility
 AUTHOR_FONT = 'Arial'
 AUTHOR_POSITION_Y = 0.75  # Percentage from top (0.75 = 75% down)
 
+# --- TEXT LAYOUT ---
+TEXT_FONT_PATHS = [
+    "fonts/HelveticaNeue-UltraLight.ttf"  # Only use Helvetica Neue Ultra Light
+]
+MAX_QUOTE_LINES = 10  # Quotes wrapping into more lines are flagged as not fitting
+MAX_AUTHOR_LINES = 2
+PRECOMPUTE_LAYOUTS = True  # Lay out every quote for every preset when quotes are loaded
+SKIP_UNFIT_QUOTES = True  # Don't schedule quotes whose layout does not fit the frame
+LAYOUT_CACHE_FILE = 'layout_cache.json'
+LAYOUT_CACHE_MAX_ENTRIES = 20000  # Per table (layouts, fits, font sizes); raise for catalogs with more quotes x presets
+LAYOUT_CACHE_SAVE_EVERY = 25  # Rewrite layout_cache.json after this many new entries
+
+# Automatic quote font size: the largest size whose wrapped quote fits above the author line
+AUTO_FIT_FONT_SIZE = False  # When False, QUOTE_FONT_SIZE is used for every quote
+AUTO_FIT_MIN_FONT_SIZE = 40
+AUTO_FIT_MAX_FONT_SIZE = 120
+AUTO_FIT_AUTHOR_GAP = 40  # Minimum gap between the quote block and the author line (pixels)
+
 # --- TEXT EFFECTS ---
 TEXT_FADE_IN_DURATION = 1.5  # seconds
 TEXT_FADE_OUT_DURATION = 1.5  # seconds
@@ -95,9 +194,41 @@ OPTIMAL_POSTING_TIMES = [
     "20:00",  # 8 PM
 ]
 
+# --- INSIGHTS ---
+INSIGHTS_ENABLED = True  # Scheduler only: collect reel insights once a day
+INSIGHTS_COLLECT_TIME = "04:00"
+INSIGHTS_DB_FILE = 'insights.db'  # SQLite table of media and their insights
+INSIGHTS_METRICS = ['reach', 'plays', 'saved', 'likes', 'comments', 'shares']
+INSIGHTS_BATCH_SIZE = 50  # Media ids per insights request (Graph allows 50 ids)
+INSIGHTS_REFRESH_DAYS = 7  # Posts younger than this get their numbers refreshed on every run
+
 # --- AUTOMATION SETTINGS ---
 MAX_VIDEOS_TO_KEEP = 10  # Number of recent videos to keep
 AUTOMATION_LOG_DIR = 'logs'
+# Render, upload and create the container ahead of each slot, so only media_publish runs at the slot
+PREPARE_AHEAD_OF_SLOT = False
+PREPARE_LEAD_MINUTES = 30  # Must cover render + upload + Instagram processing
+PUBLISH_LAG_FILE = 'publish_lag.json'  # Seconds between each slot and its post going live
+
+# --- STARTUP ---
+# Per-call timeouts (seconds) for the startup fetches that run concurrently in create_video
+STARTUP_TIMEOUTS = {
+    'quotes': 180,        # Sheet / file fetch plus dedup index and layout precompute
+    'music': 120,         # Music catalog sync plus track download
+    'drive_folder': 60,   # Drive upload folder lookup
+    'tokens': 30,         # Access token expiry check / refresh
+    'instagram': 30,      # Wait for the background Instagram credential check before publishing
+}
+
+# --- PREFETCH ---
+PREFETCH_NEXT_RUN = True  # Scheduler only: prepare the next slot while the current one renders
+PREFETCH_MAX_AGE_MINUTES = 360  # Older prefetched quotes are fetched again
+PREFETCH_JOIN_TIMEOUT_SECONDS = 120  # How long a run waits for an unfinished prefetch
+
+# --- IMPORT-TIME BUDGET ---
+# Checked by import_budget.py; every scheduled run and cloud handler starts a fresh interpreter
+IMPORT_TIME_BUDGET_MS = 400
+IMPORT_BUDGET_MODULES = ['main', 'automation', 'cloud_automation']
 
 # --- LOGGING ---
 LOG_LEVEL = 'INFO'
@@ -127,6 +258,8 @@ def validate_config():
     # Validate font sizes
     if QUOTE_FONT_SIZE <= 0 or AUTHOR_FONT_SIZE <= 0:
         errors.append("Font sizes must be positive numbers")
+    if AUTO_FIT_FONT_SIZE and not 0 < AUTO_FIT_MIN_FONT_SIZE <= AUTO_FIT_MAX_FONT_SIZE:
+        errors.append("Auto-fit font sizes must satisfy 0 < AUTO_FIT_MIN_FONT_SIZE <= AUTO_FIT_MAX_FONT_SIZE")
     
     # Validate Instagram credentials if posting is enabled
     if ENABLE_INSTAGRAM_POSTING:
@@ -0,0 +1,149 @@
+"""
+Instagram credential checks for Instagram AI Agent
+Validation results are cached in a local state file with a TTL (and the token expiry reported
+by debug_token), and the check itself runs in a background thread so building the agent never
+waits on the Graph API; only publishing waits for the result.
+"""
+
+import time
+import logging
+import threading
+from typing import Optional, Dict
+
+from config import CREDENTIAL_CACHE_FILE, CREDENTIAL_CACHE_TTL_HOURS
+from graph_client import GraphClient, GraphAPIError, token_fingerprint
+from graph_usage import URGENT
+from state_store import atomic_write_json, load_json
+
+
+class CredentialCheck:
+    """
+    Cached, background validation of an access token for one Instagram account.
+    Cache entries: {fingerprint:user_id: {'checked_at', 'username', 'expires_at', 'data_access_expires_at', 'scopes'}}.
+    Only successful checks are cached; a failed check is retried on the next run. A transient
+    failure (timeout, 5xx, rate limit) leaves the cached entry alone and falls back to it.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, graph: GraphClient, ig_user_id: str, path: str = None, ttl_hours: float = None):
+        self.graph = graph
+        self.ig_user_id = ig_user_id
+        self.path = path or CREDENTIAL_CACHE_FILE
+        self.ttl = (ttl_hours if ttl_hours is not None else CREDENTIAL_CACHE_TTL_HOURS) * 3600
+        self.result: Optional[bool] = None
+        self._done = threading.Event()
+        self._thread = None
+
+    @property
+    def key(self) -> str:
+        return f"{token_fingerprint(self.graph.access_token)}:{self.ig_user_id}"
+
+    def cached(self) -> Optional[Dict]:
+        """The cached successful check, if it is younger than the TTL and the token has not expired."""
+        return self._fresh(self._entry())
+
+    def _entry(self) -> Optional[Dict]:
+        with self._lock:
+            return load_json(self.path).get(self.key)
+
+    def _fresh(self, entry: Optional[Dict], ttl: Optional[float] = None) -> Optional[Dict]:
+        """`entry` if it is younger than `ttl` (default: the cache TTL) and its token has not expired."""
+        if not entry:
+            return None
+        now = time.time()
+        expires_at = entry.get('expires_at') or 0  # 0 means the token never expires
+        if now - entry.get('checked_at', 0) > (self.ttl if ttl is None else ttl) or (expires_at and expires_at <= now):
+            return None
+        return entry
+
+    def _store(self, entry: Optional[Dict]):
+        with self._lock:
+            cache = load_json(self.path)
+            if entry is None:
+                cache.pop(self.key, None)
+            else:
+                cache[self.key] = entry
+            try:
+                atomic_write_json(self.path, cache)
+            except Exception as e:
+                logging.warning(f"Could not save credential cache: {e}")
+
+    def check(self, fallback: Optional[Dict] = None) -> bool:
+        """
+        Validate against the Graph API now and cache the result. Publishing waits on this
+        check, so it runs at URGENT priority and is never held back by usage pacing.
+        On a transient error the `fallback` entry (an earlier cached success) decides.
+        """
+        try:
+            account = self.graph.get(self.ig_user_id, priority=URGENT, fields='id,username')
+        except GraphAPIError as e:
+            if e.transient:
+                if fallback:
+                    logging.warning(f"Could not reach Instagram to validate credentials ({e}), "
+                                    f"using the cached result for {fallback.get('username') or 'Unknown'}")
+                    return True
+                logging.error(f"❌ Could not validate Instagram credentials (transient error): {e}")
+                return False
+            logging.error(f"❌ Failed to validate Instagram credentials: {e}")
+            self._store(None)
+            return False
+
+        entry = {'checked_at': time.time(), 'username': account.get('username')}
+        try:
+            token = self.graph.get('debug_token', priority=URGENT, input_token=self.graph.access_token).get('data', {})
+            entry.update(expires_at=token.get('expires_at') or 0,
+                         data_access_expires_at=token.get('data_access_expires_at') or 0,
+                         scopes=token.get('scopes', []))
+            if token.get('expires_at'):
+                days_left = (token['expires_at'] - time.time()) / 86400
+                logging.info(f"Instagram access token expires in {days_left:.1f} days")
+        except GraphAPIError as e:
+            logging.warning(f"Could not read access token expiry: {e}")
+
+        self._store(entry)
+        logging.info(f"✅ Instagram API validated for user: {entry.get('username') or 'Unknown'}")
+        return True
+
+    def validate(self) -> bool:
+        """
+        Cached result if fresh, otherwise a live check. If the live check only fails transiently,
+        a cached success is still trusted for up to twice the TTL, unless its token has expired.
+        """
+        entry = self._entry()
+        if self._fresh(entry):
+            logging.info(f"✅ Instagram credentials valid for {entry.get('username') or 'Unknown'} (cached)")
+            return True
+        return self.check(fallback=self._fresh(entry, ttl=2 * self.ttl))
+
+    def start(self):
+        """
+        Validate in a background thread (instantly when the cache is fresh). A check that is
+        running or has succeeded is kept; a failed one is started again.
+        """
+        if self._done.is_set() and self.result:
+            return self
+        if self._thread is not None and not self._done.is_set():
+            return self
+        self._done.clear()
+
+        def run():
+            try:
+                self.result = self.validate()
+            except Exception as e:
+                logging.error(f"Instagram credential check failed: {e}")
+                self.result = False
+            finally:
+                self._done.set()
+
+        self._thread = threading.Thread(target=run, name='credential-check', daemon=True)
+        self._thread.start()
+        return self
+
+    def wait(self, timeout: float = None) -> bool:
+        """Result of the background check; False if it has not finished within `timeout` seconds."""
+        self.start()
+        if not self._done.wait(timeout):
+            logging.error(f"Instagram credential check did not finish within {timeout}s")
+            return False
+        return bool(self.result)
@@ -0,0 +1,162 @@
+"""
+Google Drive authentication for Instagram AI Agent
+Loads and refreshes the OAuth token once per process, persists it atomically and hands
+out a single shared Drive service built from a locally cached discovery document.
+"""
+
+import os
+import json
+import pickle
+import logging
+import threading
+
+from config import OAUTH_TOKEN_FILE, OAUTH_CLIENT_SECRET_FILE, DRIVE_DISCOVERY_CACHE_FILE
+from state_store import atomic_write, atomic_write_json
+
+OAUTH_SCOPES = ['https://www.googleapis.com/auth/drive.file']
+DISCOVERY_URL = 'https://www.googleapis.com/discovery/v1/apis/drive/v3/rest'
+
+_discovery_lock = threading.Lock()
+_discovery_document = None
+
+
+def drive_discovery_document():
+    """
+    The Drive v3 discovery document: from the local cache file, else the copy bundled with
+    google-api-python-client, else fetched once from Google and cached.
+    """
+    global _discovery_document
+    with _discovery_lock:
+        if _discovery_document is not None:
+            return _discovery_document
+
+        document = None
+        if os.path.exists(DRIVE_DISCOVERY_CACHE_FILE):
+            try:
+                with open(DRIVE_DISCOVERY_CACHE_FILE, 'r', encoding='utf-8') as f:
+                    document = f.read()
+                json.loads(document)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable discovery cache {DRIVE_DISCOVERY_CACHE_FILE}: {e}")
+                document = None
+
+        if document is None:
+            from googleapiclient.discovery_cache import get_static_doc
+            document = get_static_doc('drive', 'v3')
+
+        if document is None:
+            import requests
+            response = requests.get(DISCOVERY_URL, timeout=30)
+            response.raise_for_status()
+            document = response.text
+            logging.info("Fetched Drive discovery document from Google")
+
+        if not os.path.exists(DRIVE_DISCOVERY_CACHE_FILE):
+            try:
+                atomic_write_json(DRIVE_DISCOVERY_CACHE_FILE, json.loads(document))
+            except Exception as e:
+                logging.warning(f"Could not cache Drive discovery document: {e}")
+
+        _discovery_document = document
+        return document
+
+
+def build_drive_service(credentials):
+    """
+    Build a Drive v3 service without a network round trip for discovery.
+    httplib2.Http is not thread-safe, so every thread gets its own connection object, kept
+    for the life of the thread so requests reuse its keep-alive connections.
+    """
+    import httplib2
+    import google_auth_httplib2
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.http import HttpRequest
+
+    local = threading.local()
+
+    def thread_http():
+        if getattr(local, 'http', None) is None:
+            local.http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http())
+        return local.http
+
+    def build_request(http, *args, **kwargs):
+        return HttpRequest(thread_http(), *args, **kwargs)
+
+    return build_from_document(drive_discovery_document(), http=thread_http(), requestBuilder=build_request)
+
+
+class DriveCredentialsManager:
+    """OAuth2 (real user) credentials for Drive, loaded once and refreshed only when expired."""
+
+    def __init__(self, token_path: str = None, client_secret_path: str = None):
+        self.token_path = token_path or OAUTH_TOKEN_FILE
+        self.client_secret_path = client_secret_path or OAUTH_CLIENT_SECRET_FILE
+        self._lock = threading.Lock()
+        self._credentials = None
+        self._saved_token = None
+        self._service = None
+
+    def _load(self):
+        if not os.path.exists(self.token_path):
+            return None
+        try:
+            with open(self.token_path, 'rb') as token:
+                return pickle.load(token)
+        except Exception as e:
+            logging.warning(f"Could not load {self.token_path}, re-authorizing: {e}")
+            return None
+
+    def _save(self, credentials):
+        atomic_write(self.token_path, pickle.dumps(credentials))
+        self._saved_token = credentials.token
+
+    def get_credentials(self):
+        """Valid OAuth credentials, refreshing (or re-authorizing) only when needed."""
+        with self._lock:
+            credentials = self._credentials or self._load()
+            if credentials is None or not credentials.valid:
+                if credentials and credentials.expired and credentials.refresh_token:
+                    from google.auth.transport.requests import Request
+                    credentials.refresh(Request())
+                    logging.info("Refreshed Google Drive OAuth token")
+                else:
+                    from google_auth_oauthlib.flow import InstalledAppFlow
+                    flow = InstalledAppFlow.from_client_secrets_file(self.client_secret_path, OAUTH_SCOPES)
+                    credentials = flow.run_local_server(port=0)
+                self._save(credentials)
+            elif self._saved_token is None:
+                self._saved_token = credentials.token
+            self._credentials = credentials
+            return credentials
+
+    def get_service(self):
+        """The shared Drive service for this process."""
+        credentials = self.get_credentials()
+        with self._lock:
+            if self._service is None:
+                self._service = build_drive_service(credentials)
+            # The service refreshes expired tokens on its own; keep the token file in step
+            if credentials.token != self._saved_token:
+                try:
+                    self._save(credentials)
+                except Exception as e:
+                    logging.warning(f"Could not save refreshed Drive token: {e}")
+            return self._service
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_drive_credentials_manager():
+    """Process-wide DriveCredentialsManager."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = DriveCredentialsManager()
+        return _manager
+
+
+def get_oauth_drive_service():
+    """Shared OAuth Drive service for this process."""
+    return get_drive_credentials_manager().get_service()
@@ -0,0 +1,113 @@
+"""
+Batched Drive calls for Instagram AI Agent
+Groups independent Drive API calls (permission changes, deletes, metadata lookups)
+into BatchHttpRequests of up to 100 calls, one HTTP round trip per batch.
+"""
+
+import logging
+from typing import Callable, List, Optional, Any
+
+MAX_BATCH_SIZE = 100  # Drive's limit on calls per batch request
+PUBLIC_PERMISSION = {'type': 'anyone', 'role': 'reader'}
+PUBLIC_PERMISSION_ID = 'anyoneWithLink'
+
+
+class DriveBatch:
+    """
+    Collects Drive requests and executes them in batches.
+    Each call's callback receives (response, exception), exactly one of which is None.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self._calls = []
+
+    def add(self, request, callback: Optional[Callable[[Any, Optional[Exception]], None]] = None, label: str = None):
+        self._calls.append((request, callback, label))
+        return self
+
+    def __len__(self):
+        return len(self._calls)
+
+    def execute(self) -> List[tuple]:
+        """Send every queued call; returns [(label, response, exception)] in the order they were added."""
+        results = [None] * len(self._calls)
+        calls, self._calls = self._calls, []
+        if not calls:
+            return results
+
+        for start in range(0, len(calls), MAX_BATCH_SIZE):
+            group = calls[start:start + MAX_BATCH_SIZE]
+
+            def on_response(request_id, response, exception, offset=start):
+                index = offset + int(request_id)
+                request, callback, label = calls[index]
+                results[index] = (label, response, exception)
+                if callback:
+                    callback(response, exception)
+
+            batch = self.service.new_batch_http_request(callback=on_response)
+            for i, (request, _, _) in enumerate(group):
+                batch.add(request, request_id=str(i))
+            batch.execute()
+
+        failed = sum(1 for r in results if r and r[2] is not None)
+        logging.info(f"Drive batch: {len(calls)} call(s) in {-(-len(calls) // MAX_BATCH_SIZE)} request(s), {failed} failed")
+        return results
+
+
+def make_files_public(service, file_ids: List[str]) -> List[str]:
+    """Give 'anyone with the link' read access to each file. Returns the ids that succeeded."""
+    batch = DriveBatch(service)
+    for file_id in file_ids:
+        batch.add(service.permissions().create(fileId=file_id, body=PUBLIC_PERMISSION, fields='id'), label=file_id)
+    succeeded = []
+    for file_id, _, error in batch.execute():
+        if error is None:
+            succeeded.append(file_id)
+        else:
+            logging.error(f"Error making file {file_id} public: {error}")
+    return succeeded
+
+
+def delete_files(service, file_ids: List[str]) -> List[str]:
+    """
+    Delete files. Files that cannot be deleted are made private instead, so stale videos
+    stop being publicly downloadable. Returns the ids that were deleted.
+    """
+    batch = DriveBatch(service)
+    for file_id in file_ids:
+        batch.add(service.files().delete(fileId=file_id), label=file_id)
+
+    deleted, undeletable = [], []
+    for file_id, _, error in batch.execute():
+        if error is None:
+            deleted.append(file_id)
+        elif 'insufficientFilePermissions' in str(error):
+            undeletable.append(file_id)
+        else:
+            logging.error(f"Error deleting file {file_id} from Google Drive: {error}")
+
+    if undeletable:
+        logging.warning(f"{len(undeletable)} file(s) could not be deleted, removing their public links instead")
+        batch = DriveBatch(service)
+        for file_id in undeletable:
+            batch.add(service.permissions().delete(fileId=file_id, permissionId=PUBLIC_PERMISSION_ID), label=file_id)
+        for file_id, _, error in batch.execute():
+            if error is not None:
+                logging.error(f"Error removing public link from {file_id}: {error}")
+    return deleted
+
+
+def list_files(service, query: str, fields: str = 'id, name, modifiedTime') -> List[dict]:
+    """All files matching `query`, following pageToken."""
+    files = []
+    page_token = None
+    while True:
+        results = service.files().list(
+            q=query, fields=f"nextPageToken, files({fields})", pageSize=1000, pageToken=page_token
+        ).execute()
+        files.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return files
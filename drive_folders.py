@@ -0,0 +1,106 @@
+"""
+Drive folder ids for Instagram AI Agent
+Resolved folder ids are kept in a local state file so uploads skip the folder name query.
+A cached id is only re-checked when an upload into it fails with not-found.
+"""
+
+import logging
+import threading
+from typing import Optional, Callable
+
+from config import DRIVE_STATE_FILE
+from state_store import atomic_write_json, load_json
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+
+class FolderIdCache:
+    """Folder ids by (account, folder name), persisted in DRIVE_STATE_FILE."""
+
+    def __init__(self, path: str = None):
+        self.path = path or DRIVE_STATE_FILE
+        self._lock = threading.Lock()
+        self.folders = load_json(self.path).get('folders', {})
+
+    @staticmethod
+    def key(account: str, name: str) -> str:
+        return f"{account}:{name}"
+
+    def get(self, account: str, name: str) -> Optional[str]:
+        with self._lock:
+            return self.folders.get(self.key(account, name))
+
+    def store(self, account: str, name: str, folder_id: str):
+        with self._lock:
+            self.folders[self.key(account, name)] = folder_id
+            self._save()
+
+    def forget(self, account: str, name: str):
+        with self._lock:
+            if self.folders.pop(self.key(account, name), None) is not None:
+                self._save()
+
+    def _save(self):
+        state = load_json(self.path)
+        state['folders'] = dict(self.folders)
+        atomic_write_json(self.path, state)
+
+
+def is_not_found(error) -> bool:
+    """True for a googleapiclient HttpError with status 404."""
+    resp = getattr(error, 'resp', None)
+    return resp is not None and getattr(resp, 'status', None) == 404
+
+
+def find_or_create_folder(service, name: str) -> str:
+    """Look a folder up by name, creating it if it does not exist."""
+    query = f"name='{name}' and mimeType='{FOLDER_MIME_TYPE}' and trashed=false"
+    results = service.files().list(q=query, fields="files(id, name)").execute()
+    files = results.get('files', [])
+    if files:
+        logging.info(f"Found existing folder: {name} (ID: {files[0]['id']})")
+        return files[0]['id']
+
+    folder = service.files().create(body={'name': name, 'mimeType': FOLDER_MIME_TYPE}, fields='id').execute()
+    logging.info(f"Created new folder: {name} (ID: {folder.get('id')})")
+    return folder.get('id')
+
+
+def folder_exists(service, folder_id: str) -> bool:
+    """Cheap check that a folder id still points at a live folder."""
+    try:
+        folder = service.files().get(fileId=folder_id, fields='id, trashed').execute()
+        return not folder.get('trashed', False)
+    except Exception as e:
+        if is_not_found(e):
+            return False
+        raise
+
+
+def resolve_folder(service, cache: FolderIdCache, account: str, name: str) -> str:
+    """Folder id from the cache, or looked up / created on Drive and cached."""
+    folder_id = cache.get(account, name)
+    if folder_id:
+        return folder_id
+    folder_id = find_or_create_folder(service, name)
+    if folder_id:
+        cache.store(account, name, folder_id)
+    return folder_id
+
+
+def create_in_folder(service, upload: Callable[[str], dict], folder_id: str,
+                     refresh_folder: Callable[[], Optional[str]]):
+    """
+    Run upload(folder_id). If Drive answers not-found and the folder is really gone,
+    resolve the folder again with refresh_folder() and retry the upload once.
+    """
+    try:
+        return upload(folder_id)
+    except Exception as e:
+        if not is_not_found(e) or folder_exists(service, folder_id):
+            raise
+        logging.warning(f"Cached Drive folder {folder_id} no longer exists, resolving it again")
+        new_folder_id = refresh_folder()
+        if not new_folder_id:
+            raise
+        return upload(new_folder_id)
@@ -0,0 +1,290 @@
+"""
+Resumable Drive uploads for Instagram AI Agent
+Uploads in large chunks, persists the resumable session URI and byte offset after every
+chunk, resumes an interrupted upload on the next run and retries transient errors with backoff.
+"""
+
+import os
+import time
+import random
+import hashlib
+import logging
+import threading
+from typing import Optional, Dict
+
+from config import (UPLOAD_STATE_FILE, UPLOAD_INDEX_FILE, DRIVE_UPLOAD_CHUNK_MB, DRIVE_UPLOAD_MAX_RETRIES,
+                    DRIVE_UPLOAD_BACKOFF_SECONDS, DRIVE_UPLOAD_MAX_BACKOFF_SECONDS, STREAM_UPLOAD_POLL_SECONDS)
+from state_store import atomic_write_json, load_json
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+CHUNK_ALIGNMENT = 256 * 1024  # Drive requires chunk sizes in multiples of 256 KiB
+
+
+def upload_tag(*parts) -> str:
+    """Stable tag for a rendered video (e.g. quote, author, track, effect), used to find its pending upload."""
+    return hashlib.sha1('\x1f'.join(str(p) for p in parts).encode('utf-8')).hexdigest()[:16]
+
+
+def _file_fingerprint(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def _is_retryable(error) -> bool:
+    resp = getattr(error, 'resp', None)
+    if resp is not None:
+        return getattr(resp, 'status', None) in RETRYABLE_STATUS
+    # Connection resets, timeouts and DNS failures (socket errors are OSError, httplib2's are not)
+    return isinstance(error, OSError) or type(error).__module__.startswith('httplib2')
+
+
+def _is_not_found(error) -> bool:
+    resp = getattr(error, 'resp', None)
+    return resp is not None and getattr(resp, 'status', None) in (404, 410)
+
+
+def growing_file_upload(path: str, chunk_size: int, mimetype: str = 'video/mp4'):
+    """
+    A resumable MediaUpload over a file that is still being written (e.g. by the encoder).
+    Its size is unknown until finish() is called, so Drive receives it as a streamed upload
+    and every chunk is sent as soon as the encoder has written it.
+    """
+    from googleapiclient.http import MediaUpload
+
+    class GrowingFileUpload(MediaUpload):
+        def __init__(self):
+            self.path = path
+            self._chunk_size = chunk_size
+            self._mimetype = mimetype
+            self._finished = threading.Event()
+            self._failed = False
+
+        def finish(self, success=True):
+            """Mark the file as complete (or the encode as failed)."""
+            self._failed = not success
+            self._finished.set()
+
+        def chunksize(self):
+            return self._chunk_size
+
+        def mimetype(self):
+            return self._mimetype
+
+        def size(self):
+            if self._finished.is_set() and not self._failed:
+                return os.path.getsize(self.path)
+            return None
+
+        def resumable(self):
+            return True
+
+        def has_stream(self):
+            return False
+
+        def getbytes(self, begin, length):
+            # Block until a full chunk is on disk; a short read tells the client this is the end
+            while True:
+                finished = self._finished.is_set()
+                if finished and self._failed:
+                    raise IOError(f"Encoding of {self.path} failed, aborting streamed upload")
+                available = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+                if available >= begin + length or finished:
+                    break
+                self._finished.wait(STREAM_UPLOAD_POLL_SECONDS)
+            with open(self.path, 'rb') as f:
+                f.seek(begin)
+                return f.read(length)
+
+    return GrowingFileUpload()
+
+
+class ResumableUploadManager:
+    """
+    Chunked resumable uploads with state persisted in UPLOAD_STATE_FILE:
+    {tag: {'file_path', 'size', 'mtime', 'folder_id', 'uri', 'offset'}}.
+    """
+
+    _state_lock = threading.Lock()
+
+    def __init__(self, service=None, state_path: str = None, chunk_size_mb: int = None):
+        self.service = service
+        self.state_path = state_path or UPLOAD_STATE_FILE
+        chunk_bytes = int((chunk_size_mb or DRIVE_UPLOAD_CHUNK_MB) * 1024 * 1024)
+        self.chunk_size = max(CHUNK_ALIGNMENT, chunk_bytes // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT)
+
+    # --- persisted state ---
+
+    def _update_state(self, tag, entry):
+        with self._state_lock:
+            state = load_json(self.state_path)
+            if entry is None:
+                state.pop(tag, None)
+            else:
+                state[tag] = entry
+            atomic_write_json(self.state_path, state)
+
+    def pending(self, tag: str) -> Optional[Dict]:
+        """The interrupted upload recorded for `tag`, if its local file is unchanged."""
+        if not tag:
+            return None
+        with self._state_lock:
+            entry = load_json(self.state_path).get(tag)
+        if not entry or not os.path.exists(entry['file_path']):
+            return None
+        fingerprint = _file_fingerprint(entry['file_path'])
+        if fingerprint['size'] != entry['size'] or fingerprint['mtime'] != entry['mtime']:
+            return None
+        return entry
+
+    # --- upload ---
+
+    def _new_request(self, file_path, metadata, folder_id, mimetype, fields, media=None):
+        from googleapiclient.http import MediaFileUpload
+
+        if media is None:
+            media = MediaFileUpload(file_path, mimetype=mimetype, chunksize=self.chunk_size, resumable=True)
+        body = dict(metadata, parents=[folder_id])
+        return self.service.files().create(body=body, media_body=media, fields=fields)
+
+    def upload(self, file_path: str, metadata: Dict, folder_id: str, tag: str = None,
+               mimetype: str = 'video/mp4', fields: str = 'id', media=None) -> Dict:
+        """
+        Upload `file_path` into `folder_id`, resuming the session recorded for `tag` if there is one.
+        Pass a growing_file_upload() as `media` to stream a file that is still being encoded
+        (such uploads are not persisted: an interrupted encode is rendered again anyway).
+        """
+        if media is not None:
+            return self._stream(file_path, metadata, folder_id, mimetype, fields, media)
+
+        tag = tag or upload_tag(os.path.abspath(file_path))
+        fingerprint = _file_fingerprint(file_path)
+        request = self._new_request(file_path, metadata, folder_id, mimetype, fields)
+
+        entry = self.pending(tag)
+        resuming = bool(entry and entry['file_path'] == file_path and entry['folder_id'] == folder_id and entry.get('uri'))
+        if resuming:
+            # An error state makes next_chunk() ask Drive for the committed offset before sending
+            request.resumable_uri = entry['uri']
+            request._in_error_state = True
+            logging.info(f"Resuming Drive upload of {file_path} from byte {entry.get('offset', 0)}")
+
+        entry = dict(fingerprint, file_path=file_path, folder_id=folder_id,
+                     uri=request.resumable_uri, offset=entry.get('offset', 0) if resuming else 0)
+
+        def record_progress(status):
+            entry['uri'] = request.resumable_uri
+            entry['offset'] = status.resumable_progress
+            self._update_state(tag, entry)
+
+        try:
+            response = self._send_chunks(request, file_path, entry['offset'], record_progress)
+        except Exception as e:
+            if resuming and _is_not_found(e):
+                # The session expired (Drive keeps them for about a week): start over
+                logging.warning(f"Resumable session for {file_path} expired, restarting upload")
+                self._update_state(tag, None)
+                return self.upload(file_path, metadata, folder_id, tag, mimetype, fields)
+            raise
+        self._update_state(tag, None)
+        return response
+
+    def _stream(self, file_path, metadata, folder_id, mimetype, fields, media):
+        logging.info(f"Streaming {file_path} to Drive while it is encoded")
+        request = self._new_request(file_path, metadata, folder_id, mimetype, fields, media=media)
+        return self._send_chunks(request, file_path, 0)
+
+    def _send_chunks(self, request, file_path, start_offset, on_progress=None):
+        """Drive next_chunk() to completion, retrying transient errors with backoff and jitter."""
+        started = time.time()
+        retries = 0
+        response = None
+        while response is None:
+            try:
+                status, response = request.next_chunk(num_retries=0)
+            except Exception as e:
+                if not _is_retryable(e) or retries >= DRIVE_UPLOAD_MAX_RETRIES:
+                    raise
+                retries += 1
+                delay = min(DRIVE_UPLOAD_MAX_BACKOFF_SECONDS, DRIVE_UPLOAD_BACKOFF_SECONDS * 2 ** (retries - 1))
+                delay = random.uniform(delay / 2, delay)
+                logging.warning(f"Drive upload error ({e}), retry {retries}/{DRIVE_UPLOAD_MAX_RETRIES} in {delay:.1f}s")
+                if request.resumable_uri:
+                    request._in_error_state = True
+                time.sleep(delay)
+                continue
+
+            retries = 0
+            if status is not None:
+                if on_progress:
+                    on_progress(status)
+                elapsed = max(time.time() - started, 1e-6)
+                rate = (status.resumable_progress - start_offset) / elapsed / (1024 * 1024)
+                logging.info(f"Drive upload {status.progress() * 100:.0f}% "
+                             f"({status.resumable_progress / (1024 * 1024):.1f} MB, {rate:.2f} MB/s)")
+
+        elapsed = max(time.time() - started, 1e-6)
+        sent_mb = (os.path.getsize(file_path) - start_offset) / (1024 * 1024)
+        logging.info(f"Drive upload of {os.path.basename(file_path)} finished: "
+                     f"{sent_mb:.1f} MB in {elapsed:.1f}s ({sent_mb / elapsed:.2f} MB/s)")
+        return response
+
+
+class UploadIndex:
+    """
+    Local index of uploaded videos by content: {md5: {'file_id', 'folder_id', 'size', 'name', 'public'}}.
+    Lets a byte-identical re-render reuse the Drive file instead of uploading it again.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, path: str = None):
+        self.path = path or UPLOAD_INDEX_FILE
+
+    def _update(self, change):
+        with self._lock:
+            index = load_json(self.path)
+            change(index)
+            atomic_write_json(self.path, index)
+
+    def find(self, service, md5: str, size: int, folder_id: str) -> Optional[Dict]:
+        """The indexed upload with this content in folder_id, confirmed with one files().get."""
+        with self._lock:
+            entry = load_json(self.path).get(md5)
+        if not entry or entry['size'] != size or entry['folder_id'] != folder_id:
+            return None
+        try:
+            remote = service.files().get(fileId=entry['file_id'], fields='id, md5Checksum, size, trashed, parents').execute()
+        except Exception as e:
+            if not _is_not_found(e):
+                raise
+            remote = None
+        if (remote is None or remote.get('trashed') or remote.get('md5Checksum') != md5
+                or int(remote.get('size', -1)) != size or folder_id not in remote.get('parents', [])):
+            self.forget_md5(md5)
+            return None
+        return entry
+
+    def add(self, md5: str, size: int, folder_id: str, file_id: str, name: str, public: bool = False):
+        def change(index):
+            index[md5] = {'file_id': file_id, 'folder_id': folder_id, 'size': size, 'name': name, 'public': public}
+        self._update(change)
+
+    def mark_public(self, md5: str):
+        def change(index):
+            if md5 in index:
+                index[md5]['public'] = True
+        self._update(change)
+
+    def forget_md5(self, md5: str):
+        self._update(lambda index: index.pop(md5, None))
+
+    def forget_files(self, file_ids):
+        """Drop entries for Drive files that were deleted."""
+        file_ids = set(file_ids)
+        if not file_ids:
+            return
+
+        def change(index):
+            for md5 in [k for k, v in index.items() if v['file_id'] in file_ids]:
+                del index[md5]
+        self._update(change)
@@ -0,0 +1,403 @@
+"""
+Meta Graph API client for Instagram AI Agent
+One pooled, keep-alive HTTP session for every Graph call, a configurable API version,
+timeouts on every request, structured errors and rate-limit aware pacing of background calls.
+"""
+
+import os
+import re
+import time
+import math
+import hashlib
+import random
+import logging
+import threading
+import statistics
+from typing import Optional, Dict, Any, Callable
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (GRAPH_API_BASE_URL, GRAPH_API_VERSION, GRAPH_API_TIMEOUT, GRAPH_API_POOL_SIZE,
+                    CONTAINER_POLL_INITIAL_SECONDS, CONTAINER_POLL_MAX_INTERVAL_SECONDS,
+                    CONTAINER_POLL_DEADLINE_SECONDS, CONTAINER_STATS_FILE, INSTAGRAM_UPLOAD_BASE_URL,
+                    INSTAGRAM_UPLOAD_CHUNK_MB, INSTAGRAM_UPLOAD_MAX_RETRIES)
+from graph_usage import usage_budget, URGENT, BACKGROUND
+from state_store import atomic_write_json, load_json
+
+# Graph error codes that are worth retrying (rate limits and temporary server issues)
+TRANSIENT_ERROR_CODES = {1, 2, 4, 17, 32, 341, 613}
+
+# Query parameters whose values must never reach a log line
+SECRET_PARAMS = re.compile(r'((?:access_token|input_token|fb_exchange_token|client_secret)=)[^&\s\'"]+')
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def token_fingerprint(access_token: str) -> str:
+    """Stable key for a token that does not store the token itself."""
+    return hashlib.sha256((access_token or '').encode('utf-8')).hexdigest()[:16]
+
+
+def redact_secrets(text: str, *secrets: str) -> str:
+    """`text` with token and secret values in any URL, and any of `secrets`, replaced by ***."""
+    text = SECRET_PARAMS.sub(r'\1***', str(text))
+    for secret in secrets:
+        if secret:
+            text = text.replace(secret, '***')
+    return text
+
+
+def graph_session() -> requests.Session:
+    """Process-wide pooled session, so every Graph call reuses warm TLS connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=GRAPH_API_POOL_SIZE, pool_maxsize=GRAPH_API_POOL_SIZE)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+class GraphAPIError(Exception):
+    """A failed Graph API call, with the fields of Graph's error object."""
+
+    def __init__(self, message: str, status: Optional[int] = None, code: Optional[int] = None,
+                 subcode: Optional[int] = None, error_type: Optional[str] = None,
+                 fbtrace_id: Optional[str] = None, transient: bool = False, payload: Optional[Dict] = None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.code = code
+        self.subcode = subcode
+        self.error_type = error_type
+        self.fbtrace_id = fbtrace_id
+        self.transient = transient
+        self.payload = payload or {}
+
+    @classmethod
+    def from_response(cls, response: requests.Response, payload: Optional[Dict] = None) -> 'GraphAPIError':
+        error = (payload or {}).get('error', {}) if isinstance(payload, dict) else {}
+        code = error.get('code')
+        return cls(
+            error.get('message') or f"HTTP {response.status_code}",
+            status=response.status_code,
+            code=code,
+            subcode=error.get('error_subcode'),
+            error_type=error.get('type'),
+            fbtrace_id=error.get('fbtrace_id'),
+            transient=bool(error.get('is_transient')) or code in TRANSIENT_ERROR_CODES or response.status_code >= 500,
+            payload=payload,
+        )
+
+    @classmethod
+    def from_upload_response(cls, response: requests.Response, payload: Optional[Dict] = None) -> 'GraphAPIError':
+        """Errors from the rupload endpoint come as {'debug_info': {'retriable', 'type', 'message'}}."""
+        info = (payload or {}).get('debug_info', {}) if isinstance(payload, dict) else {}
+        if not info:
+            return cls.from_response(response, payload)
+        return cls(
+            info.get('message') or f"HTTP {response.status_code}",
+            status=response.status_code,
+            error_type=info.get('type'),
+            transient=bool(info.get('retriable')) or response.status_code >= 500,
+            payload=payload,
+        )
+
+    def __str__(self):
+        details = ', '.join(f"{k}={v}" for k, v in
+                            (('status', self.status), ('code', self.code), ('subcode', self.subcode),
+                             ('type', self.error_type), ('fbtrace_id', self.fbtrace_id)) if v is not None)
+        return f"{self.message} ({details})" if details else self.message
+
+
+class ProcessingStats:
+    """
+    How long Instagram took to process containers, by video size bucket (powers of two in MB).
+    Used to skip polls that are too early to succeed and to tune the poll settings.
+    """
+
+    MAX_SAMPLES = 50
+    _lock = threading.Lock()
+
+    def __init__(self, path: str = None):
+        self.path = path or CONTAINER_STATS_FILE
+
+    @staticmethod
+    def bucket(video_size: Optional[int]) -> str:
+        if not video_size:
+            return 'unknown'
+        megabytes = max(1, math.ceil(video_size / (1024 * 1024)))
+        return f"{2 ** math.ceil(math.log2(megabytes))}MB"
+
+    def record(self, video_size: Optional[int], seconds: float):
+        bucket = self.bucket(video_size)
+        with self._lock:
+            stats = load_json(self.path)
+            samples = stats.get(bucket, []) + [round(seconds, 2)]
+            stats[bucket] = samples[-self.MAX_SAMPLES:]
+            try:
+                atomic_write_json(self.path, stats)
+            except Exception as e:
+                logging.warning(f"Could not save container processing stats: {e}")
+        logging.info(f"Container processing took {seconds:.1f}s ({bucket} video, "
+                     f"median {statistics.median(stats[bucket]):.1f}s over {len(stats[bucket])} posts)")
+
+    def first_wait(self, video_size: Optional[int]) -> Optional[float]:
+        """A little under the fastest typical processing time seen for this size, or None without data."""
+        with self._lock:
+            samples = load_json(self.path).get(self.bucket(video_size), [])
+        if len(samples) < 3:
+            return None
+        return 0.8 * statistics.median(samples)
+
+
+class GraphClient:
+    """
+    Thin Graph API client: get/post plus the Instagram container publish flow.
+    Pass `token_provider` instead of a fixed `access_token` to always use the current token
+    (see token_manager), so a refreshed token is picked up without rebuilding the client.
+    """
+
+    def __init__(self, access_token: str = None, api_version: str = None, base_url: str = None,
+                 timeout=None, session: requests.Session = None, upload_base_url: str = None,
+                 token_provider: Callable[[], Optional[str]] = None):
+        self._access_token = access_token
+        self.token_provider = token_provider
+        self.api_version = api_version or GRAPH_API_VERSION
+        self.base_url = (base_url or GRAPH_API_BASE_URL).rstrip('/')
+        self.upload_base_url = (upload_base_url or INSTAGRAM_UPLOAD_BASE_URL).rstrip('/')
+        self.timeout = timeout or GRAPH_API_TIMEOUT
+        self.session = session or graph_session()
+
+    @property
+    def access_token(self) -> Optional[str]:
+        return self.token_provider() if self.token_provider else self._access_token
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/{self.api_version}/{path.lstrip('/')}"
+
+    def request(self, method: str, path: str, params: Dict = None, data: Dict = None, timeout=None,
+                priority: str = URGENT, deadline_at: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Send one Graph call and return its JSON body; raises GraphAPIError on any failure.
+        The access token goes in the Authorization header, never in the URL, so it cannot
+        leak through exception text. BACKGROUND calls are held back while the app or
+        account is close to its rate limit, but never past `deadline_at` (a time.time() value).
+        """
+        params = dict(params or {})
+        data = dict(data) if data is not None else None
+        access_token = (data if data is not None else params).pop('access_token', None) or self.access_token
+        headers = {'Authorization': f"OAuth {access_token}"} if access_token else {}
+
+        budget = usage_budget()
+        account = token_fingerprint(access_token)
+        delay = budget.delay(account, priority)
+        if deadline_at is not None:
+            delay = min(delay, max(0.0, deadline_at - time.time()))
+        if delay:
+            logging.info(f"Delaying background Graph call {path or '/'} by {delay:.0f}s (usage {budget.usage(account):.0f}%)")
+            time.sleep(delay)
+
+        try:
+            response = self.session.request(method, self.url(path), params=params, data=data, headers=headers,
+                                            timeout=timeout or self.timeout)
+        except requests.RequestException as e:
+            raise GraphAPIError(f"{method} {path} failed: {redact_secrets(e)}", transient=True)
+        budget.record(response.headers, account)
+
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = None
+        if not response.ok or payload is None or (isinstance(payload, dict) and 'error' in payload):
+            raise GraphAPIError.from_response(response, payload)
+        return payload
+
+    def get(self, path: str, priority: str = URGENT, deadline_at: Optional[float] = None, **params) -> Dict[str, Any]:
+        return self.request('GET', path, params=params, priority=priority, deadline_at=deadline_at)
+
+    def post(self, path: str, priority: str = URGENT, deadline_at: Optional[float] = None, **data) -> Dict[str, Any]:
+        return self.request('POST', path, data=data, priority=priority, deadline_at=deadline_at)
+
+    # --- Instagram content publishing ---
+
+    def create_video_container(self, ig_user_id: str, video_url: str, caption: str = "",
+                               media_type: str = 'REELS') -> str:
+        """Create a media container for a public video URL and return its id."""
+        result = self.post(f"{ig_user_id}/media", media_type=media_type, video_url=video_url, caption=caption)
+        container_id = result.get('id')
+        if not container_id:
+            raise GraphAPIError("Media container response has no id", payload=result)
+        return container_id
+
+    def create_resumable_video_container(self, ig_user_id: str, caption: str = "",
+                                         media_type: str = 'REELS') -> str:
+        """Create a media container whose video bytes are sent with upload_video_file()."""
+        result = self.post(f"{ig_user_id}/media", media_type=media_type, upload_type='resumable', caption=caption)
+        container_id = result.get('id')
+        if not container_id:
+            raise GraphAPIError("Media container response has no id", payload=result)
+        return container_id
+
+    def upload_offset(self, container_id: str) -> int:
+        """Bytes of a resumable upload that Instagram has already received."""
+        video_status = self.get(container_id, fields='video_status').get('video_status') or {}
+        return int((video_status.get('uploading_phase') or {}).get('bytes_transferred') or 0)
+
+    def upload_video_file(self, container_id: str, file_path: str, offset: int = 0, chunk_size: int = None):
+        """
+        Send a local video to a resumable container in chunks. After a transient failure the
+        upload continues from the offset Instagram reports, with exponential backoff and jitter.
+        """
+        file_size = os.path.getsize(file_path)
+        chunk_size = chunk_size or int(INSTAGRAM_UPLOAD_CHUNK_MB * 1024 * 1024)
+        url = f"{self.upload_base_url}/{self.api_version}/{container_id}"
+        started = time.time()
+        start_offset = offset
+        retries = 0
+
+        with open(file_path, 'rb') as f:
+            while offset < file_size:
+                f.seek(offset)
+                chunk = f.read(chunk_size)
+                headers = {
+                    'Authorization': f"OAuth {self.access_token}",
+                    'offset': str(offset),
+                    'file_size': str(file_size),
+                    'Content-Type': 'application/octet-stream',
+                }
+                try:
+                    try:
+                        response = self.session.post(url, headers=headers, data=chunk, timeout=self.timeout)
+                    except requests.RequestException as e:
+                        raise GraphAPIError(f"Upload to container {container_id} failed: {redact_secrets(e)}",
+                                            transient=True)
+                    try:
+                        payload = response.json()
+                    except ValueError:
+                        payload = None
+                    if not response.ok or not isinstance(payload, dict) or not payload.get('success'):
+                        raise GraphAPIError.from_upload_response(response, payload)
+                except GraphAPIError as e:
+                    if not e.transient or retries >= INSTAGRAM_UPLOAD_MAX_RETRIES:
+                        raise
+                    retries += 1
+                    delay = random.uniform(0.5, 1.0) * min(CONTAINER_POLL_MAX_INTERVAL_SECONDS, 2 ** retries)
+                    logging.warning(f"Instagram upload error ({e}), retry {retries}/{INSTAGRAM_UPLOAD_MAX_RETRIES} "
+                                    f"in {delay:.1f}s")
+                    time.sleep(delay)
+                    try:
+                        offset = self.upload_offset(container_id)
+                    except GraphAPIError as status_error:
+                        logging.warning(f"Could not read upload offset, resending from {offset}: {status_error}")
+                    continue
+
+                retries = 0
+                offset += len(chunk)
+                logging.info(f"Instagram upload {offset * 100 // file_size}% ({offset / (1024 * 1024):.1f} MB)")
+
+        elapsed = max(time.time() - started, 1e-6)
+        sent_mb = (file_size - start_offset) / (1024 * 1024)
+        logging.info(f"Uploaded {os.path.basename(file_path)} to container {container_id}: "
+                     f"{sent_mb:.1f} MB in {elapsed:.1f}s ({sent_mb / elapsed:.2f} MB/s)")
+
+    def create_uploaded_video_container(self, ig_user_id: str, file_path: str, caption: str = "") -> str:
+        """Resumable container plus the direct byte upload of file_path; returns the container id."""
+        container_id = self.create_resumable_video_container(ig_user_id, caption)
+        self.upload_video_file(container_id, file_path)
+        return container_id
+
+    def container_status(self, container_id: str, deadline_at: Optional[float] = None) -> Dict[str, Any]:
+        """{'status_code': ..., 'status': ...} of a media container."""
+        return self.get(container_id, priority=BACKGROUND, deadline_at=deadline_at, fields='status_code,status')
+
+    def container_statuses(self, container_ids, deadline_at: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """Status of several containers in one request: {id: {'status_code', 'status'}}."""
+        return self.get('', priority=BACKGROUND, deadline_at=deadline_at, ids=','.join(container_ids),
+                        fields='status_code,status')
+
+    def wait_for_container(self, container_id: str, video_size: Optional[int] = None,
+                           deadline: Optional[float] = None, initial_interval: Optional[float] = None,
+                           started: Optional[float] = None) -> Optional[str]:
+        """
+        Poll a container until it is FINISHED or PUBLISHED (returns that status_code), or until
+        `deadline` seconds have passed (None). PUBLISHED means the container is already live, so
+        callers must not send it to media_publish again. Polls start fast and back off exponentially with jitter; the first poll is delayed
+        using the processing times recorded for similar video sizes. ERROR / EXPIRED raise
+        immediately, with Instagram's `status` detail; transient API errors are polled through.
+        """
+        started = started or time.time()
+        deadline_at = started + (deadline or CONTAINER_POLL_DEADLINE_SECONDS)
+        interval = initial_interval or CONTAINER_POLL_INITIAL_SECONDS
+        stats = ProcessingStats()
+
+        first_wait = stats.first_wait(video_size)
+        if first_wait:
+            time.sleep(max(0.0, min(first_wait - (time.time() - started), deadline_at - time.time())))
+
+        checks = 0
+        while True:
+            checks += 1
+            try:
+                status = self.container_status(container_id, deadline_at=deadline_at)
+            except GraphAPIError as e:
+                if not e.transient:
+                    raise
+                logging.warning(f"Check {checks}: transient error polling container {container_id}: {e}")
+                status = {}
+            status_code = status.get('status_code')
+            logging.info(f"Check {checks}: status_code = {status_code}")
+
+            if status_code == 'FINISHED':
+                stats.record(video_size, time.time() - started)
+                return status_code
+            if status_code == 'PUBLISHED':
+                logging.warning(f"Container {container_id} is already published")
+                return status_code
+            if status_code in ('ERROR', 'EXPIRED'):
+                raise GraphAPIError(f"Instagram processing failed: {status.get('status') or status_code}", payload=status)
+
+            remaining = deadline_at - time.time()
+            if remaining <= 0:
+                logging.error(f"Container {container_id} still {status_code} after {time.time() - started:.0f}s, giving up")
+                return None
+            time.sleep(min(remaining, random.uniform(0.8, 1.2) * interval))
+            interval = min(interval * 2, CONTAINER_POLL_MAX_INTERVAL_SECONDS)
+
+    def publish_container(self, ig_user_id: str, container_id: str) -> str:
+        """Publish a finished container and return the new media id."""
+        result = self.post(f"{ig_user_id}/media_publish", creation_id=container_id)
+        media_id = result.get('id')
+        if not media_id:
+            raise GraphAPIError("Publish response has no media id", payload=result)
+        return media_id
+
+    def publish_video(self, ig_user_id: str, video_url: str = None, caption: str = "",
+                      video_size: Optional[int] = None, deadline: Optional[float] = None,
+                      video_path: str = None) -> Optional[str]:
+        """
+        Container, poll, publish. Returns the media id, or None if processing did not finish in time
+        (or the container turned out to be published already, whose media id is unknown).
+        Pass `video_path` instead of `video_url` to upload a local file directly to Instagram.
+        """
+        started = time.time()
+        if video_path:
+            video_size = video_size or os.path.getsize(video_path)
+            container_id = self.create_uploaded_video_container(ig_user_id, video_path, caption)
+            started = time.time()  # Processing starts once the bytes are in
+        else:
+            container_id = self.create_video_container(ig_user_id, video_url, caption)
+        logging.info(f"Created media container {container_id}")
+        status_code = self.wait_for_container(container_id, video_size, deadline, started=started)
+        if not status_code:
+            logging.error("Media was not ready after waiting.")
+            return None
+        if status_code == 'PUBLISHED':
+            logging.warning(f"Container {container_id} was already published, not publishing it again")
+            return None
+        media_id = self.publish_container(ig_user_id, container_id)
+        logging.info(f"Video published successfully! Post ID: {media_id}")
+        return media_id
@@ -0,0 +1,102 @@
+"""
+Graph API rate-limit budget for Instagram AI Agent
+Reads the X-App-Usage and X-Business-Use-Case-Usage headers of every Graph response and
+slows down background calls (status polls, insights, validation) as the app or an account
+nears its limit, so publish calls keep their headroom.
+"""
+
+import json
+import time
+import logging
+import threading
+from typing import Dict, Optional
+
+from config import (GRAPH_USAGE_THROTTLE_PERCENT, GRAPH_USAGE_STALE_SECONDS,
+                    GRAPH_BACKGROUND_MAX_DELAY_SECONDS)
+
+URGENT = 'urgent'
+BACKGROUND = 'background'
+
+USAGE_FIELDS = ('call_count', 'total_cputime', 'total_time')
+
+
+def _parse_header(value: Optional[str]):
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        logging.debug(f"Unreadable Graph usage header: {value}")
+        return None
+
+
+class UsageBudget:
+    """
+    Latest usage percentages, per app and per account (access token):
+    {'percent', 'regain_at', 'seen_at'}. Readings older than GRAPH_USAGE_STALE_SECONDS are ignored.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.app = None
+        self.accounts: Dict[str, Dict] = {}
+
+    def record(self, headers, account: str):
+        """Update the budget from one response's headers."""
+        now = time.time()
+        app = _parse_header(headers.get('X-App-Usage'))
+        business = _parse_header(headers.get('X-Business-Use-Case-Usage'))
+
+        with self._lock:
+            if isinstance(app, dict):
+                self.app = {'percent': max(float(app.get(f, 0) or 0) for f in USAGE_FIELDS),
+                            'regain_at': 0, 'seen_at': now}
+            if isinstance(business, dict):
+                percent, regain_minutes = 0.0, 0
+                for entries in business.values():
+                    for entry in entries if isinstance(entries, list) else [entries]:
+                        percent = max([percent] + [float(entry.get(f, 0) or 0) for f in USAGE_FIELDS])
+                        regain_minutes = max(regain_minutes, int(entry.get('estimated_time_to_regain_access') or 0))
+                self.accounts[account] = {'percent': percent, 'regain_at': now + regain_minutes * 60, 'seen_at': now}
+
+        usage = self.usage(account)
+        if usage >= GRAPH_USAGE_THROTTLE_PERCENT:
+            logging.warning(f"Graph API usage at {usage:.0f}% of the rate limit, throttling background calls")
+
+    def _current(self, reading, now):
+        if not reading or now - reading['seen_at'] > GRAPH_USAGE_STALE_SECONDS:
+            return None
+        return reading
+
+    def usage(self, account: str) -> float:
+        """Highest known usage percentage for the app or this account."""
+        now = time.time()
+        with self._lock:
+            readings = [self._current(self.app, now), self._current(self.accounts.get(account), now)]
+        return max([r['percent'] for r in readings if r] or [0.0])
+
+    def delay(self, account: str, priority: str = BACKGROUND) -> float:
+        """
+        Seconds a call should wait before going out. Urgent calls never wait; background calls
+        wait longer the closer usage is to 100%, and the full delay while an account is blocked.
+        """
+        if priority == URGENT:
+            return 0.0
+        now = time.time()
+        with self._lock:
+            reading = self._current(self.accounts.get(account), now)
+        if reading and reading['regain_at'] > now:
+            return GRAPH_BACKGROUND_MAX_DELAY_SECONDS
+        usage = self.usage(account)
+        if usage < GRAPH_USAGE_THROTTLE_PERCENT:
+            return 0.0
+        share = min(1.0, (usage - GRAPH_USAGE_THROTTLE_PERCENT) / max(1.0, 100 - GRAPH_USAGE_THROTTLE_PERCENT))
+        return GRAPH_BACKGROUND_MAX_DELAY_SECONDS * share
+
+
+_budget = UsageBudget()
+
+
+def usage_budget() -> UsageBudget:
+    """Process-wide budget shared by every Graph client."""
+    return _budget
@@ -0,0 +1,85 @@
+"""
+Import-time budget check for Instagram AI Agent
+Measures the cold import cost of each entry module with `python -X importtime`
+and reports which dependencies dominate. Exits non-zero when a module is over budget.
+
+Usage:
+    python import_budget.py                 # check the default entry modules
+    python import_budget.py main --top 20   # check one module, show 20 heaviest imports
+"""
+
+import os
+import re
+import sys
+import subprocess
+import argparse
+
+from config import IMPORT_TIME_BUDGET_MS, IMPORT_BUDGET_MODULES
+
+_LINE_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def measure_import(module, python=sys.executable):
+    """
+    Import `module` in a fresh interpreter and return (total_ms, entries).
+    entries is a list of (package, self_ms, cumulative_ms, depth).
+    """
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run(
+        [python, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        last_line = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'unknown error'
+        raise RuntimeError(f"Importing '{module}' failed: {last_line}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, package = match.groups()
+        depth = (len(indent) - 1) // 2
+        entries.append((package, int(self_us) / 1000, int(cumulative_us) / 1000, depth))
+
+    # importtime prints children before their parent, so the entry module is the last
+    # top-level line and its own imports are the lines since the previous top-level one
+    start = max((i for i, e in enumerate(entries[:-1]) if e[3] == 0), default=-1) + 1
+    module_entries = entries[start:]
+    total_ms = module_entries[-1][2] if module_entries else 0.0
+    return total_ms, module_entries
+
+
+def report(module, budget_ms, top=10):
+    """Print the import cost of `module` and return True if it is within budget."""
+    try:
+        total_ms, entries = measure_import(module)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return False
+
+    within_budget = total_ms <= budget_ms
+    marker = "✅" if within_budget else "❌"
+    print(f"{marker} {module}: {total_ms:.1f} ms (budget {budget_ms} ms)")
+
+    # Heaviest direct dependencies of the entry module, by cumulative cost
+    direct = [e for e in entries if e[3] == 1]
+    direct.sort(key=lambda e: e[2], reverse=True)
+    for package, self_ms, cumulative_ms, _ in direct[:top]:
+        print(f"   {cumulative_ms:8.1f} ms  {package}")
+    return within_budget
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check cold import time of the agent's entry modules")
+    parser.add_argument('modules', nargs='*', default=IMPORT_BUDGET_MODULES)
+    parser.add_argument('--budget', type=float, default=IMPORT_TIME_BUDGET_MS, help='Budget per module in ms')
+    parser.add_argument('--top', type=int, default=10, help='Number of heaviest imports to list')
+    args = parser.parse_args()
+
+    results = [report(module, args.budget, args.top) for module in args.modules]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Instagram insights collection for Instagram AI Agent
+Pages an account's media with cursors, fetches insights for many media ids per request
+(?ids=...&fields=insights.metric(...)) and stores them in a local SQLite table. Later runs
+only list media newer than the stored cursor, plus recent posts whose numbers still change.
+"""
+
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Optional
+
+from config import INSIGHTS_DB_FILE, INSIGHTS_METRICS, INSIGHTS_BATCH_SIZE, INSIGHTS_REFRESH_DAYS
+from graph_client import GraphClient, GraphAPIError
+from graph_usage import BACKGROUND
+
+MEDIA_FIELDS = 'id,timestamp,media_type,media_product_type,caption,permalink'
+PAGE_SIZE = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    id TEXT PRIMARY KEY,
+    account TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    media_type TEXT,
+    media_product_type TEXT,
+    caption TEXT,
+    permalink TEXT,
+    insights_fetched_at REAL
+);
+CREATE INDEX IF NOT EXISTS media_account_timestamp ON media (account, timestamp);
+CREATE TABLE IF NOT EXISTS insights (
+    media_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value INTEGER,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (media_id, metric)
+);
+CREATE INDEX IF NOT EXISTS insights_metric ON insights (metric, value);
+CREATE TABLE IF NOT EXISTS cursors (
+    account TEXT PRIMARY KEY,
+    newest_timestamp TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def _graph_time(timestamp: str) -> datetime:
+    """Graph timestamps look like 2024-05-01T12:00:00+0000."""
+    return datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%S%z')
+
+
+def _metric_value(entry: Dict) -> Optional[int]:
+    if 'total_value' in entry:
+        return entry['total_value'].get('value')
+    values = entry.get('values') or []
+    return values[-1].get('value') if values else None
+
+
+class InsightsCollector:
+    """Collects media and insights for one account into INSIGHTS_DB_FILE."""
+
+    _lock = threading.Lock()
+
+    def __init__(self, graph: GraphClient, ig_user_id: str, path: str = None, metrics: List[str] = None):
+        self.graph = graph
+        self.ig_user_id = ig_user_id
+        self.path = path or INSIGHTS_DB_FILE
+        self.metrics = metrics or INSIGHTS_METRICS
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits on success and is always closed."""
+        db = sqlite3.connect(self.path)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    # --- media listing ---
+
+    def newest_timestamp(self) -> Optional[str]:
+        with self._connect() as db:
+            row = db.execute("SELECT newest_timestamp FROM cursors WHERE account = ?", (self.ig_user_id,)).fetchone()
+        return row[0] if row else None
+
+    def list_new_media(self) -> List[Dict]:
+        """Media newer than the stored cursor, newest first (all media on the first run)."""
+        since = self.newest_timestamp()
+        since_time = _graph_time(since) if since else None
+        media, after = [], None
+        while True:
+            params = {'fields': MEDIA_FIELDS, 'limit': PAGE_SIZE}
+            if after:
+                params['after'] = after
+            page = self.graph.get(f"{self.ig_user_id}/media", priority=BACKGROUND, **params)
+            for item in page.get('data', []):
+                if since_time and _graph_time(item['timestamp']) <= since_time:
+                    return media  # Media is listed newest first, the rest is already stored
+                media.append(item)
+            after = (page.get('paging') or {}).get('cursors', {}).get('after')
+            if not after or not (page.get('paging') or {}).get('next'):
+                return media
+
+    def _store_media(self, media: List[Dict]):
+        if not media:
+            return
+        with self._lock, self._connect() as db:
+            db.executemany(
+                """INSERT INTO media (id, account, timestamp, media_type, media_product_type, caption, permalink)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(id) DO UPDATE SET caption = excluded.caption, permalink = excluded.permalink""",
+                [(m['id'], self.ig_user_id, m['timestamp'], m.get('media_type'), m.get('media_product_type'),
+                  m.get('caption'), m.get('permalink')) for m in media])
+            newest = max(media, key=lambda m: _graph_time(m['timestamp']))['timestamp']
+            db.execute("""INSERT INTO cursors (account, newest_timestamp, updated_at) VALUES (?, ?, ?)
+                          ON CONFLICT(account) DO UPDATE SET newest_timestamp = excluded.newest_timestamp,
+                          updated_at = excluded.updated_at""", (self.ig_user_id, newest, time.time()))
+
+    # --- insights ---
+
+    def media_to_refresh(self) -> List[str]:
+        """Stored media without insights yet, or posted within the last INSIGHTS_REFRESH_DAYS days."""
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=INSIGHTS_REFRESH_DAYS)).strftime('%Y-%m-%dT%H:%M:%S+0000')
+        with self._connect() as db:
+            rows = db.execute("""SELECT id FROM media WHERE account = ?
+                                 AND (insights_fetched_at IS NULL OR timestamp >= ?)
+                                 ORDER BY timestamp DESC""", (self.ig_user_id, cutoff)).fetchall()
+        return [row[0] for row in rows]
+
+    def _fetch_insights(self, media_ids: List[str]) -> Dict[str, Dict[str, int]]:
+        """
+        Insights of many media in one request. A media id the metrics do not apply to fails the
+        whole request, so a failing batch is split in halves to isolate it.
+        """
+        fields = f"insights.metric({','.join(self.metrics)})"
+        try:
+            result = self.graph.get('', priority=BACKGROUND, ids=','.join(media_ids), fields=fields)
+        except GraphAPIError as e:
+            if e.transient:
+                raise
+            if len(media_ids) == 1:
+                logging.warning(f"No insights for media {media_ids[0]}: {e}")
+                return {media_ids[0]: {}}  # Stored as fetched, so it is not asked for again
+            middle = len(media_ids) // 2
+            return dict(self._fetch_insights(media_ids[:middle]), **self._fetch_insights(media_ids[middle:]))
+
+        insights = {}
+        for media_id, item in result.items():
+            entries = (item.get('insights') or {}).get('data', [])
+            insights[media_id] = {entry['name']: _metric_value(entry) for entry in entries}
+        return insights
+
+    def _store_insights(self, insights: Dict[str, Dict[str, int]]):
+        now = time.time()
+        with self._lock, self._connect() as db:
+            db.executemany(
+                """INSERT INTO insights (media_id, metric, value, fetched_at) VALUES (?, ?, ?, ?)
+                   ON CONFLICT(media_id, metric) DO UPDATE SET value = excluded.value, fetched_at = excluded.fetched_at""",
+                [(media_id, metric, value, now) for media_id, values in insights.items() for metric, value in values.items()])
+            db.executemany("UPDATE media SET insights_fetched_at = ? WHERE id = ?", [(now, media_id) for media_id in insights])
+
+    def collect(self) -> Dict[str, int]:
+        """List new media, then fetch insights in batches. Returns {'new_media', 'refreshed'}."""
+        started = time.time()
+        media = self.list_new_media()
+        self._store_media(media)
+
+        media_ids = self.media_to_refresh()
+        refreshed = 0
+        for start in range(0, len(media_ids), INSIGHTS_BATCH_SIZE):
+            insights = self._fetch_insights(media_ids[start:start + INSIGHTS_BATCH_SIZE])
+            self._store_insights(insights)
+            refreshed += len(insights)
+
+        logging.info(f"Insights: {len(media)} new media, {refreshed} refreshed in "
+                     f"{-(-len(media_ids) // INSIGHTS_BATCH_SIZE)} request(s), {time.time() - started:.1f}s")
+        return {'new_media': len(media), 'refreshed': refreshed}
+
+    def top_media(self, metric: str, limit: int = 10) -> List[tuple]:
+        """[(media_id, timestamp, value)] with the highest value of `metric`."""
+        with self._connect() as db:
+            return db.execute("""SELECT m.id, m.timestamp, i.value FROM insights i JOIN media m ON m.id = i.media_id
+                                 WHERE m.account = ? AND i.metric = ? ORDER BY i.value DESC LIMIT ?""",
+                              (self.ig_user_id, metric, limit)).fetchall()
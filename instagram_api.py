@@ -5,14 +5,18 @@ Handles automatic posting to Instagram Business accounts
 
 import os
 import json
-import requests
 import logging
 from datetime import datetime
 from typing import Optional, Dict, Any
 import time
 
+from graph_client import GraphClient, GraphAPIError
+from graph_usage import BACKGROUND
+from credential_check import CredentialCheck
+
 class InstagramAPI:
-    def __init__(self, access_token: str, ig_user_id: str, upload_to_drive=None, drive_service=None):
+    def __init__(self, access_token: str, ig_user_id: str, upload_to_drive=None, drive_service=None,
+                 validate: bool = True, graph: GraphClient = None):
         """
         Initialize Instagram API client
         Args:
@@ -20,61 +24,42 @@ class InstagramAPI:
             ig_user_id: Instagram Business Account ID
             upload_to_drive: Function to upload files to Google Drive
             drive_service: Google Drive service instance
+            validate: Start checking the credentials in the background now (publishing waits for
+                the result); pass False to check them later with validate_credentials()
+            graph: Shared Graph client to use (e.g. one following a TokenManager's refreshed token)
         """
         self.access_token = access_token
         self.ig_user_id = ig_user_id
-        self.base_url = "https://graph.facebook.com/v18.0"
+        self.graph = graph or GraphClient(access_token)
+        self.base_url = self.graph.url('').rstrip('/')
         self.upload_to_drive = upload_to_drive
         self.drive_service = drive_service
-        # Validate credentials
-        if not self.validate_credentials():
-            raise ValueError("Invalid Instagram API credentials")
+        self.credential_check = CredentialCheck(self.graph, ig_user_id)
+        if validate:
+            self.credential_check.start()
     
-    def validate_credentials(self) -> bool:
-        """Validate the access token and Instagram user ID."""
+    def validate_credentials(self, timeout: float = None) -> bool:
+        """Validate the access token and Instagram user ID (cached; waits for a running background check)."""
         try:
-            url = f"{self.base_url}/{self.ig_user_id}"
-            params = {
-                'fields': 'id,username',
-                'access_token': self.access_token
-            }
-            
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            
-            data = response.json()
-            if 'error' in data:
-                logging.error(f"Instagram API Error: {data['error']}")
-                return False
-            
-            logging.info(f"✅ Instagram API validated for user: {data.get('username', 'Unknown')}")
-            return True
-            
+            return self.credential_check.wait(timeout)
         except Exception as e:
             logging.error(f"❌ Failed to validate Instagram credentials: {e}")
             return False
     
-    def upload_video(self, video_path: str, caption: str = "") -> Optional[str]:
-        # TEST MODE: Use a provided public video URL instead of uploading
+    def upload_video(self, video_url: str, caption: str = "") -> Optional[str]:
+        """
+        Create a Reels media container for a publicly reachable video URL
+        Returns:
+            Media container ID, or None on failure
+        """
         try:
-            logging.info(f"[TEST] Using provided public video URL for upload: {video_path}")
-            public_url = ""
-            url = f"{self.base_url}/{self.ig_user_id}/media"
-            data = {
-                'video_url': public_url,
-                'caption': caption,
-                'access_token': self.access_token,
-                'media_type': 'REELS'
-            }
-            response = requests.post(url, data=data)
-            response.raise_for_status()
-            result = response.json()
-            if 'error' in result:
-                logging.error(f"Instagram API Error: {result['error']}")
-                return None
-            media_id = result.get('id')
+            logging.info(f"Creating media container for: {video_url}")
+            media_id = self.graph.create_video_container(self.ig_user_id, video_url, caption)
             logging.info(f"Video uploaded successfully. Media ID: {media_id}")
             return media_id
+        except GraphAPIError as e:
+            logging.error(f"Instagram API Error: {e}")
+            return None
         except Exception as e:
             logging.error(f"Failed to upload video: {e}")
             return None
@@ -89,25 +74,12 @@ class InstagramAPI:
         """
         try:
             logging.info(f"Publishing video with media ID: {media_id}")
-
-            url = f"{self.base_url}/{self.ig_user_id}/media_publish"
-            data = {
-                'creation_id': media_id,
-                'access_token': self.access_token
-            }
-
-            response = requests.post(url, data=data)
-            response.raise_for_status()
-
-            result = response.json()
-            if 'error' in result:
-                logging.error(f"Instagram API Error: {result['error']}")
-                return False
-
-            post_id = result.get('id')
+            post_id = self.graph.publish_container(self.ig_user_id, media_id)
             logging.info(f"Video published successfully! Post ID: {post_id}")
             return True
-
+        except GraphAPIError as e:
+            logging.error(f"Instagram API Error: {e}")
+            return False
         except Exception as e:
             logging.error(f"Failed to publish video: {e}")
             return False
@@ -163,40 +135,37 @@ class InstagramAPI:
             logging.error(f"❌ Failed to get Google Drive shareable URL: {e}")
             return None
     
-    def post_video(self, video_path: str, caption: str = "") -> bool:
+    def post_video(self, video_url: str, caption: str = "") -> bool:
         """
         Complete process: Upload and publish video to Instagram
         Args:
-            video_path: Path to the video file
+            video_url: Public URL of the video file
             caption: Caption for the post
         Returns:
             True if successful, False otherwise
         """
         try:
-            logging.info(f"Starting Instagram posting process for: {video_path}")
+            logging.info(f"Starting Instagram posting process for: {video_url}")
+            if not self.validate_credentials():
+                return False
 
             # Step 1: Upload video (create media container)
-            media_id = self.upload_video(video_path, caption)
+            media_id = self.upload_video(video_url, caption)
             if not media_id:
                 return False
 
             # Step 2: Poll for status
-            status = "IN_PROGRESS"
-            status_code = None
-            for i in range(12):  # Try for up to 2 minutes (12 x 10s)
-                status_url = f"{self.base_url}/{media_id}?fields=status_code&access_token={self.access_token}"
-                status_resp = requests.get(status_url)
-                status_code = status_resp.json().get("status_code")
-                logging.info(f"Check {i+1}: status_code = {status_code}")
-                if status_code == "FINISHED":
-                    break
-                elif status_code == "ERROR":
-                    logging.error(f"Instagram processing error: {status_resp.json()}")
-                    return False
-                time.sleep(10)
-            if status_code != "FINISHED":
+            try:
+                ready = self.graph.wait_for_container(media_id)
+            except GraphAPIError as e:
+                logging.error(f"Instagram processing error: {e}")
+                return False
+            if not ready:
                 logging.error("Media was not ready after waiting.")
                 return False
+            if ready == 'PUBLISHED':
+                logging.warning("Media container is already published, not publishing it again")
+                return True
 
             # Step 3: Publish video
             success = self.publish_video(media_id)
@@ -211,19 +180,34 @@ class InstagramAPI:
             logging.error(f"Instagram posting failed: {e}")
             return False
     
+    def post_local_video(self, video_path: str, caption: str = "") -> bool:
+        """
+        Post a local video with Instagram's resumable upload (no public URL needed)
+        Args:
+            video_path: Path of the rendered video
+            caption: Caption for the post
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            logging.info(f"Starting direct Instagram upload of: {video_path}")
+            if not self.validate_credentials():
+                return False
+            media_id = self.graph.publish_video(self.ig_user_id, caption=caption, video_path=video_path)
+            if not media_id:
+                return False
+            logging.info("Instagram post completed successfully!")
+            return True
+
+        except Exception as e:
+            logging.error(f"Instagram posting failed: {e}")
+            return False
+
     def get_account_info(self) -> Dict[str, Any]:
         """Get Instagram account information."""
         try:
-            url = f"{self.base_url}/{self.ig_user_id}"
-            params = {
-                'fields': 'id,username,account_type,followers_count,media_count',
-                'access_token': self.access_token
-            }
-            
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            
-            return response.json()
+            return self.graph.get(self.ig_user_id, priority=BACKGROUND,
+                                  fields='id,username,account_type,followers_count,media_count')
             
         except Exception as e:
             logging.error(f"❌ Failed to get account info: {e}")
@@ -234,14 +218,9 @@ class InstagramAPI:
             logging.error("drive_service not provided to InstagramAPI.")
             return False
         try:
-            permission = {
-                'type': 'anyone',
-                'role': 'reader'
-            }
-            self.drive_service.permissions().create(
-                fileId=file_id,
-                body=permission
-            ).execute()
+            from drive_batch import make_files_public
+            if not make_files_public(self.drive_service, [file_id]):
+                return False
             logging.info(f"Set file {file_id} to public")
             return True
         except Exception as e:
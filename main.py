@@ -1,35 +1,27 @@
 import os
 import json
-import random
-import gspread
-import gspread.exceptions
-import pandas as pd
-from moviepy.editor import *
-from moviepy.config import change_settings
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
-import schedule
 import time
-from PIL import Image, ImageDraw, ImageFont
-import numpy as np
 from config import *
 from instagram_api import InstagramAPI
-import requests
-import io
-from video_creator import VideoCreator
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-import pickle
+from graph_client import GraphClient, GraphAPIError
+from publisher import MultiPublisher
+from token_manager import get_token_manager
+from insights import InsightsCollector
+from video_creator import VideoCreator, new_video_filename
+from quote_source import create_quote_source_from_config, missing_columns
+from music_cache import MusicCache
+from music_catalog import MusicCatalog
+from parallel import run_concurrently
+from drive_auth import get_oauth_drive_service, build_drive_service
+from drive_folders import FolderIdCache, resolve_folder, create_in_folder
+from drive_batch import make_files_public, delete_files, list_files
+from drive_upload import ResumableUploadManager, UploadIndex, upload_tag, growing_file_upload
+from state_store import file_md5
 
-# Configure MoviePy to use a different text rendering method
-try:
-    change_settings({"IMAGEMAGICK_BINARY": "magick"})
-except:
-    # If ImageMagick is not available, use PIL for text rendering
-    pass
+# Heavy client libraries (gspread, googleapiclient, google-auth, moviepy) are imported
+# inside the methods that use them so that importing this module stays cheap.
 
 # Setup logging
 logging.basicConfig(
@@ -52,7 +44,22 @@ class InstagramAIAgent:
         self.drive_service = None
         self.drive_folder_id = None
         self.instagram_api = None
+        # Tokens are refreshed before they expire; clients always read the current one
+        self.token_managers = [get_token_manager('main', INSTAGRAM_ACCESS_TOKEN)]
+        self.graph = GraphClient(token_provider=self.token_managers[0].token)
+        self.extra_accounts = []
+        for user_id, token in INSTAGRAM_EXTRA_ACCOUNTS:
+            manager = get_token_manager(user_id, token)
+            self.token_managers.append(manager)
+            self.extra_accounts.append((user_id, GraphClient(token_provider=manager.token)))
+        self.instagram_validated = False
+        self.instagram_folder_id = None
+        self.folder_cache = FolderIdCache()
         self.video_creator = VideoCreator()
+        self.music_cache = MusicCache() if MUSIC_CACHE_ENABLED else None
+        self.music_catalog = None
+        self.prefetcher = None  # Set by long-running schedulers (see enable_prefetch)
+        self.last_published_at = None  # When the last post went live (for publish lag)
         
         if USE_GOOGLE_DRIVE:
             self.setup_google_drive()
@@ -85,12 +92,23 @@ class InstagramAIAgent:
         except Exception as e:
             logging.error(f"Error saving progress: {e}")
     
+    def build_drive_service(self):
+        """Build a Drive API client from the service account (discovery document is cached locally)."""
+        from google.oauth2.service_account import Credentials
+        
+        scopes = ['https://www.googleapis.com/auth/drive']
+        credentials = Credentials.from_service_account_file(GOOGLE_CREDENTIALS_PATH, scopes=scopes)
+        return build_drive_service(credentials)
+    
+    def enable_prefetch(self):
+        """Prepare each next run in the background while the current one renders and publishes."""
+        from prefetch import Prefetcher
+        self.prefetcher = Prefetcher(self)
+    
     def setup_google_drive(self):
         """Setup Google Drive API for storing videos."""
         try:
-            scopes = ['https://www.googleapis.com/auth/drive']
-            credentials = Credentials.from_service_account_file(GOOGLE_CREDENTIALS_PATH, scopes=scopes)
-            self.drive_service = build('drive', 'v3', credentials=credentials)
+            self.drive_service = self.build_drive_service()
             
             # Create or find the folder
             self.drive_folder_id = self.get_or_create_drive_folder()
@@ -102,11 +120,13 @@ class InstagramAIAgent:
     def setup_instagram_api(self):
         """Setup Instagram API for posting."""
         try:
+            # Credentials are checked in the background (cached between runs); only publishing waits
             self.instagram_api = InstagramAPI(
                 INSTAGRAM_ACCESS_TOKEN,
                 INSTAGRAM_USER_ID,
                 upload_to_drive=self.upload_to_drive,
-                drive_service=self.drive_service
+                drive_service=self.drive_service,
+                graph=self.graph
             )
             if self.instagram_api:
                 logging.info("Instagram API setup complete")
@@ -117,24 +137,9 @@ class InstagramAIAgent:
             self.instagram_api = None
     
     def get_or_create_drive_folder(self):
-        """Get or create the Google Drive folder for videos."""
+        """Get or create the Google Drive folder for videos (cached in DRIVE_STATE_FILE)."""
         try:
-            # Search for existing folder
-            query = f"name='{DRIVE_FOLDER_NAME}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-            results = self.drive_service.files().list(q=query).execute()
-            files = results.get('files', [])
-            
-            if files:
-                return files[0]['id']
-            
-            # Create new folder
-            folder_metadata = {
-                'name': DRIVE_FOLDER_NAME,
-                'mimeType': 'application/vnd.google-apps.folder'
-            }
-            folder = self.drive_service.files().create(body=folder_metadata, fields='id').execute()
-            logging.info(f"Created Google Drive folder: {DRIVE_FOLDER_NAME}")
-            return folder.get('id')
+            return resolve_folder(self.drive_service, self.folder_cache, 'service_account', DRIVE_FOLDER_NAME)
         except Exception as e:
             logging.error(f"Error creating Drive folder: {e}")
             return None
@@ -148,17 +153,13 @@ class InstagramAIAgent:
         
         try:
             print(f"[Drive] Uploading '{filename}' to Google Drive...")
-            file_metadata = {
-                'name': filename,
-                'parents': [self.drive_folder_id]
-            }
-            
-            media = MediaFileUpload(file_path, resumable=True)
-            file = self.drive_service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id'
-            ).execute()
+            uploader = ResumableUploadManager(self.drive_service)
+            file = create_in_folder(
+                self.drive_service,
+                lambda folder_id: uploader.upload(file_path, {'name': filename}, folder_id),
+                self.drive_folder_id,
+                self.refresh_drive_folder
+            )
             print(f"[Drive] Upload complete! File ID: {file.get('id')}")
             logging.info(f"Uploaded to Google Drive: {filename} (ID: {file.get('id')})")
             return file.get('id')
@@ -167,76 +168,72 @@ class InstagramAIAgent:
             logging.error(f"Error uploading to Drive: {e}")
             return None
     
+    def refresh_drive_folder(self):
+        """Forget the cached service-account folder id and resolve it again."""
+        self.folder_cache.forget('service_account', DRIVE_FOLDER_NAME)
+        self.drive_folder_id = self.get_or_create_drive_folder()
+        return self.drive_folder_id
+    
     def get_drive_service_oauth(self):
-        """Authenticate and return a Google Drive service using OAuth2 (real user)."""
-        SCOPES = ['https://www.googleapis.com/auth/drive.file']
-        creds = None
-        if os.path.exists('token.pickle'):
-            with open('token.pickle', 'rb') as token:
-                creds = pickle.load(token)
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    'client_secret_260892241319-4m6pavuqufep653d9ucvmnt2e6gm95ad.apps.googleusercontent.com.json', SCOPES)
-                creds = flow.run_local_server(port=0)
-            with open('token.pickle', 'wb') as token:
-                pickle.dump(creds, token)
-        return build('drive', 'v3', credentials=creds)
+        """Return the shared Google Drive service authenticated with OAuth2 (real user)."""
+        return get_oauth_drive_service()
 
     def get_or_create_instagram_folder_oauth(self):
-        """Get or create the 'Instagram AI Videos' folder in Google Drive."""
+        """Get or create the 'Instagram AI Videos' folder in Google Drive (cached in DRIVE_STATE_FILE)."""
         try:
             service = self.get_drive_service_oauth()
-            # Search for existing folder
-            query = "name='Instagram AI Videos' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-            results = service.files().list(q=query, fields="files(id, name)").execute()
-            files = results.get('files', [])
-            
-            if files:
-                folder_id = files[0]['id']
-                logging.info(f"Found existing folder: Instagram AI Videos (ID: {folder_id})")
-                return folder_id
-            
-            # Create new folder
-            folder_metadata = {
-                'name': 'Instagram AI Videos',
-                'mimeType': 'application/vnd.google-apps.folder'
-            }
-            folder = service.files().create(body=folder_metadata, fields='id').execute()
-            folder_id = folder.get('id')
-            logging.info(f"Created new folder: Instagram AI Videos (ID: {folder_id})")
-            return folder_id
+            return resolve_folder(service, self.folder_cache, 'oauth', DRIVE_FOLDER_NAME)
         except Exception as e:
             logging.error(f"Error creating/finding Instagram folder: {e}")
             return None
 
-    def upload_to_drive_oauth(self, file_path, filename):
-        """Upload video to Google Drive using OAuth2 (real user) in the Instagram AI Videos folder."""
+    def upload_to_drive_oauth(self, file_path, filename, tag=None, media=None):
+        """
+        Upload video to Google Drive using OAuth2 (real user) in the Instagram AI Videos folder.
+        `tag` identifies the render, so an upload interrupted by a restart resumes where it stopped.
+        `media` is a growing_file_upload() when the video is uploaded while it is being encoded.
+        """
         try:
             service = self.get_drive_service_oauth()
             
-            # Get or create the Instagram AI Videos folder
-            folder_id = self.get_or_create_instagram_folder_oauth()
+            # Get or create the Instagram AI Videos folder (usually already looked up at startup)
+            folder_id = self.instagram_folder_id or self.lookup_instagram_folder()
             if not folder_id:
                 logging.error("Could not find or create Instagram AI Videos folder")
                 return None
             
-            file_metadata = {
-                'name': filename,
-                'parents': [folder_id]  # Upload to the specific folder
-            }
-            media = MediaFileUpload(file_path, resumable=True)
-            file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
+            # A byte-identical video that is already in the folder is reused instead of uploaded
+            upload_index = UploadIndex()
+            if media is None:
+                md5, size = file_md5(file_path), os.path.getsize(file_path)
+                existing = upload_index.find(service, md5, size, folder_id)
+                if existing:
+                    logging.info(f"Identical video already on Google Drive: {existing['name']} (ID: {existing['file_id']}), skipping upload")
+                    print(f"[Drive-OAuth] Reusing identical upload! File ID: {existing['file_id']}")
+                    if not existing.get('public') and self.make_drive_file_public(existing['file_id']):
+                        upload_index.mark_public(md5)
+                    return existing['file_id']
+            
+            # A stale cached folder id is detected and refreshed by create_in_folder
+            uploader = ResumableUploadManager(service)
+            file = create_in_folder(
+                service,
+                lambda target_folder_id: uploader.upload(file_path, {'name': filename}, target_folder_id, tag,
+                                                         media=media),
+                folder_id,
+                self.refresh_instagram_folder
+            )
             
             file_id = file.get('id')
             logging.info(f"Uploaded to Google Drive (OAuth): {filename} (ID: {file_id}) in Instagram AI Videos folder")
             print(f"[Drive-OAuth] Upload complete! File ID: {file_id}")
             
             # Make the file public for Instagram API access
-            self.make_drive_file_public(file_id)
+            public = self.make_drive_file_public(file_id)
             
+            if media is not None:
+                md5, size = file_md5(file_path), os.path.getsize(file_path)
+            upload_index.add(md5, size, self.instagram_folder_id or folder_id, file_id, filename, public)
             return file_id
         except Exception as e:
             print(f"[Drive-OAuth] Error uploading to Drive: {e}")
@@ -247,14 +244,8 @@ class InstagramAIAgent:
         """Make a Google Drive file publicly accessible."""
         try:
             service = self.get_drive_service_oauth()
-            permission = {
-                'type': 'anyone',
-                'role': 'reader'
-            }
-            service.permissions().create(
-                fileId=file_id,
-                body=permission
-            ).execute()
+            if not make_files_public(service, [file_id]):
+                return False
             logging.info(f"Made file {file_id} public")
             return True
         except Exception as e:
@@ -282,6 +273,8 @@ class InstagramAIAgent:
     def list_available_sheets(self):
         """List all available Google Sheets to help debug sheet access."""
         try:
+            import gspread
+            
             gc = gspread.service_account(filename=GOOGLE_CREDENTIALS_PATH)
             all_sheets = gc.openall()
             
@@ -298,74 +291,128 @@ class InstagramAIAgent:
         except Exception as e:
             logging.error(f"Error listing sheets: {e}")
     
-    def get_quotes_from_sheet(self):
-        """Fetch quotes from Google Sheets."""
+    def get_quote_source(self):
+        """Return the quote source selected by QUOTE_SOURCE in config.py, or None if it cannot be loaded."""
+        label = f"Quote file '{QUOTE_FILE_PATH}'" if QUOTE_SOURCE == 'file' else "Google Sheet"
         try:
-            gc = gspread.service_account(filename=GOOGLE_CREDENTIALS_PATH)
-            worksheet = gc.open(SHEET_NAME).get_worksheet(SHEET_WORKSHEET_INDEX)
-            records = worksheet.get_all_records()
-            df = pd.DataFrame(records)
-            
-            # Check if we have the required columns
-            required_columns = ['Quote', 'Author']
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            
-            if missing_columns:
-                logging.error(f"Missing required columns in Google Sheet: {missing_columns}")
-                logging.info(f"Available columns: {list(df.columns)}")
-                logging.info("Please ensure your Google Sheet has columns named 'Quote' and 'Author'")
-                return None
-            
-            if df.empty:
-                logging.error("Google Sheet is empty. Please add some quotes.")
-                return None
-            
-            logging.info(f"Successfully fetched {len(df)} quotes from Google Sheets.")
-            logging.info(f"Columns found: {list(df.columns)}")
-            return df
-            
-        except gspread.exceptions.APIError as e:
-            logging.error(f"Google Sheets API Error: {e}")
+            quote_source = create_quote_source_from_config()
+        except Exception as e:
+            self.log_quote_source_error(e)
             return None
-        except gspread.exceptions.SpreadsheetNotFound:
+        return self.validate_quote_source(quote_source, label)
+    
+    def log_quote_source_error(self, error):
+        """Explain why the configured quote source could not be opened."""
+        if QUOTE_SOURCE == 'file':
+            if isinstance(error, FileNotFoundError):
+                logging.error(f"Quote file '{QUOTE_FILE_PATH}' not found.")
+            else:
+                logging.error(f"Error opening quote file: {error}")
+            return
+        
+        import gspread.exceptions
+        
+        if isinstance(error, gspread.exceptions.APIError):
+            logging.error(f"Google Sheets API Error: {error}")
+        elif isinstance(error, gspread.exceptions.SpreadsheetNotFound):
             logging.error(f"Google Sheet '{SHEET_NAME}' not found. Please check the sheet name.")
-            return None
-        except gspread.exceptions.WorksheetNotFound:
+        elif isinstance(error, gspread.exceptions.WorksheetNotFound):
             logging.error(f"Worksheet not found in '{SHEET_NAME}'. Please check the worksheet index.")
-            return None
-        except FileNotFoundError:
+        elif isinstance(error, FileNotFoundError):
             logging.error(f"Credentials file '{GOOGLE_CREDENTIALS_PATH}' not found.")
-            return None
-        except Exception as e:
-            logging.error(f"Error connecting to Google Sheets: {e}")
+        else:
+            logging.error(f"Error connecting to Google Sheets: {error}")
             logging.info("Please check:")
             logging.info("1. Your credentials.json file exists and is valid")
             logging.info("2. The Google Sheet name is correct")
             logging.info("3. The sheet is shared with your service account email")
+    
+    def validate_quote_source(self, quote_source, label):
+        """Check that a quote source has the required columns and at least one quote."""
+        missing = missing_columns(quote_source)
+        if quote_source.columns and missing:
+            logging.error(f"Missing required columns in {label}: {missing}")
+            logging.info(f"Available columns: {quote_source.columns}")
+            logging.info("Please ensure your quotes have columns named 'Quote' and 'Author'")
+            quote_source.close()
+            return None
+        
+        if quote_source.empty:
+            logging.error(f"{label} is empty. Please add some quotes.")
+            quote_source.close()
+            return None
+        
+        logging.info(f"Successfully loaded {len(quote_source)} quotes from {label}.")
+        logging.info(f"Columns found: {quote_source.columns}")
+        return quote_source
+    
+    def load_dedup_index(self, quote_source):
+        """Load (or build at ingestion) the near-duplicate index for the quote catalog."""
+        if not DEDUP_QUOTES:
+            return None
+        try:
+            from quote_dedup import load_or_build_index
+            return load_or_build_index(quote_source)
+        except Exception as e:
+            logging.warning(f"Duplicate quote detection unavailable: {e}")
             return None
     
-    def get_sequential_quote(self, quotes_df):
-        """Get the next quote in sequence."""
-        if quotes_df is None or quotes_df.empty:
+    def precompute_layouts(self, quote_source):
+        """
+        Lay out every quote for every preset (cached) and return the indexes of quotes
+        that do not fit the frame with the active settings.
+        """
+        if not PRECOMPUTE_LAYOUTS:
+            return set()
+        try:
+            from text_layout import precompute_layouts
+            unfit = precompute_layouts(quote_source)
+            return {item['index'] for item in unfit if item['preset'] == 'default'}
+        except Exception as e:
+            logging.warning(f"Layout precomputation failed: {e}")
+            return set()
+    
+    def find_quote_index(self, quote_source, quote_index, dedup_index=None, unfit_quotes=None, log_skips=False):
+        """First usable quote index at or after quote_index (wrapping), skipping near-duplicates and unfit quotes."""
+        if quote_index >= len(quote_source):
+            quote_index = 0
+        
+        for _ in range(len(quote_source)):
+            original = dedup_index.duplicate_of(quote_index) if dedup_index is not None else None
+            if original is not None:
+                if log_skips:
+                    logging.info(f"Skipping quote {quote_index}: near-duplicate of quote {original}")
+            elif SKIP_UNFIT_QUOTES and unfit_quotes and quote_index in unfit_quotes:
+                if log_skips:
+                    logging.info(f"Skipping quote {quote_index}: layout does not fit the frame")
+            else:
+                break
+            quote_index = (quote_index + 1) % len(quote_source)
+        return quote_index
+    
+    def get_sequential_quote(self, quote_source, dedup_index=None, unfit_quotes=None):
+        """Get the next quote in sequence, skipping near-duplicates and quotes that don't fit."""
+        if quote_source is None or quote_source.empty:
             return None, None
         
-        quote_index = self.progress_data['quote_index']
-        if quote_index >= len(quotes_df):
+        if self.progress_data['quote_index'] >= len(quote_source):
             # Reset to beginning if we've used all quotes
-            quote_index = 0
             self.progress_data['quote_index'] = 0
+        quote_index = self.find_quote_index(quote_source, self.progress_data['quote_index'],
+                                            dedup_index, unfit_quotes, log_skips=True)
         
-        quote_row = quotes_df.iloc[quote_index]
+        quote_row = quote_source.get(quote_index)
         quote = quote_row['Quote']
         author = quote_row['Author']
         
         # Move to next quote
-        self.progress_data['quote_index'] = (quote_index + 1) % len(quotes_df)
+        self.progress_data['quote_index'] = (quote_index + 1) % len(quote_source)
         
         return quote, author
     
-    def get_sequential_music(self):
-        """Get the next music file from Google Drive."""
+    def get_sequential_music(self, progress=None):
+        """Get the next music file from Google Drive, advancing music_index in `progress` (default: progress_data)."""
+        progress = self.progress_data if progress is None else progress
         try:
             music_files = self.list_drive_music_files()
             if not music_files:
@@ -373,21 +420,28 @@ class InstagramAIAgent:
                 return None
 
             music_files.sort(key=lambda x: x['name'])  # Consistent order
-            music_index = self.progress_data['music_index']
+            music_index = progress['music_index']
 
             if music_index >= len(music_files):
                 music_index = 0
-                self.progress_data['music_index'] = 0
+                progress['music_index'] = 0
 
             selected_file = music_files[music_index]
-            temp_path = f"temp_{selected_file['name']}"
-            self.download_drive_file(selected_file['id'], temp_path)
+            if self.music_cache:
+                music_path = self.music_cache.fetch(self.drive_service, selected_file)
+            else:
+                music_path = self.download_drive_file(selected_file['id'], f"temp_{selected_file['name']}")
+            if not music_path:
+                return None
+            duration = self.music_catalog.record_duration(selected_file['id'], music_path)
+            if duration is not None and duration < VIDEO_DURATION_SECONDS:
+                logging.warning(f"{selected_file['name']} is only {duration:.1f}s long (video is {VIDEO_DURATION_SECONDS}s)")
 
             # Move to next music
-            self.progress_data['music_index'] = (music_index + 1) % len(music_files)
+            progress['music_index'] = (music_index + 1) % len(music_files)
 
-            logging.info(f"Selected Music: {temp_path}")
-            return temp_path
+            logging.info(f"Selected Music: {music_path}")
+            return music_path
         except Exception as e:
             logging.error(f"Error selecting music: {e}")
             return None
@@ -422,6 +476,17 @@ class InstagramAIAgent:
             print("[Instagram] Preparing to post to Instagram...")
             logging.info("Posting to Instagram with caption: ...")
             
+            if INSTAGRAM_DIRECT_UPLOAD:
+                print("[Instagram] Uploading video directly to Instagram...")
+                success = self.instagram_api.post_local_video(video_path, caption)
+                if success:
+                    print("[Instagram] 🎉 Successfully posted to Instagram!")
+                    logging.info("Successfully posted to Instagram!")
+                else:
+                    print("[Instagram] ❌ Failed to post to Instagram.")
+                    logging.error("Failed to post to Instagram")
+                return success
+            
             file_id = self.upload_to_drive(video_path, os.path.basename(video_path))
             if not file_id:
                 print("[Drive] Failed to upload video to Google Drive.")
@@ -471,54 +536,193 @@ class InstagramAIAgent:
         # If all times have passed today, return first time tomorrow
         return int(OPTIMAL_POSTING_TIMES[0].split(':')[0]), int(OPTIMAL_POSTING_TIMES[0].split(':')[1])
     
+    def load_quotes(self):
+        """
+        Return (quote_source, dedup_index, unfit_quotes), using the catalog prepared in the
+        background by the previous run when prefetching. Returns None if no quotes are available.
+        """
+        prepared = self.prefetcher.take() if self.prefetcher else None
+        if prepared:
+            logging.info("Using quotes prefetched by the previous run")
+            return prepared['quote_source'], prepared['dedup_index'], prepared['unfit_quotes']
+        
+        quote_source = self.get_quote_source()
+        if quote_source is None or quote_source.empty:
+            return None
+        return quote_source, self.load_dedup_index(quote_source), self.precompute_layouts(quote_source)
+    
+    def validate_instagram_api(self):
+        """
+        Wait for the background credential check and store its result; publishing is gated on it.
+        A check that failed or did not finish in time is waited on (or run) again next time.
+        """
+        if self.instagram_validated:
+            return True
+        if not self.instagram_api:
+            return False
+        self.instagram_validated = self.instagram_api.validate_credentials(STARTUP_TIMEOUTS['instagram'])
+        if not self.instagram_validated:
+            logging.warning("Instagram API validation failed - not publishing")
+        return self.instagram_validated
+    
+    def refresh_access_tokens(self):
+        """Exchange any access token that is close to expiring for a fresh long-lived one."""
+        return [manager.refresh_if_needed() for manager in self.token_managers]
+    
+    def lookup_instagram_folder(self):
+        self.instagram_folder_id = self.get_or_create_instagram_folder_oauth()
+        return self.instagram_folder_id
+    
+    def refresh_instagram_folder(self):
+        """Forget the cached upload folder id and resolve it again."""
+        self.folder_cache.forget('oauth', DRIVE_FOLDER_NAME)
+        return self.lookup_instagram_folder()
+    
+    def run_startup_tasks(self):
+        """
+        Fetch quotes, music and the Drive upload folder concurrently (credentials are checked in the background).
+        A task that times out keeps running in its thread, so tasks only write to private state
+        that is merged into the agent once they have finished in time.
+        """
+        music_progress = dict(self.progress_data)
+        tasks = {
+            'quotes': (self.load_quotes, STARTUP_TIMEOUTS['quotes']),
+            'music': (lambda: self.get_sequential_music(music_progress), STARTUP_TIMEOUTS['music']),
+        }
+        if ENABLE_INSTAGRAM_POSTING:
+            tasks['tokens'] = (self.refresh_access_tokens, STARTUP_TIMEOUTS['tokens'])
+        if UPLOAD_TO_DRIVE and not self.instagram_folder_id:
+            tasks['drive_folder'] = (self.get_or_create_instagram_folder_oauth, STARTUP_TIMEOUTS['drive_folder'])
+        ready = run_concurrently(tasks)
+        
+        if ready.get('music'):
+            self.progress_data['music_index'] = music_progress['music_index']
+        if ready.get('drive_folder'):
+            self.instagram_folder_id = ready['drive_folder']
+        return ready
+    
+    def render_and_stream_upload(self, quote, author, music_file, effect):
+        """
+        Encode a fragmented MP4 and upload it to Drive at the same time, sending each chunk
+        as soon as the encoder has written it. Returns (video_filename, drive_id); drive_id is
+        None if the streamed upload failed (the caller then uploads the finished file).
+        """
+        import threading
+        
+        video_filename = new_video_filename()
+        media = growing_file_upload(video_filename, ResumableUploadManager().chunk_size)
+        result = {}
+        
+        def upload():
+            result['drive_id'] = self.upload_to_drive_oauth(video_filename, video_filename, media=media)
+        
+        uploader = threading.Thread(target=upload, name='stream-upload', daemon=True)
+        uploader.start()
+        rendered = None
+        try:
+            rendered = self.video_creator.create_video_with_pil_text_and_blur_keyframe(
+                quote, author, music_file, effect, filename=video_filename, fragmented=True
+            )
+        finally:
+            media.finish(success=bool(rendered))
+            uploader.join()
+        return rendered, result.get('drive_id')
+    
     def create_video(self):
         """Main function to create a video."""
+        prepared = self.prepare_post()
+        if not prepared:
+            return False
+        return self.publish_prepared_post(prepared)
+    
+    def prepare_post(self, create_containers=False):
+        """
+        Everything that can happen before a posting slot: pick the pair, render and upload the
+        video and, with create_containers, create the Instagram containers and wait until they
+        are FINISHED. Returns the prepared post for publish_prepared_post(), or None on failure.
+        The quote, music and effect indexes only move on when preparing succeeds, so a retry
+        picks the same pair instead of skipping it.
+        """
+        progress = dict(self.progress_data)
+        prepared = None
+        try:
+            prepared = self.build_post(create_containers)
+        finally:
+            if not prepared:
+                self.progress_data.clear()
+                self.progress_data.update(progress)
+        return prepared
+    
+    def build_post(self, create_containers=False):
+        """The steps of prepare_post(); advances the progress indexes as it picks the pair."""
         logging.info("Starting Instagram AI Agent...")
         
         # Check weekly reset
         self.check_weekly_reset()
         
-        # Get quotes
-        quotes_df = self.get_quotes_from_sheet()
-        if quotes_df is None or quotes_df.empty:
+        # Independent startup I/O runs concurrently; rendering starts once all of it is ready
+        ready = self.run_startup_tasks()
+        
+        quotes = ready.get('quotes')
+        if not quotes:
             logging.error("Could not fetch quotes. Exiting.")
-            return False
+            return None
+        quote_source, dedup_index, unfit_quotes = quotes
         
         # Get sequential quote and music
-        quote, author = self.get_sequential_quote(quotes_df)
+        quote, author = self.get_sequential_quote(quote_source, dedup_index, unfit_quotes)
         if not quote or not author:
             logging.error("Could not get quote. Exiting.")
-            return False
+            return None
         
-        music_file = self.get_sequential_music()
+        music_file = ready.get('music')
         if not music_file:
             logging.error("Could not get music file. Exiting.")
-            return False
+            return None
         
         logging.info(f"Selected Quote: '{quote}' by {author}")
         
+        # The pair is chosen, so the next run's inputs can be fetched while this one renders
+        if self.prefetcher:
+            self.prefetcher.start()
+        
         # --- Effect cycling logic ---
         from config import AVAILABLE_EFFECTS
         effect_index = self.progress_data.get('effect_index', 0)
         effect = AVAILABLE_EFFECTS[effect_index % len(AVAILABLE_EFFECTS)]
         self.progress_data['effect_index'] = (effect_index + 1) % len(AVAILABLE_EFFECTS)
         # --- Video creation with keyframe logic ---
-        logging.info(f"Creating video with effect: {effect}")
-        video_filename = self.video_creator.create_video_with_pil_text_and_blur_keyframe(
-            quote, author, music_file, effect
-        )
+        # A restart mid-upload leaves the same pair selected (progress is saved at the end),
+        # so a finished render with a pending upload is reused instead of rendered again
+        render_tag = upload_tag(quote, author, os.path.basename(music_file), effect,
+                                VIDEO_WIDTH, VIDEO_HEIGHT, VIDEO_DURATION_SECONDS)
+        # With direct upload the local file goes straight to Instagram and Drive is skipped
+        use_drive = UPLOAD_TO_DRIVE and not INSTAGRAM_DIRECT_UPLOAD
+        pending_upload = ResumableUploadManager().pending(render_tag) if use_drive else None
+        drive_id = None
+        if pending_upload:
+            video_filename = pending_upload['file_path']
+            logging.info(f"Reusing rendered video with an interrupted upload: {video_filename}")
+        elif use_drive and STREAM_UPLOAD_WHILE_ENCODING:
+            logging.info(f"Creating video with effect: {effect} (uploading while encoding)")
+            video_filename, drive_id = self.render_and_stream_upload(quote, author, music_file, effect)
+        else:
+            logging.info(f"Creating video with effect: {effect}")
+            video_filename = self.video_creator.create_video_with_pil_text_and_blur_keyframe(
+                quote, author, music_file, effect
+            )
         if not video_filename:
             logging.error("Video creation failed.")
-            return False
+            return None
         
         logging.info(f"Video created successfully: {video_filename}")
         logging.info(f"Quote: '{quote}' by {author}")
         
-        # Upload to Google Drive if enabled
-        drive_id = None
+        # Upload to Google Drive if enabled (already done when streamed during encoding)
         public_url = None
-        if UPLOAD_TO_DRIVE:
-            drive_id = self.upload_to_drive_oauth(video_filename, video_filename)
+        if use_drive:
+            if not drive_id:
+                drive_id = self.upload_to_drive_oauth(video_filename, video_filename, tag=render_tag)
             if drive_id:
                 logging.info(f"Video uploaded to Google Drive with ID: {drive_id}")
                 # Make file public and get the link (optional, for OAuth you may need to set permissions)
@@ -526,119 +730,149 @@ class InstagramAIAgent:
                 public_url = f"https://drive.google.com/uc?id={drive_id}&export=download"
                 print("Public video URL:", public_url)
         
-        # Use test1.py style Instagram posting with the generated public_url
-        if public_url:
-            IG_USER_ID = INSTAGRAM_USER_ID
-            ACCESS_TOKEN = INSTAGRAM_ACCESS_TOKEN
-            VIDEO_URL = public_url
-            CAPTION = self.create_instagram_caption(quote, author)
-            # 1. Create media container
-            media_container_url = f'https://graph.facebook.com/v19.0/{IG_USER_ID}/media'
-            media_container_payload = {
-                'media_type': 'REELS',
-                'video_url': VIDEO_URL,
-                'caption': CAPTION,
-                'access_token': ACCESS_TOKEN
-            }
-            media_container_resp = requests.post(media_container_url, data=media_container_payload)
-            print('Media container response:', media_container_resp.json())
-            container_id = media_container_resp.json().get('id')
-            print('Container ID:', container_id)
-            # 2. Poll for status
-            status_url = f'https://graph.facebook.com/v19.0/{container_id}?fields=status_code&access_token={ACCESS_TOKEN}'
-            while True:
-                status_resp = requests.get(status_url)
-                status = status_resp.json().get('status_code')
-                print('Status:', status)
-                if status == 'FINISHED':
-                    break
-                elif status == 'ERROR':
-                    print('Error:', status_resp.json())
-                    return False
-                time.sleep(5)
-            # 3. Publish media
-            publish_url = f'https://graph.facebook.com/v19.0/{IG_USER_ID}/media_publish'
-            publish_payload = {
-                'creation_id': container_id,
-                'access_token': ACCESS_TOKEN
-            }
-            publish_resp = requests.post(publish_url, data=publish_payload)
-            print('Publish response:', publish_resp.json())
+        prepared = {
+            'quote': quote, 'author': author, 'quote_source': quote_source, 'music_file': music_file,
+            'video_filename': video_filename, 'drive_id': drive_id, 'public_url': public_url,
+            'caption': self.create_instagram_caption(quote, author),
+            'video_size': os.path.getsize(video_filename) if os.path.exists(video_filename) else None,
+            'video_path': video_filename if INSTAGRAM_DIRECT_UPLOAD else None,
+            'publisher': None,
+        }
+        if create_containers and (public_url or INSTAGRAM_DIRECT_UPLOAD):
+            prepared['publisher'] = self.prepare_containers(prepared)
+        return prepared
+    
+    def publish_prepared_post(self, prepared):
+        """
+        Publish a post from prepare_post(): a single media_publish per account when its containers
+        were prepared, otherwise container, poll and publish now. Then record the post as done.
+        """
+        self.last_published_at = None
+        # Container, poll and publish for every account at once
+        if prepared['public_url'] or INSTAGRAM_DIRECT_UPLOAD:
+            if prepared['publisher']:
+                media_id = self.publish_prepared_containers(prepared['publisher'])
+            else:
+                media_id = self.publish_to_accounts(prepared['public_url'], prepared['caption'],
+                                                    prepared['video_size'], prepared['video_path'])
+            if not media_id:
+                return False
+            self.last_published_at = time.time()
+            print('Published media ID:', media_id)
             # Delete the video from Google Drive after successful Instagram post
-            if publish_resp.json().get('id') and drive_id:
-                self.delete_drive_file(drive_id)
-            # Delete the used quote from Google Sheets after successful Instagram post
-            if publish_resp.json().get('id') and MANAGE_QUOTES_IN_SHEET:
+            if prepared['drive_id']:
+                self.delete_drive_file(prepared['drive_id'])
+            # Delete the used quote from Google Sheets after successful Instagram post (file catalogs are read-only)
+            if MANAGE_QUOTES_IN_SHEET and QUOTE_SOURCE == 'google_sheets':
                 # Get the current quote index before it gets incremented
                 current_quote_index = self.progress_data['quote_index'] - 1
                 if current_quote_index < 0:
-                    current_quote_index = len(quotes_df) - 1  # Wrap around to last quote
+                    current_quote_index = len(prepared['quote_source']) - 1  # Wrap around to last quote
                 self.delete_quote_from_sheet(current_quote_index)
-            elif publish_resp.json().get('id'):
+            else:
                 print("[Sheets] Quote management disabled - quotes will be reused")
         
         # Save progress
         self.save_progress()
         
-        # Clean up the downloaded temp music file
+        # Clean up the downloaded temp music file (cached tracks are kept)
+        music_file = prepared['music_file']
         if music_file and music_file.startswith("temp_") and os.path.exists(music_file):
             os.remove(music_file)
             logging.info(f"Deleted temporary music file: {music_file}")
         
         return True
 
-    def post_video_direct_url(self, public_url, caption):
-        # Step 1: Create media container
-        media_url = f"https://graph.facebook.com/v18.0/{self.ig_user_id}/media"
-        params = {
-            "media_type": "REELS",
-            "video_url": public_url,
-            "caption": caption,
-            "access_token": self.access_token
-        }
-        resp = requests.post(media_url, data=params)
-        creation_id = resp.json().get("id")
-        if not creation_id:
-            logging.error(f"Failed to create media container: {resp.json()}")
-            return False
+    def account_publisher(self, public_url, caption, video_size=None, video_path=None):
+        """A MultiPublisher with the post queued for the main account and every extra account."""
+        publisher = MultiPublisher()
+        publisher.add(self.graph, INSTAGRAM_USER_ID, public_url, caption, video_size, 'main', video_path)
+        for user_id, graph in self.extra_accounts:
+            publisher.add(graph, user_id, public_url, caption, video_size, user_id, video_path)
+        return publisher
+    
+    def prepare_containers(self, prepared):
+        """
+        Create and process the containers ahead of the slot. Accounts whose container is not
+        ready get a new one at the slot (see publish_prepared_containers).
+        """
+        if ENABLE_INSTAGRAM_POSTING and not self.validate_instagram_api():
+            logging.error("Instagram credentials are not valid, not preparing containers")
+            return None
+        publisher = self.account_publisher(prepared['public_url'], prepared['caption'],
+                                           prepared['video_size'], prepared['video_path'])
+        if 'main' not in publisher.prepare():
+            logging.warning("The main account's container is not ready, a new one will be created at the slot")
+        return publisher
+    
+    def publish_prepared_containers(self, publisher):
+        """
+        Publish prepared containers (one media_publish each), then run the full flow again only
+        for the accounts that failed; returns the main account's media id.
+        """
+        results = publisher.publish_ready()
+        retry = publisher.requeue_failed()
+        if retry:
+            logging.warning(f"Creating new containers for {', '.join(retry)}")
+            results.update(publisher.run())
+        for label, media_id in results.items():
+            if label != 'main' and not media_id:
+                logging.warning(f"Publishing to extra account {label} failed")
+        return results.get('main')
+    
+    def publish_to_accounts(self, public_url, caption, video_size=None, video_path=None):
+        """
+        Publish one video to the main account and every INSTAGRAM_EXTRA_ACCOUNTS account, with
+        containers created and polled together. Pass `video_path` to upload the local file directly
+        instead of having Instagram fetch `public_url`. Returns the main account's media id (None on failure).
+        """
+        if ENABLE_INSTAGRAM_POSTING and not self.validate_instagram_api():
+            logging.error("Instagram credentials are not valid, not publishing")
+            return None
+        results = self.account_publisher(public_url, caption, video_size, video_path).run()
+        for label, media_id in results.items():
+            if label != 'main' and not media_id:
+                logging.warning(f"Publishing to extra account {label} failed")
+        return results.get('main')
 
-        # Step 2: Poll for status
-        for i in range(12):
-            status_url = f"https://graph.facebook.com/v18.0/{creation_id}?fields=status_code&access_token={self.access_token}"
-            status_resp = requests.get(status_url)
-            status_code = status_resp.json().get("status_code")
-            if status_code == "FINISHED":
-                break
-            elif status_code == "ERROR":
-                logging.error(f"Instagram processing error: {status_resp.json()}")
-                return False
-            time.sleep(10)
-        if status_code == "FINISHED":
-            publish_url = f"https://graph.facebook.com/v18.0/{self.ig_user_id}/media_publish"
-            params = {
-                "creation_id": creation_id,
-                "access_token": self.access_token
-            }
-            publish_resp = requests.post(publish_url, data=params)
-            logging.info(f"Publish response: {publish_resp.json()}")
-            return True
-        else:
-            logging.error("Media was not ready after waiting.")
+    def collect_insights(self):
+        """Store new media and fresh insights of every account in the local insights table."""
+        results = {}
+        for user_id, graph in [(INSTAGRAM_USER_ID, self.graph)] + self.extra_accounts:
+            try:
+                results[user_id] = InsightsCollector(graph, user_id).collect()
+            except GraphAPIError as e:
+                logging.error(f"Collecting insights for {user_id} failed: {e}")
+        return results
+
+    def post_video_direct_url(self, public_url, caption):
+        """Publish a video that is already at a public URL as a Reel."""
+        try:
+            media_id = self.graph.publish_video(INSTAGRAM_USER_ID, public_url, caption)
+            return media_id is not None
+        except GraphAPIError as e:
+            logging.error(f"Instagram publish failed: {e}")
             return False
 
     def list_drive_music_files(self):
-        """List all .mp3 files in the Google Drive music folder."""
+        """List all .mp3 files in the Google Drive music folder (from the synced local catalog)."""
         try:
-            query = f"'{DRIVE_MUSIC_FOLDER_ID}' in parents and mimeType='audio/mpeg' and trashed=false"
-            results = self.drive_service.files().list(q=query, fields="files(id, name)").execute()
-            return results.get('files', [])
+            if self.music_catalog is None:
+                self.music_catalog = MusicCatalog(self.drive_service)
+            self.music_catalog.sync()
+            return self.music_catalog.files()
         except Exception as e:
+            if self.music_catalog and self.music_catalog.tracks:
+                logging.warning(f"Could not sync music catalog, using last known listing: {e}")
+                return self.music_catalog.files()
             logging.error(f"Error listing music files in Drive: {e}")
             return []
 
     def download_drive_file(self, file_id, destination_path):
         """Download a file from Google Drive to a local path."""
         try:
+            from googleapiclient.http import MediaIoBaseDownload
+            
             request = self.drive_service.files().get_media(fileId=file_id)
             with open(destination_path, 'wb') as f:
                 downloader = MediaIoBaseDownload(f, request)
@@ -656,36 +890,68 @@ class InstagramAIAgent:
         if not self.drive_service:
             logging.warning("Google Drive service not initialized. Cannot delete file.")
             return
+        self.delete_drive_files([file_id])
+    
+    def delete_drive_files(self, file_ids, service=None):
+        """Delete several Drive files in batched requests (undeletable public files are made private)."""
+        service = service or self.drive_service
         try:
-            self.drive_service.files().delete(fileId=file_id).execute()
-            logging.info(f"Deleted file from Google Drive: {file_id}")
+            deleted = delete_files(service, file_ids)
+            for file_id in deleted:
+                logging.info(f"Deleted file from Google Drive: {file_id}")
+            UploadIndex().forget_files(deleted)
+            return deleted
         except Exception as e:
-            if "insufficientFilePermissions" in str(e):
-                logging.warning(f"Cannot delete file {file_id} - file is public. This is normal behavior.")
-                print(f"[Drive] File {file_id} is public and cannot be deleted via API. This is expected.")
-            else:
-                logging.error(f"Error deleting file from Google Drive: {e}")
+            logging.error(f"Error deleting files from Google Drive: {e}")
+            return []
+    
+    def cleanup_drive_videos(self, max_age_days=None):
+        """Delete uploaded videos older than DRIVE_CLEANUP_AGE_DAYS from the Instagram AI Videos folder."""
+        max_age_days = DRIVE_CLEANUP_AGE_DAYS if max_age_days is None else max_age_days
+        try:
+            from datetime import timedelta, timezone
+            
+            service = self.get_drive_service_oauth()
+            folder_id = self.instagram_folder_id or self.lookup_instagram_folder()
+            if not folder_id:
+                return 0
+            cutoff = (datetime.now(timezone.utc) - timedelta(days=max_age_days)).strftime('%Y-%m-%dT%H:%M:%S')
+            query = f"'{folder_id}' in parents and trashed=false and modifiedTime < '{cutoff}'"
+            stale = list_files(service, query)
+            if not stale:
+                logging.info("Drive cleanup: no stale videos")
+                return 0
+            deleted = self.delete_drive_files([f['id'] for f in stale], service=service)
+            logging.info(f"Drive cleanup: deleted {len(deleted)} of {len(stale)} stale video(s)")
+            return len(deleted)
+        except Exception as e:
+            logging.error(f"Error cleaning up Drive videos: {e}")
+            return 0
 
     def mark_quote_as_used(self, quote_index):
         """Mark a quote as used by adding a 'Used' column instead of deleting."""
         try:
+            import gspread
+            
             gc = gspread.service_account(filename=GOOGLE_CREDENTIALS_PATH)
             worksheet = gc.open(SHEET_NAME).get_worksheet(SHEET_WORKSHEET_INDEX)
             
-            # Get all records to check if 'Used' column exists
-            records = worksheet.get_all_records()
-            df = pd.DataFrame(records)
+            # Read only the header row to check if 'Used' column exists
+            header = worksheet.row_values(1)
             
             # If 'Used' column doesn't exist, add it
-            if 'Used' not in df.columns:
+            if 'Used' not in header:
                 # Add 'Used' column header
-                worksheet.update_cell(1, len(df.columns) + 1, 'Used')
+                worksheet.update_cell(1, len(header) + 1, 'Used')
                 logging.info("Added 'Used' column to Google Sheet")
+                header.append('Used')
             
             # Mark the quote as used (row index + 2 for 1-indexed + header)
             row_to_update = quote_index + 2
-            col_to_update = len(df.columns) + 1  # Last column
+            col_to_update = header.index('Used') + 1
             worksheet.update_cell(row_to_update, col_to_update, 'Yes')
+            if self.prefetcher:
+                self.prefetcher.invalidate()
             
             logging.info(f"Marked quote at index {quote_index} (row {row_to_update}) as used")
             print(f"[Sheets] Marked quote in row {row_to_update} as used")
@@ -698,12 +964,16 @@ class InstagramAIAgent:
     def delete_quote_from_sheet(self, quote_index):
         """Delete the used quote from Google Sheets to prevent reuse."""
         try:
+            import gspread
+            
             gc = gspread.service_account(filename=GOOGLE_CREDENTIALS_PATH)
             worksheet = gc.open(SHEET_NAME).get_worksheet(SHEET_WORKSHEET_INDEX)
             
             # Delete the row (add 2 because sheets are 1-indexed and we have a header row)
             row_to_delete = quote_index + 2
             worksheet.delete_rows(row_to_delete)
+            if self.prefetcher:
+                self.prefetcher.invalidate()
             
             logging.info(f"Deleted quote at index {quote_index} (row {row_to_delete}) from Google Sheets")
             print(f"[Sheets] Deleted used quote from row {row_to_delete}")
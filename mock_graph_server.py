@@ -0,0 +1,417 @@
+"""
+Local Graph API stand-in for Instagram AI Agent
+A threaded HTTP server that implements the parts of the Graph API the agent uses (media
+containers, status lookups, multi-id status, media_publish, account fields, media listing and
+insights, debug_token, the token exchange and the resumable rupload endpoint), with configurable processing delays,
+response latency and error injection. Point GRAPH_API_BASE_URL / INSTAGRAM_UPLOAD_BASE_URL
+at it to run the agent offline, or use `bench` to measure publish throughput.
+
+Usage:
+    python mock_graph_server.py serve --port 8765 --processing uniform:5:20 --error-rate 0.02
+    python mock_graph_server.py bench --posts 10 --processing uniform:1:3 --latency lognormal:-3:0.5
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+MOCK_ACCOUNT = {'username': 'mock_account', 'account_type': 'BUSINESS', 'followers_count': 1000, 'media_count': 0}
+INVALID_TOKEN = 'invalid'  # Requests made with this token fail with OAuthException 190
+
+
+def parse_distribution(spec: str):
+    """
+    A sampler for 'fixed:S', 'uniform:A:B', 'normal:MEAN:SD' or 'lognormal:MU:SIGMA' (seconds).
+    Samples are never negative.
+    """
+    kind, *args = spec.split(':')
+    args = [float(a) for a in args]
+    samplers = {
+        'fixed': lambda: args[0],
+        'uniform': lambda: random.uniform(args[0], args[1]),
+        'normal': lambda: random.gauss(args[0], args[1]),
+        'lognormal': lambda: random.lognormvariate(args[0], args[1]),
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unknown distribution '{spec}'")
+    sampler = samplers[kind]
+    return lambda: max(0.0, sampler())
+
+
+class MockGraphState:
+    """Containers, published media and request counts, shared by all handler threads."""
+
+    def __init__(self, processing: str = 'fixed:2', latency: str = 'fixed:0', error_rate: float = 0.0,
+                 processing_error_rate: float = 0.0, usage_percent: float = 0.0, token_days: float = 60):
+        self.processing = parse_distribution(processing)
+        self.latency = parse_distribution(latency)
+        self.error_rate = error_rate
+        self.processing_error_rate = processing_error_rate
+        self.usage_percent = usage_percent
+        self.token_days = token_days
+        self.lock = threading.Lock()
+        self.containers = {}
+        self.media = {}
+        self.requests = Counter()
+        self._next_id = 17900000000000000
+
+    def new_id(self) -> str:
+        with self.lock:
+            self._next_id += 1
+            return str(self._next_id)
+
+    def count(self, endpoint: str):
+        with self.lock:
+            self.requests[endpoint] += 1
+
+    def status(self, container_id: str, fields: str = 'status_code') -> dict:
+        container = self.containers.get(container_id)
+        if container is None:
+            return None
+        if container['published']:
+            code, detail = 'PUBLISHED', 'Published'
+        elif container['ready_at'] is None:
+            code, detail = 'IN_PROGRESS', 'Waiting for upload'
+        elif time.time() < container['ready_at']:
+            code, detail = 'IN_PROGRESS', 'In progress'
+        elif container['fails']:
+            code, detail = 'ERROR', 'Error: Media upload has failed with error code 2207026'
+        else:
+            code, detail = 'FINISHED', 'Finished: Media has been uploaded and it is ready to be published.'
+        result = {'id': container_id}
+        wanted = set(fields.split(','))
+        if 'status_code' in wanted:
+            result['status_code'] = code
+        if 'status' in wanted:
+            result['status'] = detail
+        if 'video_status' in wanted:
+            result['video_status'] = {'uploading_phase': {'status': 'complete' if container['received'] >= container['file_size']
+                                                         else 'in_progress', 'bytes_transferred': container['received']}}
+        return result
+
+
+class MockGraphHandler(BaseHTTPRequestHandler):
+    server_version = 'MockGraph/1.0'
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output readable
+
+    @property
+    def state(self) -> MockGraphState:
+        return self.server.state
+
+    # --- responses ---
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        usage = self.state.usage_percent
+        self.send_header('X-App-Usage', json.dumps({'call_count': usage, 'total_cputime': usage / 2, 'total_time': usage / 2}))
+        self.send_header('X-Business-Use-Case-Usage', json.dumps({'mock': [{
+            'type': 'instagram', 'call_count': usage, 'total_cputime': usage / 2, 'total_time': usage / 2,
+            'estimated_time_to_regain_access': 0}]}))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str, code: int, subcode: int = None, transient: bool = False):
+        error = {'message': message, 'type': 'OAuthException', 'code': code, 'is_transient': transient,
+                 'fbtrace_id': 'mock'}
+        if subcode:
+            error['error_subcode'] = subcode
+        self._send(status, {'error': error})
+
+    # --- request parsing ---
+
+    def _params(self) -> dict:
+        query = {k: v[-1] for k, v in parse_qs(urlparse(self.path).query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        self._body = self.rfile.read(length) if length else b''
+        if self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+            query.update({k: v[-1] for k, v in parse_qs(self._body.decode('utf-8')).items()})
+        return query
+
+    def _header_token(self):
+        """The token of an 'Authorization: OAuth <token>' (or Bearer) header."""
+        scheme, _, token = (self.headers.get('Authorization') or '').partition(' ')
+        return token.strip() if scheme in ('OAuth', 'Bearer') else None
+
+    def _route(self, method: str):
+        params = self._params()
+        parts = [p for p in urlparse(self.path).path.split('/') if p]
+        time.sleep(self.state.latency())
+
+        if parts and parts[0] == 'ig-api-upload':
+            return self._rupload(parts[-1])
+        if parts and parts[0].startswith('v'):
+            parts = parts[1:]  # API version
+
+        token = params.get('access_token') or self._header_token()
+        if not token or token == INVALID_TOKEN:
+            self.state.count('invalid_token')
+            return self._error(400, 'Invalid OAuth access token.', 190)
+        if self.state.error_rate and random.random() < self.state.error_rate:
+            self.state.count('injected_error')
+            return self._error(500, 'An unexpected error has occurred. Please retry your request later.', 2,
+                               transient=True)
+
+        if method == 'GET' and not parts and 'ids' in params:
+            return self._multi_status(params)
+        if method == 'GET' and parts == ['debug_token']:
+            self.state.count('debug_token')
+            return self._send(200, {'data': {'is_valid': True, 'expires_at': int(time.time() + self.state.token_days * 86400),
+                                             'data_access_expires_at': int(time.time() + 90 * 86400),
+                                             'scopes': ['instagram_basic', 'instagram_content_publish']}})
+        if parts == ['oauth', 'access_token']:
+            self.state.count('token_exchange')
+            return self._send(200, {'access_token': f"mock-{self.state.new_id()}", 'token_type': 'bearer',
+                                    'expires_in': int(self.state.token_days * 86400)})
+        if method == 'GET' and len(parts) == 2 and parts[1] == 'media':
+            return self._list_media(parts[0], params)
+        if method == 'POST' and len(parts) == 2 and parts[1] == 'media':
+            return self._create_container(parts[0], params)
+        if method == 'POST' and len(parts) == 2 and parts[1] == 'media_publish':
+            return self._publish(parts[0], params)
+        if method == 'GET' and len(parts) == 1:
+            if parts[0] in self.state.containers:
+                self.state.count('status')
+                return self._send(200, self.state.status(parts[0], params.get('fields', 'status_code')))
+            self.state.count('account')
+            fields = params.get('fields', 'id').split(',')
+            account = dict(MOCK_ACCOUNT, id=parts[0])
+            return self._send(200, {f: account[f] for f in fields if f in account})
+        self.state.count('unknown')
+        return self._error(400, f"Unsupported {method} request: {urlparse(self.path).path}", 100, 33)
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    # --- endpoints ---
+
+    def _create_container(self, ig_user_id: str, params: dict):
+        self.state.count('create_container')
+        resumable = params.get('upload_type') == 'resumable'
+        if not resumable and not params.get('video_url'):
+            return self._error(400, 'The parameter video_url is required', 100)
+        container_id = self.state.new_id()
+        processing = self.state.processing()
+        self.state.containers[container_id] = {
+            'user': ig_user_id, 'upload_type': 'resumable' if resumable else 'url',
+            'processing': processing, 'ready_at': None if resumable else time.time() + processing,
+            'fails': random.random() < self.state.processing_error_rate,
+            'published': False, 'received': 0, 'file_size': 0,
+        }
+        result = {'id': container_id}
+        if resumable:
+            result['uri'] = f"http://{self.headers.get('Host')}/ig-api-upload/{container_id}"
+        self._send(200, result)
+
+    def _multi_status(self, params: dict):
+        ids = params['ids'].split(',')
+        if len(ids) > 50:
+            return self._error(400, 'Too many IDs. Maximum: 50.', 100)
+        if params.get('fields', '').startswith('insights'):
+            return self._insights(ids, params['fields'])
+        self.state.count('multi_status')
+        result = {}
+        for container_id in ids:
+            status = self.state.status(container_id, params.get('fields', 'status_code'))
+            if status is None:
+                return self._error(400, f"Object with ID '{container_id}' does not exist", 100, 33)
+            result[container_id] = status
+        self._send(200, result)
+
+    def _list_media(self, ig_user_id: str, params: dict):
+        """Published media, newest first, paged with an `after` cursor (the index of the next item)."""
+        self.state.count('list_media')
+        media = sorted(((media_id, m) for media_id, m in self.state.media.items() if m['user'] == ig_user_id),
+                       key=lambda item: item[1]['published_at'], reverse=True)
+        start, limit = int(params.get('after') or 0), int(params.get('limit') or 25)
+        page = [{'id': media_id, 'media_type': 'VIDEO', 'media_product_type': 'REELS', 'caption': '',
+                 'permalink': f"https://www.instagram.com/reel/{media_id}/",
+                 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S+0000', time.gmtime(m['published_at']))}
+                for media_id, m in media[start:start + limit]]
+        result = {'data': page, 'paging': {'cursors': {'before': str(start), 'after': str(start + len(page))}}}
+        if start + limit < len(media):
+            result['paging']['next'] = f"{self.path}&after={start + limit}"
+        self._send(200, result)
+
+    def _insights(self, ids: list, fields: str):
+        self.state.count('insights')
+        metrics = fields[fields.index('(') + 1:fields.rindex(')')].split(',')
+        result = {}
+        for media_id in ids:
+            if media_id not in self.state.media:
+                return self._error(400, f"Object with ID '{media_id}' does not exist", 100, 33)
+            seed = random.Random(media_id)
+            result[media_id] = {'id': media_id, 'insights': {'data': [
+                {'name': metric, 'period': 'lifetime', 'values': [{'value': seed.randint(0, 5000)}]} for metric in metrics]}}
+        self._send(200, result)
+
+    def _publish(self, ig_user_id: str, params: dict):
+        self.state.count('publish')
+        container = self.state.containers.get(params.get('creation_id'))
+        if container is None or container['user'] != ig_user_id:
+            return self._error(400, 'Media ID is not available', 9007, 2207027)
+        status = self.state.status(params['creation_id'])['status_code']
+        if status != 'FINISHED':
+            return self._error(400, 'The media is not ready for publishing, please wait for a moment', 9007, 2207027)
+        container['published'] = True
+        media_id = self.state.new_id()
+        self.state.media[media_id] = {'user': ig_user_id, 'published_at': time.time()}
+        self._send(200, {'id': media_id})
+
+    def _rupload(self, container_id: str):
+        self.state.count('rupload')
+        container = self.state.containers.get(container_id)
+        if not (self.headers.get('Authorization') or '').startswith('OAuth '):
+            return self._send(400, {'debug_info': {'retriable': False, 'type': 'AuthError', 'message': 'Missing token'}})
+        if container is None:
+            return self._send(404, {'debug_info': {'retriable': False, 'type': 'NotFound', 'message': 'Unknown container'}})
+        if self.state.error_rate and random.random() < self.state.error_rate:
+            self.state.count('injected_error')
+            return self._send(503, {'debug_info': {'retriable': True, 'type': 'ServiceUnavailable', 'message': 'Try again'}})
+        offset, file_size = int(self.headers.get('offset', 0)), int(self.headers.get('file_size', 0))
+        if offset != container['received']:
+            return self._send(400, {'debug_info': {'retriable': False, 'type': 'OffsetMismatch',
+                                                   'message': f"Expected offset {container['received']}"}})
+        container['file_size'] = file_size
+        container['received'] = offset + len(self._body)
+        if container['received'] >= file_size:
+            container['ready_at'] = time.time() + container['processing']  # Processing starts after the upload
+        self._send(200, {'success': True, 'message': 'Upload successful.'})
+
+
+class MockGraphServer:
+    """Runs the stand-in on a background thread; base_url / upload_base_url point the agent at it."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, **options):
+        self.httpd = ThreadingHTTPServer((host, port), MockGraphHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = MockGraphState(**options)
+        self._thread = None
+
+    @property
+    def state(self) -> MockGraphState:
+        return self.httpd.state
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def upload_base_url(self) -> str:
+        return f"{self.base_url}/ig-api-upload"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='mock-graph', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def run_benchmark(server: MockGraphServer, posts: int, accounts: int, video_bytes: int) -> bool:
+    """Publish `posts` videos one by one, then all at once through MultiPublisher, and compare."""
+    # The benchmark must not mix its timings into the real processing stats
+    import graph_client
+    graph_client.CONTAINER_STATS_FILE = os.path.join(tempfile.mkdtemp(prefix='mock-graph-'), 'container_stats.json')
+    from graph_client import GraphClient
+    from publisher import MultiPublisher
+
+    clients = [GraphClient(f"mock-token-{i}", base_url=server.base_url, upload_base_url=server.upload_base_url)
+               for i in range(accounts)]
+    video_path = None
+    if video_bytes:
+        fd, video_path = tempfile.mkstemp(suffix='.mp4')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(video_bytes))
+    video_url = 'https://example.com/video.mp4'
+    results = {}
+
+    try:
+        server.state.requests.clear()
+        started = time.time()
+        published = 0
+        for i in range(posts):
+            graph = clients[i % accounts]
+            try:
+                if graph.publish_video(f"1784{i % accounts:011d}", video_url, f"Post {i}", video_path=video_path):
+                    published += 1
+            except Exception as e:
+                print(f"   post {i} failed: {e}")
+        results['sequential'] = (time.time() - started, published, dict(server.state.requests))
+
+        server.state.requests.clear()
+        started = time.time()
+        publisher = MultiPublisher()
+        for i in range(posts):
+            publisher.add(clients[i % accounts], f"1784{i % accounts:011d}", video_url, f"Post {i}",
+                          video_size=video_bytes or None, video_path=video_path)
+        published = sum(1 for media_id in publisher.run().values() if media_id)
+        results['pipelined'] = (time.time() - started, published, dict(server.state.requests))
+    finally:
+        if video_path:
+            os.remove(video_path)
+
+    for name, (elapsed, published, requests_made) in results.items():
+        print(f"{name:>10}: {published}/{posts} published in {elapsed:6.1f}s "
+              f"({published / max(elapsed, 1e-6) * 60:.1f} posts/min), {sum(requests_made.values())} requests")
+        print(f"{'':>12}{', '.join(f'{k}={v}' for k, v in sorted(requests_made.items()))}")
+    return all(published == posts for _, published, _ in results.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Graph API stand-in for offline runs and benchmarks")
+    parser.add_argument('mode', choices=['serve', 'bench'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help='Port for serve mode (bench picks a free one)')
+    parser.add_argument('--processing', default='uniform:1:3', help='Container processing time distribution (s)')
+    parser.add_argument('--latency', default='fixed:0.02', help='Response latency distribution (s)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of calls that fail with a transient error')
+    parser.add_argument('--processing-error-rate', type=float, default=0.0, help='Share of containers that end in ERROR')
+    parser.add_argument('--usage', type=float, default=0.0, help='Rate-limit usage %% reported in the usage headers')
+    parser.add_argument('--posts', type=int, default=10, help='bench: number of posts')
+    parser.add_argument('--accounts', type=int, default=1, help='bench: number of accounts the posts are spread over')
+    parser.add_argument('--video-bytes', type=int, default=0, help='bench: upload a file of this size directly '
+                                                                    'instead of using a video URL')
+    args = parser.parse_args()
+
+    options = dict(processing=args.processing, latency=args.latency, error_rate=args.error_rate,
+                   processing_error_rate=args.processing_error_rate, usage_percent=args.usage)
+    if args.mode == 'serve':
+        server = MockGraphServer(args.host, args.port, **options)
+        print(f"Mock Graph API on {server.base_url}")
+        print(f"  export GRAPH_API_BASE_URL={server.base_url}")
+        print(f"  export INSTAGRAM_UPLOAD_BASE_URL={server.upload_base_url}")
+        try:
+            server.httpd.serve_forever()
+        except KeyboardInterrupt:
+            server.stop()
+        return
+
+    server = MockGraphServer(args.host, 0, **options).start()
+    try:
+        ok = run_benchmark(server, args.posts, args.accounts, args.video_bytes)
+    finally:
+        server.stop()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
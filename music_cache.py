@@ -0,0 +1,163 @@
+"""
+Local music cache for Instagram AI Agent
+Keeps downloaded Drive tracks on disk, keyed by file id and MD5 checksum,
+so a track is downloaded once and re-downloaded only when it changes on Drive.
+"""
+
+import os
+import time
+import logging
+import tempfile
+import threading
+from typing import Optional, Dict
+
+from config import MUSIC_CACHE_DIR, MUSIC_CACHE_MAX_MB
+from state_store import atomic_write_json, load_json, file_md5
+
+INDEX_FILENAME = 'index.json'
+
+
+class MusicCache:
+    """
+    Size-capped, least-recently-used cache of music files.
+    Entries are keyed by Drive file id plus md5Checksum; a changed track on Drive gets a new
+    key and replaces the old copy. Downloads go to a temporary file and are moved into place,
+    so an interrupted download never leaves a truncated track in the cache.
+    """
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = None):
+        self.cache_dir = cache_dir or MUSIC_CACHE_DIR
+        self.max_bytes = max_bytes if max_bytes is not None else MUSIC_CACHE_MAX_MB * 1024 * 1024
+        self.index_path = os.path.join(self.cache_dir, INDEX_FILENAME)
+        self._lock = threading.Lock()
+        self._download_locks = {}  # file id -> Lock, so one track is never downloaded twice at once
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.entries = load_json(self.index_path).get('entries', {})
+
+    @staticmethod
+    def key(file_id: str, md5: Optional[str]) -> str:
+        return f"{file_id}:{md5 or 'nomd5'}"
+
+    def _local_path(self, drive_file: Dict) -> str:
+        extension = os.path.splitext(drive_file.get('name', ''))[1] or '.mp3'
+        md5 = drive_file.get('md5Checksum') or 'nomd5'
+        return os.path.join(self.cache_dir, f"{drive_file['id']}_{md5}{extension}")
+
+    def _save_index(self):
+        atomic_write_json(self.index_path, {'entries': self.entries})
+
+    def lookup(self, drive_file: Dict) -> Optional[str]:
+        """Return the cached path for a Drive file, or None on a miss."""
+        key = self.key(drive_file['id'], drive_file.get('md5Checksum'))
+        with self._lock:
+            entry = self.entries.get(key)
+            if not entry:
+                return None
+            path = os.path.join(self.cache_dir, entry['filename'])
+            if not os.path.exists(path) or os.path.getsize(path) != entry['size']:
+                # Deleted or damaged behind our back: drop the entry and re-download
+                self.entries.pop(key, None)
+                self._save_index()
+                return None
+            entry['last_used'] = time.time()
+            self._save_index()
+            return path
+
+    def _download_lock(self, file_id: str) -> threading.Lock:
+        with self._lock:
+            return self._download_locks.setdefault(file_id, threading.Lock())
+
+    def fetch(self, drive_service, drive_file: Dict) -> Optional[str]:
+        """
+        Return a local path for `drive_file` ({'id', 'name', 'md5Checksum', 'size'}),
+        downloading it only on a cache miss. Safe to call from the render and prefetch
+        threads at once: a second caller for the same track waits for the first download.
+        """
+        path = self.lookup(drive_file)
+        if path:
+            logging.info(f"Music cache hit: {drive_file.get('name')} -> {path}")
+            return path
+
+        with self._download_lock(drive_file['id']):
+            path = self.lookup(drive_file)
+            if path:
+                logging.info(f"Music cache hit: {drive_file.get('name')} -> {path}")
+                return path
+            return self._fetch_missing(drive_service, drive_file)
+
+    def _fetch_missing(self, drive_service, drive_file: Dict) -> Optional[str]:
+        try:
+            path = self._download(drive_service, drive_file)
+        except Exception as e:
+            logging.error(f"Error downloading {drive_file.get('name')} into music cache: {e}")
+            return None
+
+        filename = os.path.basename(path)
+        with self._lock:
+            # Older versions of the same Drive file are dead weight once a new checksum lands
+            for key, entry in list(self.entries.items()):
+                if entry['file_id'] == drive_file['id'] and entry['filename'] != filename:
+                    self._remove(key)
+            self.entries[self.key(drive_file['id'], drive_file.get('md5Checksum'))] = {
+                'file_id': drive_file['id'],
+                'md5': drive_file.get('md5Checksum'),
+                'name': drive_file.get('name'),
+                'filename': filename,
+                'size': os.path.getsize(path),
+                'last_used': time.time(),
+            }
+            self._evict(keep=filename)
+            self._save_index()
+        logging.info(f"Music cache miss: downloaded {drive_file.get('name')} -> {path}")
+        return path
+
+    def _download(self, drive_service, drive_file: Dict) -> str:
+        from googleapiclient.http import MediaIoBaseDownload
+
+        path = self._local_path(drive_file)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.download.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                request = drive_service.files().get_media(fileId=drive_file['id'])
+                downloader = MediaIoBaseDownload(f, request)
+                done = False
+                while not done:
+                    status, done = downloader.next_chunk()
+                f.flush()
+                os.fsync(f.fileno())
+            expected_md5 = drive_file.get('md5Checksum')
+            if expected_md5 and file_md5(tmp_path) != expected_md5:
+                raise IOError(f"Checksum mismatch for {drive_file.get('name')}")
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        return path
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if not entry:
+            return
+        try:
+            os.remove(os.path.join(self.cache_dir, entry['filename']))
+        except OSError:
+            pass
+
+    def _evict(self, keep=None):
+        """Drop least-recently-used entries until the cache fits within max_bytes."""
+        total = sum(entry['size'] for entry in self.entries.values())
+        for key, entry in sorted(self.entries.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if entry['filename'] == keep:
+                continue
+            total -= entry['size']
+            logging.info(f"Evicting {entry['name']} from music cache")
+            self._remove(key)
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return sum(entry['size'] for entry in self.entries.values())
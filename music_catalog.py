@@ -0,0 +1,154 @@
+"""
+Drive music catalog for Instagram AI Agent
+Lists the complete Drive music folder once, stores it locally and keeps it current
+with the Drive Changes API, so a run costs one changes call instead of a folder listing.
+"""
+
+import logging
+from datetime import datetime
+from typing import Optional, Dict, List
+
+from config import DRIVE_MUSIC_FOLDER_ID, MUSIC_CATALOG_FILE
+from state_store import atomic_write_json, load_json
+
+MUSIC_MIME_TYPE = 'audio/mpeg'
+FILE_FIELDS = 'id, name, mimeType, md5Checksum, size, parents, trashed'
+PAGE_SIZE = 1000
+
+
+class MusicCatalog:
+    """
+    Local copy of the Drive music folder: {file id: {'id', 'name', 'md5Checksum', 'size', 'duration'}}.
+    The first sync pages through the whole folder; later syncs apply only the changes
+    since the stored start page token.
+    """
+
+    def __init__(self, drive_service, folder_id: str = None, path: str = None):
+        self.drive_service = drive_service
+        self.folder_id = folder_id or DRIVE_MUSIC_FOLDER_ID
+        self.path = path or MUSIC_CATALOG_FILE
+        state = load_json(self.path)
+        if state.get('folder_id') != self.folder_id:
+            state = {}
+        self.page_token = state.get('page_token')
+        self.tracks = state.get('files', {})
+        self.synced_at = state.get('synced_at')
+
+    def save(self):
+        atomic_write_json(self.path, {
+            'folder_id': self.folder_id,
+            'page_token': self.page_token,
+            'synced_at': self.synced_at,
+            'files': self.tracks,
+        })
+
+    def sync(self):
+        """Bring the catalog up to date, falling back to a full listing when needed."""
+        if self.page_token:
+            try:
+                changed = self.incremental_sync()
+                logging.info(f"Music catalog: {changed} change(s) applied, {len(self.tracks)} track(s)")
+                return
+            except Exception as e:
+                logging.warning(f"Incremental music catalog sync failed, relisting folder: {e}")
+        self.full_sync()
+        logging.info(f"Music catalog: listed {len(self.tracks)} track(s) from Drive")
+
+    def full_sync(self):
+        """Page through the complete music folder and reset the change token."""
+        # Take the token before listing so changes made during the listing are replayed next run
+        start_token = self.drive_service.changes().getStartPageToken().execute().get('startPageToken')
+
+        query = f"'{self.folder_id}' in parents and mimeType='{MUSIC_MIME_TYPE}' and trashed=false"
+        tracks = {}
+        page_token = None
+        while True:
+            results = self.drive_service.files().list(
+                q=query,
+                fields=f"nextPageToken, files({FILE_FIELDS})",
+                pageSize=PAGE_SIZE,
+                pageToken=page_token
+            ).execute()
+            for drive_file in results.get('files', []):
+                tracks[drive_file['id']] = self._track(drive_file)
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+
+        self.tracks = tracks
+        self.page_token = start_token
+        self.synced_at = datetime.now().isoformat()
+        self.save()
+
+    def incremental_sync(self) -> int:
+        """Apply Drive changes since the stored token. Returns the number of catalog updates."""
+        changed = 0
+        page_token = self.page_token
+        while page_token:
+            results = self.drive_service.changes().list(
+                pageToken=page_token,
+                spaces='drive',
+                pageSize=PAGE_SIZE,
+                fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}))"
+            ).execute()
+            for change in results.get('changes', []):
+                changed += self._apply_change(change)
+            if 'newStartPageToken' in results:
+                self.page_token = results['newStartPageToken']
+            page_token = results.get('nextPageToken')
+
+        self.synced_at = datetime.now().isoformat()
+        self.save()
+        return changed
+
+    def _apply_change(self, change: Dict) -> int:
+        file_id = change.get('fileId')
+        drive_file = change.get('file')
+        in_folder = (
+            not change.get('removed') and drive_file is not None
+            and not drive_file.get('trashed')
+            and drive_file.get('mimeType') == MUSIC_MIME_TYPE
+            and self.folder_id in drive_file.get('parents', [])
+        )
+        if in_folder:
+            self.tracks[file_id] = self._track(drive_file, self.tracks.get(file_id))
+            return 1
+        if file_id in self.tracks:
+            del self.tracks[file_id]
+            return 1
+        return 0
+
+    @staticmethod
+    def _track(drive_file: Dict, previous: Optional[Dict] = None) -> Dict:
+        track = {
+            'id': drive_file['id'],
+            'name': drive_file.get('name'),
+            'md5Checksum': drive_file.get('md5Checksum'),
+            'size': int(drive_file['size']) if drive_file.get('size') else None,
+            'duration': None,
+        }
+        # Duration only changes with the content
+        if previous and previous.get('md5Checksum') == track['md5Checksum']:
+            track['duration'] = previous.get('duration')
+        return track
+
+    def files(self) -> List[Dict]:
+        """All tracks, sorted by name."""
+        return sorted(self.tracks.values(), key=lambda x: x['name'] or '')
+
+    def record_duration(self, file_id: str, local_path: str) -> Optional[float]:
+        """Probe and store a track's duration (in seconds) the first time it is seen locally."""
+        track = self.tracks.get(file_id)
+        if track is None:
+            return None
+        if track.get('duration') is None:
+            try:
+                from moviepy.editor import AudioFileClip
+
+                clip = AudioFileClip(local_path)
+                track['duration'] = round(clip.duration, 3)
+                clip.close()
+                self.save()
+            except Exception as e:
+                logging.warning(f"Could not read duration of {track['name']}: {e}")
+        return track.get('duration')
@@ -0,0 +1,43 @@
+"""
+Concurrent helpers for Instagram AI Agent
+Runs independent network calls side by side with per-call timeouts,
+so startup costs the slowest call instead of the sum of all of them.
+"""
+
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Tuple, Any
+
+
+def run_concurrently(tasks: Dict[str, Tuple[Callable[[], Any], float]]) -> Dict[str, Any]:
+    """
+    Run {name: (callable, timeout_seconds)} on a thread pool and wait until every task
+    has finished or hit its timeout. A task that raises or times out yields None.
+    Timed-out calls keep running in the background; their results are ignored.
+    """
+    results = {}
+    if not tasks:
+        return results
+
+    started = time.time()
+    executor = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix='startup')
+    try:
+        futures = {name: executor.submit(func) for name, (func, _) in tasks.items()}
+        for name, future in futures.items():
+            timeout = tasks[name][1]
+            remaining = max(0.0, started + timeout - time.time()) if timeout else None
+            try:
+                results[name] = future.result(timeout=remaining)
+                logging.info(f"Startup task '{name}' ready after {time.time() - started:.1f}s")
+            except FutureTimeoutError:
+                logging.error(f"Startup task '{name}' timed out after {timeout}s")
+                results[name] = None
+            except Exception as e:
+                logging.error(f"Startup task '{name}' failed: {e}")
+                results[name] = None
+    finally:
+        executor.shutdown(wait=False)
+
+    logging.info(f"Startup I/O finished in {time.time() - started:.1f}s ({len(tasks)} concurrent tasks)")
+    return results
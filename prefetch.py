@@ -0,0 +1,112 @@
+"""
+Background prefetch for Instagram AI Agent
+While one run renders and publishes, fetch and warm everything the next scheduled
+run needs (quote catalog, next quote's layout, next music track) on a worker thread.
+"""
+
+import time
+import logging
+import threading
+from typing import Optional, Dict
+
+from config import PREFETCH_MAX_AGE_MINUTES, PREFETCH_JOIN_TIMEOUT_SECONDS
+
+
+class Prefetcher:
+    """
+    Prepares the next run of an InstagramAIAgent in the background.
+    The prepared quote catalog is handed to the next create_video() through take();
+    the music track, fonts and layouts are warmed in the agent's on-disk caches.
+    """
+
+    def __init__(self, agent):
+        self.agent = agent
+        self._lock = threading.Lock()
+        self._thread = None
+        self._prepared = None
+        self._generation = 0
+
+    def start(self):
+        """Begin preparing the run after the current one (the agent's progress already points at it)."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._prepared = None
+            generation = self._generation
+            self._thread = threading.Thread(target=self._run, args=(generation,), name='prefetch', daemon=True)
+            self._thread.start()
+
+    def invalidate(self):
+        """Discard prepared data, e.g. after the quote sheet was edited."""
+        with self._lock:
+            self._generation += 1
+            self._prepared = None
+
+    def take(self) -> Optional[Dict]:
+        """
+        Return the prepared {'quote_source', 'dedup_index', 'unfit_quotes'} for this run,
+        or None if nothing usable was prepared. Waits briefly for a prefetch still in flight.
+        """
+        thread = self._thread
+        if thread and thread.is_alive():
+            logging.info("Waiting for prefetch of this run to finish...")
+            thread.join(PREFETCH_JOIN_TIMEOUT_SECONDS)
+        with self._lock:
+            prepared, self._prepared = self._prepared, None
+        if prepared is None:
+            return None
+        age_minutes = (time.time() - prepared['fetched_at']) / 60
+        if age_minutes > PREFETCH_MAX_AGE_MINUTES:
+            logging.info(f"Prefetched quotes are {age_minutes:.0f} minutes old, fetching fresh ones")
+            return None
+        return prepared
+
+    def _run(self, generation):
+        started = time.time()
+        try:
+            prepared = self._prepare_quotes()
+            self._prepare_music()
+        except Exception as e:
+            logging.warning(f"Prefetch of next run failed: {e}")
+            return
+
+        with self._lock:
+            if generation != self._generation:
+                logging.info("Prefetched data was invalidated while loading, discarding it")
+                return
+            self._prepared = prepared
+        logging.info(f"Prefetched next run in {time.time() - started:.1f}s")
+
+    def _prepare_quotes(self) -> Optional[Dict]:
+        agent = self.agent
+        quote_source = agent.get_quote_source()
+        if quote_source is None or quote_source.empty:
+            return None
+        dedup_index = agent.load_dedup_index(quote_source)
+        unfit_quotes = agent.precompute_layouts(quote_source)
+
+        quote_index = agent.find_quote_index(quote_source, agent.progress_data['quote_index'], dedup_index, unfit_quotes)
+        quote_row = quote_source.get(quote_index)
+
+        from text_layout import warm_render_layouts
+        warm_render_layouts(quote_row['Quote'], quote_row['Author'])
+        logging.info(f"Prefetched next quote {quote_index}: '{quote_row['Quote']}'")
+        return {
+            'quote_source': quote_source,
+            'dedup_index': dedup_index,
+            'unfit_quotes': unfit_quotes,
+            'fetched_at': time.time(),
+        }
+
+    def _prepare_music(self):
+        agent = self.agent
+        if not agent.music_cache or not agent.music_catalog:
+            return
+        music_files = agent.music_catalog.files()
+        if not music_files:
+            return
+        selected_file = music_files[agent.progress_data['music_index'] % len(music_files)]
+        # googleapiclient services are not thread-safe, so this thread gets its own
+        drive_service = agent.build_drive_service()
+        if agent.music_cache.fetch(drive_service, selected_file):
+            logging.info(f"Prefetched next music track: {selected_file['name']}")
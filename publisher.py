@@ -0,0 +1,231 @@
+"""
+Pipelined Instagram publishing for Instagram AI Agent
+Creates the media containers of many posts (several videos, several accounts) concurrently,
+polls every pending container with one multi-id Graph request and publishes each container
+the moment it is ready, so N posts cost about the wall time of one.
+"""
+
+import time
+import random
+import logging
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from config import (MULTI_PUBLISH_WORKERS, MULTI_STATUS_BATCH_SIZE, CONTAINER_POLL_INITIAL_SECONDS,
+                    CONTAINER_POLL_MAX_INTERVAL_SECONDS, CONTAINER_POLL_DEADLINE_SECONDS, PUBLISH_LAG_FILE)
+from graph_client import GraphClient, GraphAPIError, ProcessingStats
+from state_store import atomic_write_json, load_json
+
+
+class MultiPublisher:
+    """
+    Queue posts with add(), then run() to publish them all as they become ready, or
+    prepare() ahead of time and publish_ready() later (e.g. exactly at a posting slot).
+    Posts that failed to prepare or publish can be queued again with requeue_failed().
+    Each post is {'label', 'graph', 'ig_user_id', 'video_url', 'video_path', 'caption', 'video_size',
+    'container_id', 'created', 'media_id', 'error', 'published'}; posts with a video_path are uploaded
+    directly. 'published' marks a container found already PUBLISHED: it is never published or queued again.
+    """
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or MULTI_PUBLISH_WORKERS
+        self.posts: List[Dict] = []
+        self.ready: List[Dict] = []
+        self.failed: List[Dict] = []
+        self.stats = ProcessingStats()
+
+    def add(self, graph: GraphClient, ig_user_id: str, video_url: str = None, caption: str = "",
+            video_size: Optional[int] = None, label: str = None, video_path: str = None):
+        self.posts.append({
+            'label': label or f"{ig_user_id}#{len(self.posts)}", 'graph': graph, 'ig_user_id': ig_user_id,
+            'video_url': video_url, 'video_path': video_path, 'caption': caption, 'video_size': video_size,
+            'container_id': None, 'created': None, 'media_id': None, 'error': None, 'published': False,
+        })
+        return self
+
+    def run(self, deadline: Optional[float] = None) -> Dict[str, Optional[str]]:
+        """Publish every queued post. Returns {label: media_id, or None if that post failed}."""
+        started = time.time()
+        posts, self.posts = self.posts, []
+        if not posts:
+            return {}
+
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(posts)), thread_name_prefix='publish')
+        try:
+            pending = self._create_all(executor, posts)
+            publishing = []
+            self._poll(pending, started + (deadline or CONTAINER_POLL_DEADLINE_SECONDS),
+                       lambda post: publishing.append(executor.submit(self._publish, post)))
+            for future in publishing:
+                future.result()
+        finally:
+            executor.shutdown(wait=True)
+
+        published = sum(1 for post in posts if post['media_id'])
+        logging.info(f"Published {published}/{len(posts)} post(s) in {time.time() - started:.1f}s")
+        return {post['label']: post['media_id'] for post in posts}
+
+    def prepare(self, deadline: Optional[float] = None) -> List[str]:
+        """
+        Create every queued container and wait until they are FINISHED, without publishing.
+        Returns the labels of the posts that are ready for publish_ready().
+        """
+        started = time.time()
+        posts, self.posts = self.posts, []
+        if not posts:
+            return []
+
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(posts)), thread_name_prefix='publish')
+        try:
+            pending = self._create_all(executor, posts)
+        finally:
+            executor.shutdown(wait=True)
+        self._poll(pending, started + (deadline or CONTAINER_POLL_DEADLINE_SECONDS), self.ready.append)
+        ready = {id(post) for post in self.ready}
+        self.failed.extend(post for post in posts if id(post) not in ready)
+
+        logging.info(f"Prepared {len(self.ready)}/{len(posts)} container(s) in {time.time() - started:.1f}s")
+        return [post['label'] for post in self.ready]
+
+    def publish_ready(self) -> Dict[str, Optional[str]]:
+        """Publish the containers prepared by prepare(), all at once."""
+        posts, self.ready = self.ready, []
+        if not posts:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(posts)), thread_name_prefix='publish') as executor:
+            list(executor.map(self._publish, posts))
+        self.failed.extend(post for post in posts if not post['media_id'])
+        return {post['label']: post['media_id'] for post in posts}
+
+    def requeue_failed(self) -> List[str]:
+        """
+        Queue the posts that failed in prepare() or publish_ready() again with fresh containers,
+        for the next run(). Posts that were published are never queued twice. Returns their labels.
+        """
+        failed, self.failed = [post for post in self.failed if not post['published']], []
+        for post in failed:
+            post.update(container_id=None, created=None, media_id=None, error=None)
+        self.posts.extend(failed)
+        return [post['label'] for post in failed]
+
+    def _create_all(self, executor, posts) -> List[Dict]:
+        """Create the containers concurrently; returns the posts whose container exists."""
+        futures = [executor.submit(self._create, post) for post in posts]
+        for future in futures:
+            future.result()
+        return [post for post in posts if post['container_id']]
+
+    def _create(self, post):
+        try:
+            post['created'] = time.time()
+            if post['video_path']:
+                post['container_id'] = post['graph'].create_uploaded_video_container(
+                    post['ig_user_id'], post['video_path'], post['caption'])
+                post['created'] = time.time()  # Processing starts once the bytes are in
+            else:
+                post['container_id'] = post['graph'].create_video_container(
+                    post['ig_user_id'], post['video_url'], post['caption'])
+            logging.info(f"[{post['label']}] Created media container {post['container_id']}")
+        except GraphAPIError as e:
+            post['error'] = e
+            logging.error(f"[{post['label']}] Could not create media container: {e}")
+
+    def _publish(self, post):
+        try:
+            post['media_id'] = post['graph'].publish_container(post['ig_user_id'], post['container_id'])
+            logging.info(f"[{post['label']}] Published, media ID: {post['media_id']}")
+        except GraphAPIError as e:
+            post['error'] = e
+            logging.error(f"[{post['label']}] Publish failed: {e}")
+
+    def _poll(self, pending, deadline_at, on_ready):
+        """Poll all pending containers together and call on_ready(post) for each one that finishes."""
+        interval = CONTAINER_POLL_INITIAL_SECONDS
+        while pending:
+            for post, status in self._statuses(pending, deadline_at):
+                status_code = status.get('status_code')
+                if status_code == 'FINISHED':
+                    self.stats.record(post['video_size'], time.time() - post['created'])
+                    on_ready(post)
+                    pending.remove(post)
+                elif status_code == 'PUBLISHED':
+                    post['published'] = True
+                    logging.warning(f"[{post['label']}] Container {post['container_id']} is already published, "
+                                    f"not publishing it again")
+                    pending.remove(post)
+                elif status_code in ('ERROR', 'EXPIRED'):
+                    post['error'] = GraphAPIError(f"Instagram processing failed: {status.get('status') or status_code}",
+                                                  payload=status)
+                    logging.error(f"[{post['label']}] {post['error']}")
+                    pending.remove(post)
+            if not pending:
+                break
+
+            remaining = deadline_at - time.time()
+            if remaining <= 0:
+                for post in pending:
+                    post['error'] = GraphAPIError("Media was not ready before the polling deadline")
+                    logging.error(f"[{post['label']}] Container {post['container_id']} still processing, giving up")
+                break
+            time.sleep(min(remaining, random.uniform(0.8, 1.2) * interval))
+            interval = min(interval * 2, CONTAINER_POLL_MAX_INTERVAL_SECONDS)
+
+    def _statuses(self, pending, deadline_at: Optional[float] = None):
+        """
+        [(post, status)] for the pending posts, one multi-id request per access token and batch.
+        Usage pacing never holds a poll back past `deadline_at`.
+        """
+        by_graph = {}
+        for post in pending:
+            by_graph.setdefault(id(post['graph']), []).append(post)
+
+        results = []
+        for group in by_graph.values():
+            for start in range(0, len(group), MULTI_STATUS_BATCH_SIZE):
+                batch = group[start:start + MULTI_STATUS_BATCH_SIZE]
+                try:
+                    statuses = batch[0]['graph'].container_statuses([post['container_id'] for post in batch],
+                                                                    deadline_at=deadline_at)
+                except GraphAPIError as e:
+                    if e.transient:
+                        logging.warning(f"Transient error polling {len(batch)} container(s): {e}")
+                        continue
+                    statuses = {post['container_id']: {'status_code': 'ERROR', 'status': str(e)} for post in batch}
+                results.extend((post, statuses.get(post['container_id'], {})) for post in batch)
+        return results
+
+
+class PublishLag:
+    """Seconds between each posting slot and the moment its post went live, kept in PUBLISH_LAG_FILE."""
+
+    MAX_SAMPLES = 200
+
+    def __init__(self, path: str = None):
+        self.path = path or PUBLISH_LAG_FILE
+
+    def record(self, slot: float, published_at: float, prepared: bool):
+        """Store one publish; `prepared` is False when the full pipeline had to run at the slot."""
+        lag = published_at - slot
+        samples = load_json(self.path, default={'samples': []})['samples']
+        samples.append({'slot': slot, 'lag_seconds': round(lag, 2), 'prepared': prepared})
+        try:
+            atomic_write_json(self.path, {'samples': samples[-self.MAX_SAMPLES:]})
+        except Exception as e:
+            logging.warning(f"Could not save publish lag: {e}")
+        logging.info(f"Published {lag:.1f}s after the slot ({'prepared ahead' if prepared else 'full pipeline'})")
+        return lag
+
+    def summary(self) -> Dict:
+        samples = load_json(self.path, default={'samples': []})['samples']
+        if not samples:
+            return {'count': 0}
+        lags = sorted(s['lag_seconds'] for s in samples)
+        return {
+            'count': len(lags),
+            'median_seconds': statistics.median(lags),
+            'p90_seconds': lags[min(len(lags) - 1, int(len(lags) * 0.9))],
+            'max_seconds': lags[-1],
+            'prepared_share': sum(1 for s in samples if s['prepared']) / len(samples),
+            'last': samples[-1],
+        }
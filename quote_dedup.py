@@ -0,0 +1,375 @@
+"""
+Near-duplicate quote detection for Instagram AI Agent
+Quotes are normalised, split into character shingles and summarised with MinHash
+signatures; LSH buckets over the signatures make a lookup a handful of dict probes.
+
+Usage:
+    python quote_dedup.py                      # build/refresh the index and print duplicate clusters
+    python quote_dedup.py --check "Some quote" # check one quote against the catalog
+"""
+
+import io
+import os
+import re
+import sys
+import hashlib
+import logging
+import unicodedata
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from state_store import atomic_write
+
+# Signature value of a quote with no shingles (empty after normalisation)
+_EMPTY = np.uint32(0xFFFFFFFF)
+
+# Quote marks, apostrophes and dashes that NFKC leaves alone
+_PUNCTUATION_MAP = str.maketrans({
+    '‘': "'", '’': "'", '‚': "'", '‛': "'",
+    '“': '"', '”': '"', '„': '"', '‟': '"', '«': '"', '»': '"',
+    '–': '-', '—': '-', '―': '-',
+})
+_NON_WORD_RE = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize_quote(text: str) -> str:
+    """
+    Normalise a quote for comparison: Unicode compatibility form, case-folded,
+    punctuation and quote marks removed, whitespace collapsed.
+    """
+    text = unicodedata.normalize('NFKC', str(text)).translate(_PUNCTUATION_MAP).casefold()
+    return _NON_WORD_RE.sub(' ', text).strip()
+
+
+def shingle_hashes(normalized_texts: List[str], k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Polynomial hashes of the k-byte shingles of many normalised quotes, computed over
+    their concatenated UTF-8 bytes in a few array operations.
+    Returns (hashes, counts) where counts[i] is the number of shingles of text i.
+    Texts shorter than k are padded so they still produce one shingle.
+    """
+    encoded = [text.encode('utf-8') for text in normalized_texts]
+    encoded = [e.ljust(k) if 0 < len(e) < k else e for e in encoded]
+    lengths = np.array([len(e) for e in encoded], dtype=np.int64)
+    counts = np.maximum(lengths - k + 1, 0)
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint64)
+    if counts.sum() == 0:
+        return np.empty(0, dtype=np.uint64), counts
+
+    windows = data.size - k + 1
+    hashes = np.zeros(windows, dtype=np.uint64)
+    for offset in range(k):
+        hashes = hashes * np.uint64(257) + data[offset:offset + windows]
+
+    # Keep only windows that start and end inside the same text
+    starts = np.cumsum(lengths) - lengths
+    first_shingle = np.cumsum(counts) - counts
+    positions = np.arange(counts.sum()) + np.repeat(starts - first_shingle, counts)
+    return hashes[positions], counts
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # The earliest quote in the catalog stays the canonical one
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+class QuoteDedupIndex:
+    """
+    MinHash/LSH index over a quote catalog.
+    Only the quote text is signed, so the same quote pasted with a different
+    attribution is still reported as a duplicate.
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, threshold: float = 0.8, shingle_size: int = 5, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.seed = seed
+        # Multiply-shift hash family: h(x) = (a * x + b) >> 32 with odd 64-bit a, wrapping in uint64
+        rng = np.random.RandomState(seed)
+        self._a = self._random_odd_uint64(rng, num_perm)
+        self._b = self._random_odd_uint64(rng, num_perm)
+        self._band_mult = self._random_odd_uint64(rng, self.rows)
+
+        self.keys: List[str] = []
+        self.signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self.canonical = np.empty(0, dtype=np.int64)
+        self._buckets = None
+
+    # --- signatures ---
+
+    @staticmethod
+    def _random_odd_uint64(rng, size: int) -> np.ndarray:
+        high = rng.randint(0, 1 << 32, size=size).astype(np.uint64)
+        low = rng.randint(0, 1 << 32, size=size).astype(np.uint64)
+        return (high << np.uint64(32)) | low | np.uint64(1)
+
+    @staticmethod
+    def text_key(normalized: str) -> str:
+        """Stable digest of a normalised quote, used to reuse signatures between builds."""
+        return hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).hexdigest()
+
+    def signature(self, text: str, normalized: bool = False) -> np.ndarray:
+        """MinHash signature of a quote."""
+        if not normalized:
+            text = normalize_quote(text)
+        return self.signatures_for([text])[0]
+
+    def signatures_for(self, normalized_texts: List[str], batch_size: int = 2048) -> np.ndarray:
+        """
+        MinHash signatures of many normalised quotes. Shingles of a whole batch are
+        permuted in one array operation and reduced per quote with np.minimum.reduceat.
+        """
+        result = np.full((len(normalized_texts), self.num_perm), _EMPTY, dtype=np.uint32)
+        for start in range(0, len(normalized_texts), batch_size):
+            hashes, counts = shingle_hashes(normalized_texts[start:start + batch_size], self.shingle_size)
+            present = counts > 0
+            if not present.any():
+                continue
+            permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) >> np.uint64(32)
+            offsets = np.concatenate(([0], np.cumsum(counts[present])[:-1]))
+            rows = np.arange(start, start + len(counts))[present]
+            result[rows] = np.minimum.reduceat(permuted, offsets, axis=1).T.astype(np.uint32)
+        return result
+
+    def _band_hashes(self, signatures: np.ndarray) -> np.ndarray:
+        """One LSH bucket hash per band for each signature row -> (n, bands)."""
+        rows = signatures.reshape(-1, self.bands, self.rows).astype(np.uint64)
+        return (rows * self._band_mult).sum(axis=2)
+
+    def _ensure_buckets(self):
+        """
+        Build the LSH buckets: per band, the catalog's band hashes sorted, so a lookup
+        is one binary search per band and equal hashes form contiguous runs.
+        """
+        if self._buckets is not None:
+            return
+        band_hashes = self._band_hashes(self.signatures).T
+        order = np.argsort(band_hashes, axis=1, kind='stable')
+        self._buckets = (np.take_along_axis(band_hashes, order, axis=1), order)
+
+    # --- lookups ---
+
+    def query(self, text: str, signature: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Return (index, estimated_similarity) for catalog quotes that are near-duplicates
+        of `text`, most similar first.
+        """
+        self._ensure_buckets()
+        if signature is None:
+            signature = self.signature(text)
+        sorted_hashes, order = self._buckets
+        parts = []
+        for band, band_hash in enumerate(self._band_hashes(signature[None, :])[0]):
+            lo = np.searchsorted(sorted_hashes[band], band_hash, side='left')
+            hi = np.searchsorted(sorted_hashes[band], band_hash, side='right')
+            if hi > lo:
+                parts.append(order[band, lo:hi])
+        if not parts:
+            return []
+        candidates = np.unique(np.concatenate(parts))
+        similarity = (self.signatures[candidates] == signature).mean(axis=1)
+        matches = [(int(i), float(s)) for i, s in zip(candidates, similarity) if s >= self.threshold]
+        matches.sort(key=lambda m: (-m[1], m[0]))
+        return matches
+
+    def _bucket_runs(self):
+        """Yield the member indexes of every LSH bucket holding more than one quote."""
+        sorted_hashes, order = self._buckets
+        for band in range(self.bands):
+            column = sorted_hashes[band]
+            if column.size < 2:
+                continue
+            boundaries = np.flatnonzero(column[1:] != column[:-1]) + 1
+            starts = np.concatenate(([0], boundaries))
+            ends = np.concatenate((boundaries, [column.size]))
+            for start, end in zip(starts[ends - starts > 1].tolist(), ends[ends - starts > 1].tolist()):
+                yield np.sort(order[band, start:end]).tolist()
+
+    def duplicate_of(self, index: int) -> Optional[int]:
+        """Index of the earlier quote that `index` duplicates, or None if it is canonical."""
+        if index >= len(self.canonical):
+            return None
+        canonical = int(self.canonical[index])
+        return canonical if canonical != index else None
+
+    def clusters(self) -> List[List[int]]:
+        """Groups of quote indexes that are near-duplicates of each other."""
+        groups = {}
+        for index, canonical in enumerate(self.canonical):
+            groups.setdefault(int(canonical), []).append(index)
+        return [members for members in groups.values() if len(members) > 1]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    # --- building ---
+
+    def build(self, quote_source, previous: Optional['QuoteDedupIndex'] = None) -> 'QuoteDedupIndex':
+        """
+        Index every quote of `quote_source`. Signatures of quotes already present in
+        `previous` (built with the same parameters) are reused instead of recomputed.
+        """
+        reusable = {}
+        if previous is not None and previous.compatible_with(self):
+            reusable = {key: row for row, key in enumerate(previous.keys)}
+
+        keys, new_texts, new_rows = [], [], []
+        signatures = []
+        for row, quote in enumerate(quote_source):
+            normalized = normalize_quote(quote.get('Quote', ''))
+            key = self.text_key(normalized)
+            keys.append(key)
+            previous_row = reusable.get(key)
+            if previous_row is not None:
+                signatures.append(previous.signatures[previous_row])
+            else:
+                signatures.append(None)
+                new_texts.append(normalized)
+                new_rows.append(row)
+
+        if previous is not None and not new_texts and keys == previous.keys and previous.threshold == self.threshold:
+            logging.info(f"Quote dedup index is up to date ({len(keys)} quotes)")
+            return previous
+
+        self.keys = keys
+        self.signatures = np.empty((len(keys), self.num_perm), dtype=np.uint32)
+        for row, signature in enumerate(signatures):
+            if signature is not None:
+                self.signatures[row] = signature
+        if new_texts:
+            self.signatures[new_rows] = self.signatures_for(new_texts)
+        self._buckets = None
+        self._ensure_buckets()
+
+        # Only quotes sharing a bucket are compared; each pair is checked once
+        union_find = _UnionFind(len(keys))
+        checked = set()
+        empty = (self.signatures == _EMPTY).all(axis=1)
+        for members in self._bucket_runs():
+            members = [m for m in members if not empty[m]]
+            if len(members) < 2:
+                continue
+            block = self.signatures[members]
+            for i, first in enumerate(members[:-1]):
+                similarity = (block[i + 1:] == block[i]).mean(axis=1)
+                for second, value in zip(members[i + 1:], similarity.tolist()):
+                    if (first, second) in checked:
+                        continue
+                    checked.add((first, second))
+                    if value >= self.threshold:
+                        union_find.union(first, second)
+        self.canonical = np.array([union_find.find(i) for i in range(len(keys))], dtype=np.int64)
+
+        reused = len(keys) - len(new_texts)
+        logging.info(f"Built quote dedup index: {len(keys)} quotes ({reused} signatures reused), "
+                     f"{len(self.clusters())} duplicate clusters")
+        return self
+
+    # --- persistence ---
+
+    def compatible_with(self, other: 'QuoteDedupIndex') -> bool:
+        return (self.num_perm, self.bands, self.shingle_size, self.seed) == \
+               (other.num_perm, other.bands, other.shingle_size, other.seed)
+
+    def save(self, path: str):
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            params=np.array([self.num_perm, self.bands, self.shingle_size, self.seed], dtype=np.int64),
+            threshold=np.array([self.threshold]),
+            keys=np.array(self.keys, dtype='U16'),
+            signatures=self.signatures,
+            canonical=self.canonical,
+        )
+        atomic_write(path, buffer.getvalue())
+
+    @classmethod
+    def load(cls, path: str) -> Optional['QuoteDedupIndex']:
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                num_perm, bands, shingle_size, seed = (int(v) for v in data['params'])
+                index = cls(num_perm, bands, float(data['threshold'][0]), shingle_size, seed)
+                index.keys = [str(k) for k in data['keys']]
+                index.signatures = data['signatures'].astype(np.uint32)
+                index.canonical = data['canonical'].astype(np.int64)
+            return index
+        except Exception as e:
+            logging.warning(f"Could not load quote dedup index {path}: {e}")
+            return None
+
+    # --- reporting ---
+
+    def report(self, quote_source) -> str:
+        """Human-readable list of duplicate clusters."""
+        clusters = self.clusters()
+        if not clusters:
+            return f"No near-duplicate quotes found in {len(self)} quotes."
+        lines = [f"Found {len(clusters)} clusters of near-duplicate quotes in {len(self)} quotes:"]
+        for number, members in enumerate(clusters, 1):
+            lines.append(f"\nCluster {number}:")
+            for index in members:
+                quote = quote_source.get(index)
+                lines.append(f"  [{index}] \"{quote.get('Quote', '')}\" - {quote.get('Author', '')}")
+        return "\n".join(lines)
+
+
+def dedup_index_path(quote_source) -> str:
+    """Where the dedup index for a quote source is stored (next to file catalogs)."""
+    from config import DEDUP_INDEX_FILE
+
+    path = getattr(quote_source, 'path', None)
+    return f"{path}.dedup.npz" if path else DEDUP_INDEX_FILE
+
+
+def load_or_build_index(quote_source) -> QuoteDedupIndex:
+    """Load the stored index for `quote_source`, refreshing and saving it if the catalog changed."""
+    from config import DEDUP_SIMILARITY_THRESHOLD, DEDUP_NUM_PERMUTATIONS, DEDUP_LSH_BANDS
+
+    path = dedup_index_path(quote_source)
+    previous = QuoteDedupIndex.load(path)
+    index = QuoteDedupIndex(DEDUP_NUM_PERMUTATIONS, DEDUP_LSH_BANDS, DEDUP_SIMILARITY_THRESHOLD)
+    built = index.build(quote_source, previous)
+    if built is not previous:
+        built.save(path)
+    built.threshold = DEDUP_SIMILARITY_THRESHOLD
+    return built
+
+
+def main():
+    from quote_source import create_quote_source_from_config
+
+    quote_source = create_quote_source_from_config()
+    index = load_or_build_index(quote_source)
+    if len(sys.argv) > 2 and sys.argv[1] == '--check':
+        matches = index.query(sys.argv[2])
+        if not matches:
+            print("✅ No near-duplicates found.")
+        for match, similarity in matches:
+            quote = quote_source.get(match)
+            print(f"⚠️ {similarity:.0%} similar to [{match}] \"{quote.get('Quote', '')}\" - {quote.get('Author', '')}")
+    else:
+        print(index.report(quote_source))
+
+
+if __name__ == "__main__":
+    main()
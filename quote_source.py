@@ -0,0 +1,193 @@
+"""
+Quote sources for Instagram AI Agent
+Serves quotes from Google Sheets or from local CSV / Parquet / Arrow files
+"""
+
+import os
+import csv
+from array import array
+from typing import Optional, Dict, Iterator
+
+REQUIRED_COLUMNS = ['Quote', 'Author']
+
+
+class QuoteSource:
+    """
+    Base interface for quote backends.
+    Every source behaves like a read-only sequence of {'Quote': ..., 'Author': ...} dicts.
+    """
+
+    name = 'base'
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def get(self, index: int) -> Dict[str, str]:
+        """Return the quote at `index` (0-based)."""
+        raise NotImplementedError
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        for index in range(len(self)):
+            yield self.get(index)
+
+    @property
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    def close(self):
+        """Release any file handles held by the source."""
+        pass
+
+
+class GoogleSheetsQuoteSource(QuoteSource):
+    """Quotes fetched from a Google Sheet worksheet (loaded once, held as a list of dicts)."""
+
+    name = 'google_sheets'
+
+    def __init__(self, credentials_path: str, sheet_name: str, worksheet_index: int = 0):
+        import gspread
+
+        gc = gspread.service_account(filename=credentials_path)
+        worksheet = gc.open(sheet_name).get_worksheet(worksheet_index)
+        self.records = worksheet.get_all_records()
+        self.columns = list(self.records[0].keys()) if self.records else []
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get(self, index: int) -> Dict[str, str]:
+        return self.records[index]
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        return iter(self.records)
+
+
+class CSVQuoteSource(QuoteSource):
+    """
+    Quotes streamed from a CSV file.
+    A single pass over the file records the byte offset of every row, so `get(index)`
+    is one seek plus one row parse and the file is never held in memory (or kept open).
+    """
+
+    name = 'csv'
+
+    def __init__(self, path: str, encoding: str = 'utf-8-sig'):
+        self.path = path
+        self.encoding = encoding
+        with open(path, 'rb') as f:
+            self.columns = self._read_header(f)
+            self._offsets = self._index_rows(f)
+
+    def _read_header(self, f):
+        header = self._read_record(f)
+        if header is None:
+            return []
+        return next(csv.reader([header]))
+
+    def _read_record(self, f) -> Optional[str]:
+        """Read one CSV record from the current position of `f` (handles quoted newlines)."""
+        parts = []
+        quotes = 0
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            parts.append(line)
+            quotes += line.count(b'"')
+            # An even number of quote characters means we are outside a quoted field
+            if quotes % 2 == 0:
+                break
+        if not parts:
+            return None
+        return b''.join(parts).decode(self.encoding)
+
+    def _index_rows(self, f) -> array:
+        offsets = array('q')
+        while True:
+            offset = f.tell()
+            record = self._read_record(f)
+            if record is None:
+                break
+            if record.strip():
+                offsets.append(offset)
+        return offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def get(self, index: int) -> Dict[str, str]:
+        with open(self.path, 'rb') as f:
+            f.seek(self._offsets[index])
+            record = self._read_record(f)
+        row = next(csv.reader([record]))
+        return dict(zip(self.columns, row))
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        with open(self.path, 'r', encoding=self.encoding, newline='') as f:
+            for row in csv.DictReader(f):
+                yield row
+
+
+class ArrowQuoteSource(QuoteSource):
+    """
+    Quotes from an Arrow IPC (.arrow / .feather) or Parquet file.
+    Arrow IPC files are memory-mapped and read zero-copy; Parquet is decoded once,
+    reading only the Quote and Author columns.
+    """
+
+    name = 'arrow'
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("pyarrow is required for Parquet/Arrow quote files: pip install pyarrow")
+
+        self.path = path
+        if path.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            table = pq.read_table(path, columns=REQUIRED_COLUMNS, memory_map=True)
+        else:
+            source = pa.memory_map(path, 'r')
+            table = pa.ipc.open_file(source).read_all()
+        self.columns = table.column_names
+        self._quotes = table.column('Quote') if 'Quote' in self.columns else None
+        self._authors = table.column('Author') if 'Author' in self.columns else None
+        self._length = table.num_rows
+
+    def __len__(self) -> int:
+        return self._length
+
+    def get(self, index: int) -> Dict[str, str]:
+        return {
+            'Quote': self._quotes[index].as_py(),
+            'Author': self._authors[index].as_py(),
+        }
+
+
+def open_quote_file(path: str) -> QuoteSource:
+    """Open a local quote file, picking the backend from its extension."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return CSVQuoteSource(path)
+    if extension in ('.parquet', '.arrow', '.feather', '.ipc'):
+        return ArrowQuoteSource(path)
+    raise ValueError(f"Unsupported quote file type: {path}")
+
+
+def missing_columns(source: QuoteSource):
+    """Return the required columns the source does not provide."""
+    return [col for col in REQUIRED_COLUMNS if col not in source.columns]
+
+
+def create_quote_source_from_config() -> Optional[QuoteSource]:
+    """
+    Create the quote source selected in config.py
+    """
+    from config import QUOTE_SOURCE, QUOTE_FILE_PATH, GOOGLE_CREDENTIALS_PATH, SHEET_NAME, SHEET_WORKSHEET_INDEX
+
+    if QUOTE_SOURCE == 'google_sheets':
+        return GoogleSheetsQuoteSource(GOOGLE_CREDENTIALS_PATH, SHEET_NAME, SHEET_WORKSHEET_INDEX)
+    if QUOTE_SOURCE == 'file':
+        return open_quote_file(QUOTE_FILE_PATH)
+    raise ValueError(f"Unknown quote source: {QUOTE_SOURCE}")
@@ -0,0 +1,58 @@
+"""
+Local state files for Instagram AI Agent
+Writes go to a temporary file in the same directory and are then moved into place,
+so a crash or restart never leaves a half-written state file behind.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+
+
+def atomic_write(path, data: bytes):
+    """Atomically replace `path` with `data`."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path, data):
+    """Atomically write `data` as indented JSON."""
+    atomic_write(path, json.dumps(data, indent=2).encode('utf-8'))
+
+
+def load_json(path, default=None):
+    """Load a JSON state file, returning `default` (or {}) if it is missing or unreadable."""
+    if default is None:
+        default = {}
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable state file {path}: {e}")
+        return default
+
+
+def file_md5(path, chunk_size=1024 * 1024):
+    """MD5 hex digest of a local file (the same checksum Drive reports as md5Checksum)."""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -1,14 +1,18 @@
+import os
 import requests
 import time
 
-ACCESS_TOKEN = "EAAIXWsXZA6JUBO7tA0jBl0koV1ixd7vrZAdLbh7OKZAsHoaVwPPrTHZA7lfCVLTPcR08kezSwFai01HF973LMCbmrJFyn4v7do8n4HXtFTyRok4T1HedhCZBhXBZCZCX1bZCNfrZBk9wddJcPFDjdfBhZA23irufxt0aH9vN42SfwZCz505Jg87x7k9fld4cjZAkhTnC"
-IG_USER_ID = "17841468902818843"
-VIDEO_URL = "https://drive.google.com/uc?id=1K4aMBIKnAzMHt2RnU5ldkXGxyNM-FP9Z&export=download"
+# Runs against the local stand-in by default: start it with `python mock_graph_server.py serve`.
+# Set GRAPH_API_BASE_URL=https://graph.facebook.com and real credentials to post for real.
+BASE_URL = os.environ.get("GRAPH_API_BASE_URL", "http://127.0.0.1:8765")
+ACCESS_TOKEN = os.environ.get("INSTAGRAM_ACCESS_TOKEN", "mock-token")
+IG_USER_ID = os.environ.get("INSTAGRAM_USER_ID", "17841400000000000")
+VIDEO_URL = os.environ.get("TEST_VIDEO_URL", "https://example.com/video.mp4")
 
 CAPTION = "Test post with direct video URL!"
 
 # Step 1: Create media container
-media_url = f"https://graph.facebook.com/v18.0/{IG_USER_ID}/media"
+media_url = f"{BASE_URL}/v19.0/{IG_USER_ID}/media"
 params = {
     "media_type": "REELS",  # or "VIDEO" for a regular post
     "video_url": VIDEO_URL,
@@ -23,7 +27,7 @@ creation_id = resp.json().get("id")
 if creation_id:
     status_code = None
     for i in range(12):  # Try for up to 2 minutes (12 x 10s)
-        status_url = f"https://graph.facebook.com/v18.0/{creation_id}?fields=status_code&access_token={ACCESS_TOKEN}"
+        status_url = f"{BASE_URL}/v19.0/{creation_id}?fields=status_code&access_token={ACCESS_TOKEN}"
         status_resp = requests.get(status_url)
         status_json = status_resp.json()
         status_code = status_json.get("status_code")
@@ -35,7 +39,7 @@ if creation_id:
             break
         time.sleep(10)
     if status_code == "FINISHED":
-        publish_url = f"https://graph.facebook.com/v18.0/{IG_USER_ID}/media_publish"
+        publish_url = f"{BASE_URL}/v19.0/{IG_USER_ID}/media_publish"
         publish_params = {
             "creation_id": creation_id,
             "access_token": ACCESS_TOKEN
@@ -45,4 +49,4 @@ if creation_id:
     else:
         print("Media was not ready after waiting or an error occurred.")
 else:
-    print("Failed to create media container.")
\ No newline at end of file
+    print("Failed to create media container.")
@@ -0,0 +1,39 @@
+"""
+Shared fixtures for the Instagram AI Agent tests
+Every test talks to a fresh local Graph API stand-in (mock_graph_server) instead of Meta.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import credential_check  # noqa: E402
+import graph_client  # noqa: E402
+import publisher  # noqa: E402
+from graph_client import GraphClient  # noqa: E402
+from mock_graph_server import MockGraphServer  # noqa: E402
+
+IG_USER_ID = '17841400000000000'
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    """Keep processing stats and credential checks out of the working tree and poll fast."""
+    monkeypatch.setattr(graph_client, 'CONTAINER_STATS_FILE', str(tmp_path / 'container_stats.json'))
+    monkeypatch.setattr(credential_check, 'CREDENTIAL_CACHE_FILE', str(tmp_path / 'credential_cache.json'))
+    monkeypatch.setattr(publisher, 'CONTAINER_POLL_INITIAL_SECONDS', 0.05)
+
+
+@pytest.fixture
+def server():
+    mock = MockGraphServer(processing='fixed:0.3').start()
+    yield mock
+    mock.stop()
+
+
+@pytest.fixture
+def graph(server):
+    return GraphClient('mock-token', base_url=server.base_url, upload_base_url=server.upload_base_url)
@@ -0,0 +1,51 @@
+"""Credential check cache against the local Graph API stand-in."""
+
+import time
+
+from conftest import IG_USER_ID
+from credential_check import CredentialCheck
+from graph_client import GraphClient
+from mock_graph_server import INVALID_TOKEN
+from state_store import atomic_write_json, load_json
+
+
+def seed_cache(check, hours_ago):
+    """Cache a successful check made `hours_ago`."""
+    atomic_write_json(check.path, {check.key: {'checked_at': time.time() - hours_ago * 3600, 'username': 'cached_user',
+                                               'expires_at': 0}})
+
+
+def test_fresh_cache_skips_the_live_check(server, graph, tmp_path):
+    check = CredentialCheck(graph, IG_USER_ID, path=str(tmp_path / 'credential_cache.json'), ttl_hours=1)
+    assert check.check()
+    calls = server.state.requests['account']
+    assert check.validate()
+    assert server.state.requests['account'] == calls
+
+
+def test_transient_error_keeps_the_cached_check(server, graph, tmp_path):
+    check = CredentialCheck(graph, IG_USER_ID, path=str(tmp_path / 'credential_cache.json'), ttl_hours=1)
+    seed_cache(check, hours_ago=1.5)
+    server.state.error_rate = 1.0
+
+    assert check.validate()
+    assert server.state.requests['injected_error'] >= 1
+    assert load_json(check.path)[check.key]['username'] == 'cached_user'
+
+
+def test_transient_error_without_a_recent_check_fails(server, graph, tmp_path):
+    check = CredentialCheck(graph, IG_USER_ID, path=str(tmp_path / 'credential_cache.json'), ttl_hours=1)
+    seed_cache(check, hours_ago=3)
+    server.state.error_rate = 1.0
+
+    assert not check.validate()
+    assert check.key in load_json(check.path)
+
+
+def test_invalid_token_drops_the_cached_check(server, tmp_path):
+    graph = GraphClient(INVALID_TOKEN, base_url=server.base_url, upload_base_url=server.upload_base_url)
+    check = CredentialCheck(graph, IG_USER_ID, path=str(tmp_path / 'credential_cache.json'), ttl_hours=1)
+    seed_cache(check, hours_ago=1.5)
+
+    assert not check.validate()
+    assert check.key not in load_json(check.path)
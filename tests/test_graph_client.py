@@ -0,0 +1,174 @@
+import time
+import random
+
+import pytest
+
+from conftest import IG_USER_ID
+from graph_client import GraphClient, GraphAPIError
+from mock_graph_server import INVALID_TOKEN
+from publisher import MultiPublisher
+
+VIDEO_URL = 'https://example.com/video.mp4'
+
+
+def fail_first_calls(monkeypatch, count):
+    """Make the stand-in's error injection fire on its next `count` checks only."""
+    calls = {'n': 0}
+
+    def scripted():
+        calls['n'] += 1
+        return 0.0 if calls['n'] <= count else 0.99
+
+    monkeypatch.setattr(random, 'random', scripted)
+
+
+def test_create_container_and_poll_status(graph):
+    container_id = graph.create_video_container(IG_USER_ID, VIDEO_URL, 'caption')
+    assert graph.container_status(container_id)['status_code'] == 'IN_PROGRESS'
+    time.sleep(0.4)
+    status = graph.container_status(container_id)
+    assert status['status_code'] == 'FINISHED'
+    assert status['status'].startswith('Finished')
+
+
+def test_wait_for_container_finishes(graph):
+    container_id = graph.create_video_container(IG_USER_ID, VIDEO_URL)
+    assert graph.wait_for_container(container_id, deadline=5, initial_interval=0.05) == 'FINISHED'
+
+
+def test_wait_for_container_gives_up_at_deadline(server, graph):
+    server.state.processing = lambda: 60
+    container_id = graph.create_video_container(IG_USER_ID, VIDEO_URL)
+    started = time.time()
+    assert graph.wait_for_container(container_id, deadline=0.5, initial_interval=0.05) is None
+    assert time.time() - started < 2
+
+
+def test_wait_for_container_raises_on_processing_error(server, graph):
+    server.state.processing_error_rate = 1.0
+    container_id = graph.create_video_container(IG_USER_ID, VIDEO_URL)
+    with pytest.raises(GraphAPIError, match='2207026'):
+        graph.wait_for_container(container_id, deadline=5, initial_interval=0.05)
+
+
+def test_wait_for_container_polls_through_transient_errors(server, graph, monkeypatch):
+    container_id = graph.create_video_container(IG_USER_ID, VIDEO_URL)
+    server.state.error_rate = 0.5
+    fail_first_calls(monkeypatch, 2)
+    assert graph.wait_for_container(container_id, deadline=5, initial_interval=0.05) == 'FINISHED'
+    assert server.state.requests['injected_error'] == 2
+
+
+def test_container_statuses_uses_one_request(server, graph):
+    ids = [graph.create_video_container(IG_USER_ID, VIDEO_URL) for _ in range(3)]
+    statuses = graph.container_statuses(ids)
+    assert set(statuses) == set(ids)
+    assert all(status['status_code'] == 'IN_PROGRESS' for status in statuses.values())
+    assert server.state.requests['multi_status'] == 1
+
+
+def test_publish_container(server, graph):
+    container_id = graph.create_video_container(IG_USER_ID, VIDEO_URL)
+    with pytest.raises(GraphAPIError) as not_ready:
+        graph.publish_container(IG_USER_ID, container_id)
+    assert not_ready.value.subcode == 2207027 and not not_ready.value.transient
+    graph.wait_for_container(container_id, deadline=5, initial_interval=0.05)
+    media_id = graph.publish_container(IG_USER_ID, container_id)
+    assert media_id in server.state.media
+    assert graph.container_status(container_id)['status_code'] == 'PUBLISHED'
+
+
+def test_publish_video(server, graph):
+    media_id = graph.publish_video(IG_USER_ID, VIDEO_URL, 'caption', deadline=5)
+    assert media_id in server.state.media
+
+
+def test_invalid_token_is_not_transient(server):
+    graph = GraphClient(INVALID_TOKEN, base_url=server.base_url)
+    with pytest.raises(GraphAPIError) as error:
+        graph.get(IG_USER_ID, fields='username')
+    assert error.value.code == 190
+    assert error.value.status == 400
+    assert not error.value.transient
+
+
+def test_server_error_is_transient(server, graph):
+    server.state.error_rate = 1.0
+    with pytest.raises(GraphAPIError) as error:
+        graph.create_video_container(IG_USER_ID, VIDEO_URL)
+    assert error.value.transient
+    assert error.value.status == 500
+
+
+def test_connection_error_is_transient_and_hides_token():
+    graph = GraphClient('secret-token', base_url='http://127.0.0.1:9')
+    with pytest.raises(GraphAPIError) as error:
+        graph.get('debug_token', input_token='secret-token')
+    assert error.value.transient
+    assert 'secret-token' not in str(error.value)
+
+
+def test_direct_upload_resumes_after_transient_error(server, graph, tmp_path, monkeypatch):
+    video = tmp_path / 'video.mp4'
+    video.write_bytes(b'\0' * 250_000)
+    container_id = graph.create_resumable_video_container(IG_USER_ID)
+    server.state.error_rate = 0.5
+    fail_first_calls(monkeypatch, 1)
+    graph.upload_video_file(container_id, str(video), chunk_size=100_000)
+    assert graph.upload_offset(container_id) == 250_000
+    assert server.state.requests['injected_error'] == 1
+    assert graph.wait_for_container(container_id, deadline=5, initial_interval=0.05) == 'FINISHED'
+
+
+def test_multi_publisher_publishes_every_post(server, graph):
+    other = GraphClient('mock-token-2', base_url=server.base_url)
+    publisher = MultiPublisher()
+    for client in (graph, graph, other):
+        publisher.add(client, IG_USER_ID, VIDEO_URL)
+    results = publisher.run(deadline=5)
+    assert len(results) == 3 and all(results.values())
+    assert server.state.requests['create_container'] == 3
+    assert server.state.requests['status'] == 0
+
+
+def test_multi_publisher_requeues_only_failed_posts(server, graph):
+    publisher = MultiPublisher()
+    publisher.add(graph, IG_USER_ID, VIDEO_URL, label='main')
+    publisher.add(graph, '17841400000000001', VIDEO_URL, label='extra')
+    assert publisher.prepare(deadline=5) == ['main', 'extra']
+    publisher.ready[1]['container_id'] = 'missing'  # media_publish fails for 'extra' only
+    results = publisher.publish_ready()
+    assert results['main'] and not results['extra']
+
+    assert publisher.requeue_failed() == ['extra']
+    retried = publisher.run(deadline=5)
+    assert list(retried) == ['extra'] and retried['extra']
+    assert len(server.state.media) == 2
+    assert publisher.requeue_failed() == []
+
+
+def test_published_container_is_not_published_again(server, graph):
+    container_id = graph.create_video_container(IG_USER_ID, VIDEO_URL)
+    graph.wait_for_container(container_id, deadline=5, initial_interval=0.05)
+    graph.publish_container(IG_USER_ID, container_id)
+    assert graph.wait_for_container(container_id, deadline=5, initial_interval=0.05) == 'PUBLISHED'
+
+    publisher = MultiPublisher()
+    publisher.add(graph, IG_USER_ID, VIDEO_URL, label='main')
+    post = publisher.posts[0]
+    publisher._create = lambda post: post.update(container_id=container_id, created=time.time())
+    assert publisher.run(deadline=5) == {'main': None}
+    assert post['published']
+    assert publisher.requeue_failed() == []
+    assert server.state.requests['publish'] == 1
+
+
+def test_usage_pacing_never_delays_a_poll_past_its_deadline(server, graph, monkeypatch):
+    import graph_usage
+    monkeypatch.setattr(graph_usage, '_budget', graph_usage.UsageBudget())
+    server.state.usage_percent = 99
+    container_id = graph.create_video_container(IG_USER_ID, VIDEO_URL, 'caption')
+
+    started = time.time()
+    assert graph.wait_for_container(container_id, deadline=1.0) == 'FINISHED'
+    assert time.time() - started < 5
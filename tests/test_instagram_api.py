@@ -0,0 +1,49 @@
+"""InstagramAPI posting flows end to end against the local Graph API stand-in."""
+
+from conftest import IG_USER_ID
+from graph_client import GraphClient
+from instagram_api import InstagramAPI
+from mock_graph_server import INVALID_TOKEN
+
+VIDEO_URL = 'https://example.com/video.mp4'
+
+
+def make_api(graph):
+    return InstagramAPI(graph.access_token, IG_USER_ID, graph=graph)
+
+
+def test_post_video(server, graph):
+    assert make_api(graph).post_video(VIDEO_URL, 'caption')
+    assert server.state.requests['create_container'] == 1
+    assert server.state.requests['publish'] == 1
+    assert len(server.state.media) == 1
+
+
+def test_post_local_video(server, graph, tmp_path):
+    video = tmp_path / 'video.mp4'
+    video.write_bytes(b'\0' * 300_000)
+    assert make_api(graph).post_local_video(str(video), 'caption')
+    assert server.state.requests['rupload'] >= 1
+    assert len(server.state.media) == 1
+
+
+def test_processing_error_is_not_published(server, graph):
+    server.state.processing_error_rate = 1.0
+    assert not make_api(graph).post_video(VIDEO_URL, 'caption')
+    assert server.state.requests['create_container'] == 1
+    assert server.state.requests['publish'] == 0
+
+
+def test_invalid_token_stops_before_any_container(server):
+    graph = GraphClient(INVALID_TOKEN, base_url=server.base_url, upload_base_url=server.upload_base_url)
+    assert not make_api(graph).post_video(VIDEO_URL, 'caption')
+    assert server.state.requests['invalid_token'] >= 1
+    assert server.state.requests['create_container'] == 0
+
+
+def test_graph_outage_fails_cleanly(server, graph):
+    api = make_api(graph)
+    assert api.validate_credentials()
+    server.state.error_rate = 1.0
+    assert not api.post_video(VIDEO_URL, 'caption')
+    assert not server.state.media
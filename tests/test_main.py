@@ -0,0 +1,84 @@
+"""InstagramAIAgent.publish_prepared_post end to end against the local Graph API stand-in."""
+
+import os
+
+import pytest
+
+import graph_client
+import main
+import token_manager
+from conftest import IG_USER_ID
+from mock_graph_server import INVALID_TOKEN
+
+VIDEO_URL = 'https://example.com/video.mp4'
+
+
+@pytest.fixture
+def make_agent(server, tmp_path, monkeypatch):
+    """Build an agent that posts to the stand-in only, with Drive off and state under tmp_path."""
+    monkeypatch.setattr(graph_client, 'GRAPH_API_BASE_URL', server.base_url)
+    monkeypatch.setattr(graph_client, 'INSTAGRAM_UPLOAD_BASE_URL', server.upload_base_url)
+    monkeypatch.setattr(token_manager, 'TOKEN_STATE_FILE', str(tmp_path / 'token_state.json'))
+    monkeypatch.setattr(token_manager, '_managers', {})
+    for name, value in {'USE_GOOGLE_DRIVE': False, 'ENABLE_INSTAGRAM_POSTING': True, 'INSTAGRAM_USER_ID': IG_USER_ID,
+                        'INSTAGRAM_EXTRA_ACCOUNTS': [], 'INSTAGRAM_DIRECT_UPLOAD': False,
+                        'MANAGE_QUOTES_IN_SHEET': False, 'MUSIC_CACHE_ENABLED': False,
+                        'PROGRESS_FILE': str(tmp_path / 'progress.json')}.items():
+        monkeypatch.setattr(main, name, value)
+
+    def build(access_token='mock-token'):
+        monkeypatch.setattr(main, 'INSTAGRAM_ACCESS_TOKEN', access_token)
+        return main.InstagramAIAgent()
+    return build
+
+
+def prepared_post(**overrides):
+    prepared = {'quote': 'Quote', 'author': 'Author', 'quote_source': [], 'music_file': None,
+                'video_filename': 'video.mp4', 'drive_id': None, 'public_url': VIDEO_URL, 'caption': 'caption',
+                'video_size': None, 'video_path': None, 'publisher': None}
+    prepared.update(overrides)
+    return prepared
+
+
+def test_publish_prepared_post(server, make_agent):
+    agent = make_agent()
+    assert agent.publish_prepared_post(prepared_post())
+    assert server.state.requests['publish'] == 1
+    assert len(server.state.media) == 1
+    assert agent.last_published_at
+    assert os.path.exists(main.PROGRESS_FILE)
+
+
+def test_publish_prepared_containers(server, make_agent):
+    agent = make_agent()
+    prepared = prepared_post()
+    prepared['publisher'] = agent.prepare_containers(prepared)
+    assert server.state.requests['create_container'] == 1
+
+    assert agent.publish_prepared_post(prepared)
+    assert server.state.requests['create_container'] == 1
+    assert server.state.requests['publish'] == 1
+
+
+def test_processing_error_keeps_the_progress(server, make_agent):
+    server.state.processing_error_rate = 1.0
+    agent = make_agent()
+    assert not agent.publish_prepared_post(prepared_post())
+    assert not server.state.media
+    assert agent.last_published_at is None
+    assert not os.path.exists(main.PROGRESS_FILE)
+
+
+def test_invalid_token_publishes_nothing(server, make_agent):
+    agent = make_agent(INVALID_TOKEN)
+    assert not agent.publish_prepared_post(prepared_post())
+    assert server.state.requests['create_container'] == 0
+    assert not os.path.exists(main.PROGRESS_FILE)
+
+
+def test_graph_outage_publishes_nothing(server, make_agent):
+    agent = make_agent()
+    assert agent.validate_instagram_api()
+    server.state.error_rate = 1.0
+    assert not agent.publish_prepared_post(prepared_post())
+    assert not server.state.media
@@ -0,0 +1,74 @@
+"""Long-lived token refresh against the local Graph API stand-in."""
+
+import os
+import time
+
+import pytest
+
+import graph_client
+import state_store
+from conftest import IG_USER_ID
+from graph_client import GraphClient, token_fingerprint
+from state_store import load_json
+from token_manager import TokenManager
+
+SEED_TOKEN = 'seed-token'
+
+
+@pytest.fixture
+def manager(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(graph_client, 'GRAPH_API_BASE_URL', server.base_url)
+    return TokenManager('main', SEED_TOKEN, path=str(tmp_path / 'token_state.json'),
+                        app_id='mock-app', app_secret='mock-secret')
+
+
+def test_refreshes_before_expiry(server, manager):
+    server.state.token_days = 5
+    assert manager.refresh_if_needed()
+    assert server.state.requests['token_exchange'] == 1
+    assert manager.token() != SEED_TOKEN
+    assert 4.9 * 86400 < manager.expires_at - time.time() <= 5 * 86400
+
+
+def test_keeps_a_token_far_from_expiry(server, manager):
+    server.state.token_days = 60
+    assert not manager.refresh_if_needed()
+    assert server.state.requests['token_exchange'] == 0
+    assert manager.token() == SEED_TOKEN
+    assert manager.expires_at > time.time() + 59 * 86400
+
+
+def test_refreshed_token_is_saved_and_reloaded(server, manager):
+    server.state.token_days = 5
+    manager.refresh_if_needed()
+
+    entry = load_json(manager.path)['main']
+    assert entry['seed'] == token_fingerprint(SEED_TOKEN)
+    assert entry['access_token'] == manager.token()
+    assert TokenManager('main', SEED_TOKEN, path=manager.path).token() == manager.token()
+    # A new token in the environment replaces the stored one
+    assert TokenManager('main', 'new-seed-token', path=manager.path).token() == 'new-seed-token'
+
+
+def test_failed_state_write_leaves_the_old_state(server, manager, tmp_path, monkeypatch):
+    server.state.token_days = 5
+    manager._lookup_expiry()
+    before = load_json(manager.path)
+
+    def crash(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(state_store.os, 'replace', crash)
+    assert not manager.refresh_if_needed()
+    assert load_json(manager.path) == before
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_client_picks_up_a_refreshed_token(server, manager):
+    server.state.token_days = 5
+    client = GraphClient(token_provider=manager.token, base_url=server.base_url)
+    assert client.access_token == SEED_TOKEN
+
+    manager.refresh_if_needed()
+    assert client.access_token == manager.token() != SEED_TOKEN
+    assert client.get(IG_USER_ID, fields='id,username')['id'] == IG_USER_ID
@@ -0,0 +1,481 @@
+"""
+Text layout for Instagram AI Agent
+Wraps and measures quote/author text exactly as VideoCreator draws it, caches the
+resulting lines and positions, and validates at ingestion that every quote fits the frame.
+"""
+
+import os
+import json
+import atexit
+import hashlib
+import logging
+import threading
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageDraw, ImageFont
+
+from config import *
+from state_store import atomic_write_json, load_json
+
+FRAME_MARGIN = 50  # Minimum distance between text and the frame edge (pixels)
+LINE_SPACING = 15  # Extra pixels between wrapped lines
+
+
+@lru_cache(maxsize=64)
+def load_font(font_size):
+    """Load the text font at `font_size` (cached per size)."""
+    for font_path in TEXT_FONT_PATHS:
+        try:
+            return ImageFont.truetype(font_path, font_size)
+        except Exception:
+            continue
+    logging.warning("Using default font")
+    return ImageFont.load_default()
+
+
+_measure_draw = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+
+
+def text_width(text, font):
+    bbox = _measure_draw.textbbox((0, 0), text, font=font)
+    return bbox[2] - bbox[0]
+
+
+def wrap_text(text, font, max_width):
+    """Greedy word wrap: as many words per line as fit in `max_width`."""
+    words = text.split()
+    lines = []
+    current_line = []
+    for word in words:
+        test_line = ' '.join(current_line + [word])
+        if text_width(test_line, font) <= max_width:
+            current_line.append(word)
+        else:
+            if current_line:
+                lines.append(' '.join(current_line))
+                current_line = [word]
+            else:
+                lines.append(word)
+    if current_line:
+        lines.append(' '.join(current_line))
+    return lines
+
+
+def compute_layout(text, font_size, max_width, position, frame_width, frame_height, max_lines=None):
+    """
+    Wrap and place `text` the way VideoCreator.create_text_image draws it.
+    Returns a JSON-serialisable dict with the lines, their top-left positions and a fit status.
+    """
+    font = load_font(font_size)
+    lines = wrap_text(text, font, max_width)
+    line_height = font_size + LINE_SPACING
+    total_height = len(lines) * line_height
+    if position == 'center':
+        y = (frame_height - total_height) // 2
+        y = max(FRAME_MARGIN, min(y, frame_height - total_height - FRAME_MARGIN))
+    else:
+        y = position[1]
+
+    positions = []
+    widths = []
+    for i, line in enumerate(lines):
+        line_width = text_width(line, font)
+        line_x = (frame_width - line_width) // 2
+        line_x = max(FRAME_MARGIN, min(line_x, frame_width - line_width - FRAME_MARGIN))
+        positions.append([line_x, y + i * line_height])
+        widths.append(line_width)
+
+    problems = []
+    if any(width > max_width for width in widths):
+        problems.append('line wider than text box')
+    if y < FRAME_MARGIN or y + total_height > frame_height - FRAME_MARGIN:
+        problems.append('text taller than frame')
+    if max_lines is not None and len(lines) > max_lines:
+        problems.append(f'{len(lines)} lines (max {max_lines})')
+
+    return {
+        'font_size': font_size,
+        'lines': lines,
+        'positions': positions,
+        'line_height': line_height,
+        'top': y,
+        'bottom': y + total_height,
+        'fits': not problems,
+        'problems': problems,
+    }
+
+
+# --- Automatic font sizing ---
+
+ADVANCE_REFERENCE_SIZE = 200  # Glyph advances are measured once at this size and scaled linearly
+
+
+class GlyphAdvances:
+    """Advance widths of the text font's glyphs, measured once at a reference size."""
+
+    def __init__(self):
+        self.font = load_font(ADVANCE_REFERENCE_SIZE)
+        self._advances = {}
+
+    def width(self, text):
+        """Width of `text` at ADVANCE_REFERENCE_SIZE (sum of glyph advances, no kerning)."""
+        advances = self._advances
+        total = 0.0
+        for char in text:
+            advance = advances.get(char)
+            if advance is None:
+                advance = advances[char] = self.font.getlength(char)
+            total += advance
+        return total
+
+
+@lru_cache(maxsize=1)
+def glyph_advances():
+    return GlyphAdvances()
+
+
+def _estimated_line_count(word_widths, space_width, max_width):
+    """Line count of the greedy wrap, using precomputed word widths."""
+    lines = 0
+    current = None
+    for width in word_widths:
+        if current is not None and current + space_width + width <= max_width:
+            current += space_width + width
+        else:
+            lines += 1
+            current = width
+    return lines
+
+
+def fit_font_size(text, max_width, max_height, max_lines, min_size, max_size):
+    """
+    Largest font size in [min_size, max_size] whose wrapped text fits a max_width x max_height
+    box in at most max_lines lines. The binary search probes with scaled glyph advances
+    (microseconds per probe); the winner is then confirmed with exact text measurement.
+    """
+    advances = glyph_advances()
+    word_widths = [advances.width(word) for word in text.split()]
+    space_width = advances.width(' ')
+    widest = max(word_widths, default=0)
+
+    def estimated_fit(size):
+        scale = size / ADVANCE_REFERENCE_SIZE
+        if widest * scale > max_width:
+            return False
+        lines = _estimated_line_count([w * scale for w in word_widths], space_width * scale, max_width)
+        return lines <= max_lines and lines * (size + LINE_SPACING) <= max_height
+
+    def exact_fit(size):
+        font = load_font(size)
+        lines = wrap_text(text, font, max_width)
+        return (len(lines) <= max_lines and len(lines) * (size + LINE_SPACING) <= max_height
+                and all(text_width(line, font) <= max_width for line in lines))
+
+    best = min_size
+    low, high = min_size, max_size
+    while low <= high:
+        size = (low + high) // 2
+        if estimated_fit(size):
+            best = size
+            low = size + 1
+        else:
+            high = size - 1
+
+    # Advances ignore kerning and side bearings, so step down if the exact wrap disagrees
+    while best > min_size and not exact_fit(best):
+        best -= 1
+    return best
+
+
+def quote_box_height(settings):
+    """Height available to a vertically centred quote above the author line."""
+    author_top = settings['author_position'][1]
+    above_author = 2 * (author_top - AUTO_FIT_AUTHOR_GAP) - settings['height']
+    return min(above_author, settings['height'] - 2 * FRAME_MARGIN)
+
+
+def fitted_quote_font_size(quote, settings):
+    """Quote font size for a preset: fixed, or auto-fitted when AUTO_FIT_FONT_SIZE is on."""
+    if not AUTO_FIT_FONT_SIZE:
+        return settings['quote_font_size']
+    return fit_font_size(quote_display_text(quote), settings['quote_max_width'], quote_box_height(settings),
+                         MAX_QUOTE_LINES, AUTO_FIT_MIN_FONT_SIZE, AUTO_FIT_MAX_FONT_SIZE)
+
+
+def layout_key(text, font_size, max_width, position, frame_width, frame_height):
+    raw = json.dumps([text, font_size, max_width, position, frame_width, frame_height, TEXT_FONT_PATHS])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def preset_settings(preset_name=None):
+    """
+    Frame size, font sizes and text boxes for a preset ('default' = the active config),
+    matching the arguments VideoCreator passes to create_text_with_effect.
+    """
+    settings = {
+        'VIDEO_WIDTH': VIDEO_WIDTH,
+        'VIDEO_HEIGHT': VIDEO_HEIGHT,
+        'QUOTE_FONT_SIZE': QUOTE_FONT_SIZE,
+        'AUTHOR_FONT_SIZE': AUTHOR_FONT_SIZE,
+    }
+    if preset_name and preset_name != 'default':
+        settings.update(PRESETS[preset_name])
+    width, height = settings['VIDEO_WIDTH'], settings['VIDEO_HEIGHT']
+    return {
+        'width': width,
+        'height': height,
+        'quote_font_size': settings['QUOTE_FONT_SIZE'],
+        'quote_max_width': width - 300,
+        'quote_position': 'center',
+        'author_font_size': settings['AUTHOR_FONT_SIZE'],
+        'author_max_width': width - 200,
+        'author_position': [0, int(height * AUTHOR_POSITION_Y)],
+    }
+
+
+def quote_display_text(quote):
+    return str(quote)
+
+
+def author_display_text(author):
+    return f"- {author}"
+
+
+def layout_quote(quote, author, preset_name='default'):
+    """Layouts of a quote and its author for one preset, plus a combined fit status."""
+    settings = preset_settings(preset_name)
+    quote_font_size = fitted_quote_font_size(quote, settings)
+    quote_layout = compute_layout(
+        quote_display_text(quote), quote_font_size, settings['quote_max_width'],
+        settings['quote_position'], settings['width'], settings['height'], MAX_QUOTE_LINES)
+    author_layout = compute_layout(
+        author_display_text(author), settings['author_font_size'], settings['author_max_width'],
+        settings['author_position'], settings['width'], settings['height'], MAX_AUTHOR_LINES)
+
+    problems = [f"quote: {p}" for p in quote_layout['problems']] + \
+               [f"author: {p}" for p in author_layout['problems']]
+    if quote_layout['bottom'] > author_layout['top']:
+        problems.append('quote overlaps author')
+    return {
+        'quote': quote_layout,
+        'author': author_layout,
+        'fits': not problems,
+        'problems': problems,
+    }
+
+
+def _auto_fit_settings():
+    return [AUTO_FIT_FONT_SIZE, AUTO_FIT_MIN_FONT_SIZE, AUTO_FIT_MAX_FONT_SIZE, AUTO_FIT_AUTHOR_GAP]
+
+
+def quote_fit_key(quote, author, settings):
+    raw = json.dumps([quote_display_text(quote), author_display_text(author), settings,
+                      MAX_QUOTE_LINES, MAX_AUTHOR_LINES, TEXT_FONT_PATHS, _auto_fit_settings()])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def font_size_key(quote, settings):
+    raw = json.dumps([quote_display_text(quote), settings, MAX_QUOTE_LINES, TEXT_FONT_PATHS, _auto_fit_settings()])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class LayoutCache:
+    """
+    On-disk cache of text layouts (keyed by text, size, box and frame), of each quote's
+    fit status per preset and of auto-fitted quote font sizes.
+    Safe to share between the render and prefetch threads. Each table keeps at most
+    LAYOUT_CACHE_MAX_ENTRIES entries, least recently used first out, and the file is only
+    rewritten every LAYOUT_CACHE_SAVE_EVERY changes (and at exit).
+    """
+
+    def __init__(self, path=None):
+        self.path = path or LAYOUT_CACHE_FILE
+        data = load_json(self.path)
+        self.layouts = data.get('layouts', {})
+        self.fits = data.get('fits', {})
+        self.font_sizes = data.get('font_sizes', {})
+        self._unsaved = 0
+        self._lock = threading.Lock()
+
+    def _touch(self, table, key):
+        """Mark an entry as recently used (dicts keep insertion order)."""
+        table[key] = table.pop(key)
+
+    def _put(self, table, key, value):
+        table.pop(key, None)
+        table[key] = value
+        while len(table) > LAYOUT_CACHE_MAX_ENTRIES:
+            table.pop(next(iter(table)))
+        self._unsaved += 1
+
+    def get_layout(self, text, font_size, max_width, position, frame_width, frame_height):
+        """Cached layout for one text block, computing and storing it on a miss."""
+        position = list(position) if position != 'center' else position
+        key = layout_key(text, font_size, max_width, position, frame_width, frame_height)
+        with self._lock:
+            layout = self.layouts.get(key)
+            if layout is not None:
+                self._touch(self.layouts, key)
+        if layout is None:
+            layout = compute_layout(text, font_size, max_width, position, frame_width, frame_height)
+            with self._lock:
+                self._put(self.layouts, key, layout)
+        return layout
+
+    def get_quote_font_size(self, quote, preset_name='default'):
+        """Font size to render `quote` with; auto-fitted sizes are searched once and stored."""
+        settings = preset_settings(preset_name)
+        if not AUTO_FIT_FONT_SIZE:
+            return settings['quote_font_size']
+        key = font_size_key(quote, settings)
+        with self._lock:
+            size = self.font_sizes.get(key)
+            if size is not None:
+                self._touch(self.font_sizes, key)
+        if size is None:
+            size = fitted_quote_font_size(quote, settings)
+            with self._lock:
+                self._put(self.font_sizes, key, size)
+        return size
+
+    def get_fit(self, quote, author, preset_name='default', settings=None):
+        key = quote_fit_key(quote, author, settings or preset_settings(preset_name))
+        with self._lock:
+            fit = self.fits.get(key)
+            if fit is not None:
+                self._touch(self.fits, key)
+            return fit
+
+    def store_quote(self, quote, author, preset_name, result):
+        """
+        Store the fit status produced by layout_quote. Full layouts are kept only for the
+        active ('default') preset, the one renders use, to keep the cache file small.
+        """
+        settings = preset_settings(preset_name)
+        with self._lock:
+            self._put(self.fits, quote_fit_key(quote, author, settings), {
+                'fits': result['fits'],
+                'problems': result['problems'],
+            })
+            if AUTO_FIT_FONT_SIZE:
+                self._put(self.font_sizes, font_size_key(quote, settings), result['quote']['font_size'])
+        if preset_name != 'default':
+            return
+        quote_key = layout_key(quote_display_text(quote), result['quote']['font_size'], settings['quote_max_width'],
+                               settings['quote_position'], settings['width'], settings['height'])
+        author_key = layout_key(author_display_text(author), settings['author_font_size'], settings['author_max_width'],
+                                settings['author_position'], settings['width'], settings['height'])
+        with self._lock:
+            self._put(self.layouts, quote_key, result['quote'])
+            self._put(self.layouts, author_key, result['author'])
+
+    def save(self, force=False):
+        """Write the cache once LAYOUT_CACHE_SAVE_EVERY changes have piled up, or now if `force`."""
+        with self._lock:
+            if not self._unsaved or (not force and self._unsaved < LAYOUT_CACHE_SAVE_EVERY):
+                return
+            data = {'layouts': dict(self.layouts), 'fits': dict(self.fits), 'font_sizes': dict(self.font_sizes)}
+            self._unsaved = 0
+        try:
+            atomic_write_json(self.path, data)
+        except Exception as e:
+            logging.error(f"Error saving layout cache: {e}")
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_layout_cache():
+    """Process-wide LayoutCache instance."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = LayoutCache()
+            atexit.register(_shared_cache.save, force=True)
+        return _shared_cache
+
+
+def warm_render_layouts(quote, author):
+    """Load the fonts and cache the exact layouts VideoCreator will ask for when rendering this quote."""
+    cache = get_layout_cache()
+    settings = preset_settings('default')
+    quote_font_size = cache.get_quote_font_size(quote)
+    load_font(quote_font_size)
+    load_font(settings['author_font_size'])
+    cache.get_layout(quote_display_text(quote), quote_font_size, settings['quote_max_width'],
+                     settings['quote_position'], settings['width'], settings['height'])
+    cache.get_layout(author_display_text(author), settings['author_font_size'], settings['author_max_width'],
+                     settings['author_position'], settings['width'], settings['height'])
+    cache.save()
+
+
+def _layout_batch(batch):
+    """Worker: lay out a batch of (index, quote, author, preset) jobs."""
+    return [(index, quote, author, preset, layout_quote(quote, author, preset)) for index, quote, author, preset in batch]
+
+
+def layout_presets():
+    return ['default'] + list(PRESETS.keys())
+
+
+def precompute_layouts(quote_source, presets=None, cache=None, workers=None, batch_size=200):
+    """
+    Ingestion pass: lay out every quote and author for every preset, in parallel across
+    cores, and cache the results. Quotes already in the cache are skipped.
+    Returns a list of {'index', 'preset', 'problems'} for quotes that do not fit.
+    """
+    presets = presets or layout_presets()
+    cache = cache or get_layout_cache()
+    settings = {preset: preset_settings(preset) for preset in presets}
+
+    jobs = []
+    pending = {}
+    unfit = []
+    for index, row in enumerate(quote_source):
+        quote, author = row.get('Quote', ''), row.get('Author', '')
+        for preset in presets:
+            fit = cache.get_fit(quote, author, preset, settings[preset])
+            if fit is None:
+                # Identical quote/author rows are laid out once per pass
+                job_key = (quote, author, preset)
+                if job_key in pending:
+                    pending[job_key].append(index)
+                    continue
+                pending[job_key] = [index]
+                jobs.append((index, quote, author, preset))
+            elif not fit['fits']:
+                unfit.append({'index': index, 'preset': preset, 'problems': fit['problems']})
+
+    if jobs:
+        batches = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+        if len(batches) == 1 or (workers or os.cpu_count() or 1) == 1:
+            results = map(_layout_batch, batches)
+            executor = None
+        else:
+            # Startup and prefetch threads may be running: forking a threaded process can copy
+            # a held lock into the children, so the workers are spawned fresh instead
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            results = executor.map(_layout_batch, batches)
+        try:
+            for batch in results:
+                for index, quote, author, preset, result in batch:
+                    cache.store_quote(quote, author, preset, result)
+                    if not result['fits']:
+                        for same_index in pending[(quote, author, preset)]:
+                            unfit.append({'index': same_index, 'preset': preset, 'problems': result['problems']})
+        finally:
+            if executor:
+                executor.shutdown()
+        cache.save(force=True)
+        logging.info(f"Precomputed {len(jobs)} quote layouts across {len(presets)} presets")
+
+    unfit.sort(key=lambda item: (item['index'], item['preset']))
+    if unfit:
+        logging.warning(f"{len(unfit)} quote/preset combinations do not fit the frame")
+    for item in unfit:
+        if item['preset'] == 'default':
+            logging.warning(f"Quote {item['index']} does not fit: {', '.join(item['problems'])}")
+    return unfit
@@ -0,0 +1,121 @@
+"""
+Long-lived access token refresh for Instagram AI Agent
+Keeps each account's token with its expiry in a local state file and exchanges it for a fresh
+long-lived token (fb_exchange_token) well before it expires. Graph clients read the token
+through TokenManager.token, so a refreshed token is used without a restart.
+"""
+
+import time
+import logging
+import threading
+from typing import Optional, Dict
+
+from config import TOKEN_STATE_FILE, TOKEN_REFRESH_DAYS_BEFORE_EXPIRY, META_APP_ID, META_APP_SECRET
+from graph_client import GraphClient, GraphAPIError, token_fingerprint, redact_secrets
+from graph_usage import BACKGROUND
+from state_store import atomic_write_json, load_json
+
+
+class TokenManager:
+    """
+    The current token of one account. State in TOKEN_STATE_FILE:
+    {name: {'seed', 'access_token', 'expires_at', 'refreshed_at'}}, where 'seed' fingerprints the
+    configured token, so setting a new token in the environment replaces the stored one.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, name: str, configured_token: str, path: str = None,
+                 app_id: str = None, app_secret: str = None):
+        self.name = name
+        self.configured_token = configured_token
+        self.path = path or TOKEN_STATE_FILE
+        self.app_id = app_id or META_APP_ID
+        self.app_secret = app_secret or META_APP_SECRET
+        self._refresh_lock = threading.Lock()
+        self.graph = GraphClient(token_provider=self.token)
+        self._entry = self._load()
+
+    def _load(self) -> Dict:
+        with self._lock:
+            entry = load_json(self.path).get(self.name)
+        seed = token_fingerprint(self.configured_token)
+        if not entry or entry.get('seed') != seed:
+            entry = {'seed': seed, 'access_token': self.configured_token, 'expires_at': None, 'refreshed_at': None}
+        return entry
+
+    def _save(self):
+        with self._lock:
+            state = load_json(self.path)
+            state[self.name] = dict(self._entry)
+            atomic_write_json(self.path, state)
+
+    def token(self) -> Optional[str]:
+        return self._entry.get('access_token')
+
+    @property
+    def expires_at(self) -> Optional[float]:
+        return self._entry.get('expires_at')
+
+    def _lookup_expiry(self):
+        """Ask debug_token when the current token expires (0 means never)."""
+        data = self.graph.get('debug_token', priority=BACKGROUND, input_token=self.token()).get('data', {})
+        self._entry['expires_at'] = data.get('expires_at') or 0
+        self._save()
+
+    def needs_refresh(self) -> bool:
+        expires_at = self.expires_at
+        if not expires_at:
+            return False
+        return expires_at - time.time() < TOKEN_REFRESH_DAYS_BEFORE_EXPIRY * 86400
+
+    def refresh(self) -> bool:
+        """Exchange the current token for a new long-lived one and store it atomically."""
+        if not self.app_id or not self.app_secret:
+            logging.warning("META_APP_ID / META_APP_SECRET not set, cannot refresh the Instagram access token")
+            return False
+        # POST keeps the app secret and the token in the body, out of URLs and error text
+        result = self.graph.post('oauth/access_token', grant_type='fb_exchange_token', client_id=self.app_id,
+                                 client_secret=self.app_secret, fb_exchange_token=self.token())
+        new_token = result.get('access_token')
+        if not new_token:
+            raise GraphAPIError("Token exchange response has no access_token", payload=result)
+        expires_in = result.get('expires_in')
+        self._entry.update(access_token=new_token, refreshed_at=time.time(),
+                           expires_at=time.time() + int(expires_in) if expires_in else None)
+        self._save()
+        if self.expires_at is None:
+            self._lookup_expiry()
+        if self.expires_at:
+            logging.info(f"Refreshed access token for {self.name}, valid for "
+                         f"{(self.expires_at - time.time()) / 86400:.0f} days")
+        else:
+            logging.info(f"Refreshed access token for {self.name}")
+        return True
+
+    def refresh_if_needed(self) -> bool:
+        """Refresh when the token is within TOKEN_REFRESH_DAYS_BEFORE_EXPIRY days of expiring. Never raises."""
+        if not self.token():
+            return False
+        with self._refresh_lock:
+            try:
+                if self.expires_at is None:
+                    self._lookup_expiry()
+                if not self.needs_refresh():
+                    return False
+                return self.refresh()
+            except Exception as e:
+                logging.error(f"Could not refresh access token for {self.name}: {redact_secrets(e, self.app_secret, self.token())}")
+                return False
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_token_manager(name: str, configured_token: str) -> TokenManager:
+    """One shared manager per account, so every client sees a refresh."""
+    with _managers_lock:
+        if name not in _managers:
+            _managers[name] = TokenManager(name, configured_token)
+        return _managers[name]
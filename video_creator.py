@@ -2,11 +2,35 @@ import os
 import random
 import logging
 from datetime import datetime
-from moviepy.editor import *
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
-import numpy as np
 from config import *
 
+# moviepy, PIL and numpy are imported on first use so that the agent, the
+# schedulers and the cloud handlers can import this module without paying for them.
+_moviepy_configured = False
+
+def _configure_moviepy():
+    """Point MoviePy at ImageMagick once per process (PIL text rendering is the fallback)."""
+    global _moviepy_configured
+    if _moviepy_configured:
+        return
+    _moviepy_configured = True
+    try:
+        from moviepy.config import change_settings
+        change_settings({"IMAGEMAGICK_BINARY": "magick"})
+    except:
+        # If ImageMagick is not available, use PIL for text rendering
+        pass
+
+# Fragmented MP4: empty moov up front, then one fragment per keyframe appended in order,
+# so ffmpeg never seeks back into bytes that were already written
+FRAGMENTED_MP4_FLAGS = 'frag_keyframe+empty_moov+default_base_moof'
+
+
+def new_video_filename():
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"instagram_video_{timestamp}.mp4"
+
+
 class VideoCreator:
     def __init__(self):
         pass
@@ -14,6 +38,9 @@ class VideoCreator:
     def create_video_with_pil_text(self, quote_text, author_text, music_file):
         logging.info("Starting video creation with random effects...")
         try:
+            _configure_moviepy()
+            from moviepy.editor import ColorClip, AudioFileClip, CompositeVideoClip
+            
             background = ColorClip(
                 size=(VIDEO_WIDTH, VIDEO_HEIGHT),
                 color=BACKGROUND_COLOR,
@@ -56,30 +83,40 @@ class VideoCreator:
             logging.error(f"Error creating video with random effects: {e}")
             return None
 
-    def create_video_with_pil_text_and_blur_keyframe(self, quote_text, author_text, music_file, effect):
+    def create_video_with_pil_text_and_blur_keyframe(self, quote_text, author_text, music_file, effect,
+                                                     filename=None, fragmented=False):
         """
         Create a video where the quote is strongly blurred at the start and animates to clear.
         The first frame (keyframe) is the blurred quote.
+        With fragmented=True the MP4 is written as self-contained fragments in file order,
+        so its finished bytes can be uploaded while encoding is still running.
         """
         logging.info(f"Starting video creation with blur keyframe and effect: {effect}...")
         try:
+            _configure_moviepy()
+            from moviepy.editor import ColorClip, AudioFileClip, CompositeVideoClip
+            from text_layout import get_layout_cache
+            
             background = ColorClip(
                 size=(VIDEO_WIDTH, VIDEO_HEIGHT),
                 color=BACKGROUND_COLOR,
                 duration=VIDEO_DURATION_SECONDS
             )
             # 1. Main effect (entire video, no separate keyframe)
+            quote_font_size = get_layout_cache().get_quote_font_size(quote_text)
             quote_clip = self.create_text_with_effect(
-                quote_text, QUOTE_FONT_SIZE, QUOTE_COLOR, 'center', VIDEO_WIDTH - 300, 0, effect, duration=VIDEO_DURATION_SECONDS)
+                quote_text, quote_font_size, QUOTE_COLOR, 'center', VIDEO_WIDTH - 300, 0, effect, duration=VIDEO_DURATION_SECONDS)
             author_clip = self.create_text_with_effect(
-                f"- {author_text}", AUTHOR_FONT_SIZE, AUTHOR_COLOR, (0, int(VIDEO_HEIGHT * 0.75)), VIDEO_WIDTH - 200, TEXT_STAGGER_DELAY, effect, duration=VIDEO_DURATION_SECONDS)
+                f"- {author_text}", AUTHOR_FONT_SIZE, AUTHOR_COLOR, (0, int(VIDEO_HEIGHT * AUTHOR_POSITION_Y)), VIDEO_WIDTH - 200, TEXT_STAGGER_DELAY, effect, duration=VIDEO_DURATION_SECONDS)
+            get_layout_cache().save()
             audio = AudioFileClip(music_file).set_duration(VIDEO_DURATION_SECONDS)
             final_video = CompositeVideoClip([background, quote_clip, author_clip])
             final_video.audio = audio
             final_video.fps = VIDEO_FPS
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"instagram_video_{timestamp}.mp4"
-            final_video.write_videofile(filename, codec='libx264', audio_codec='aac')
+            if filename is None:
+                filename = new_video_filename()
+            ffmpeg_params = ['-movflags', FRAGMENTED_MP4_FLAGS] if fragmented else None
+            final_video.write_videofile(filename, codec='libx264', audio_codec='aac', ffmpeg_params=ffmpeg_params)
             final_video.close()
             audio.close()
             logging.info(f"Video with blur keyframe and effect created: {filename}")
@@ -130,62 +167,24 @@ class VideoCreator:
 
     def create_text_image(self, text, font_size, color, position='center', max_width=None):
         try:
+            from PIL import Image, ImageDraw
+            import numpy as np
+            from moviepy.editor import ImageClip
+            from text_layout import get_layout_cache, load_font
+            
             img = Image.new('RGBA', (VIDEO_WIDTH, VIDEO_HEIGHT), (0, 0, 0, 0))
             draw = ImageDraw.Draw(img)
-            font = None
-            font_paths = [
-                "fonts/HelveticaNeue-UltraLight.ttf"  # Only use Helvetica Neue Ultra Light
-            ]
-            for font_path in font_paths:
-                try:
-                    font = ImageFont.truetype(font_path, font_size)
-                    logging.info(f"Using font: {font_path}")
-                    break
-                except:
-                    continue
-            if font is None:
-                font = ImageFont.load_default()
-                logging.warning("Using default font")
             if max_width is None:
                 max_width = VIDEO_WIDTH - 200
-            def wrap_text(text, font, max_width):
-                words = text.split()
-                lines = []
-                current_line = []
-                for word in words:
-                    test_line = ' '.join(current_line + [word])
-                    bbox = draw.textbbox((0, 0), test_line, font=font)
-                    text_width = bbox[2] - bbox[0]
-                    if text_width <= max_width:
-                        current_line.append(word)
-                    else:
-                        if current_line:
-                            lines.append(' '.join(current_line))
-                            current_line = [word]
-                        else:
-                            lines.append(word)
-                if current_line:
-                    lines.append(' '.join(current_line))
-                return lines
-            wrapped_lines = wrap_text(text, font, max_width)
+            # Wrapping and placement come from the layout cache (filled at quote ingestion)
+            layout = get_layout_cache().get_layout(text, font_size, max_width, position, VIDEO_WIDTH, VIDEO_HEIGHT)
+            font = load_font(font_size)
+            wrapped_lines = layout['lines']
             logging.info(f"Text wrapped into {len(wrapped_lines)} lines: {wrapped_lines}")
-            line_height = font_size + 15
-            total_height = len(wrapped_lines) * line_height
-            if position == 'center':
-                x = (VIDEO_WIDTH - max_width) // 2
-                y = (VIDEO_HEIGHT - total_height) // 2
-                y = max(50, min(y, VIDEO_HEIGHT - total_height - 50))
-            else:
-                x, y = position
             # Draw each line with a much thicker black outline for boldness
             outline_width = max(4, font_size // 8)  # Increased thickness
             outline_color = 'black'
-            for i, line in enumerate(wrapped_lines):
-                line_y = y + (i * line_height)
-                bbox = draw.textbbox((0, 0), line, font=font)
-                line_width = bbox[2] - bbox[0]
-                line_x = (VIDEO_WIDTH - line_width) // 2
-                line_x = max(50, min(line_x, VIDEO_WIDTH - line_width - 50))
+            for line, (line_x, line_y) in zip(wrapped_lines, layout['positions']):
                 # Draw outline
                 for ox in range(-outline_width, outline_width+1):
                     for oy in range(-outline_width, outline_width+1):
@@ -212,6 +211,9 @@ class VideoCreator:
 
     def apply_blur_effect(self, base_clip, delay=0):
         try:
+            from PIL import Image, ImageFilter
+            import numpy as np
+            
             # More intense: start with strong blur, animate to clear
             duration = base_clip.duration
             def blur_dynamic(get_frame, t):
@@ -234,6 +236,9 @@ class VideoCreator:
 
     def apply_diamond_blur_effect(self, base_clip, delay=0):
         try:
+            from PIL import Image, ImageFilter
+            import numpy as np
+            
             # More intense: start with more/larger blurred layers, animate to clear
             duration = base_clip.duration
             def diamond_blur_dynamic(get_frame, t):
@@ -259,6 +264,10 @@ class VideoCreator:
 
     def pil_blur_imageclip(self, image_clip, blur_radius):
         # Convert ImageClip to PIL Image, apply GaussianBlur, return new ImageClip
+        from PIL import Image, ImageFilter
+        import numpy as np
+        from moviepy.editor import ImageClip
+        
         img = image_clip.get_frame(0)
         pil_img = Image.fromarray(img)
         blurred = pil_img.filter(ImageFilter.GaussianBlur(radius=blur_radius))